@@ -0,0 +1,196 @@
+# alert.py - table-driven dish alert state machine for the sensor node
+#
+# Both ultrasonic sensors blocked raises an alert with grace_period_ms of
+# intermittent (GRACE) beeping, then CONSTANT buzzing. Scanning a card
+# during an alert silences the buzzer for scan_grace_ms; the alert is
+# resolved once the sink is clear and soap was used after the scan.
+#
+# AlertFSM is pure: step() only updates its own slots and returns a bitmask
+# of ACT_* flags, it never sends, logs or allocates. The main loop (or the
+# replay driver) turns the flags into notifier messages and log lines using
+# fsm.status, fsm.beep, fsm.reason and fsm.cleaner.
+
+GRACE_PERIOD_MS = 15000
+SCAN_GRACE_MS = 30000
+SCAN_TIMEOUT_MS = 60000
+
+# status (LED colour) and beep modes
+GREEN = 0
+YELLOW = 1
+RED = 2
+OFF = 0
+GRACE = 1
+CONSTANT = 2
+KEEP = -1
+
+STATUS_NAMES = ("GREEN", "YELLOW", "RED")
+BEEP_NAMES = ("OFF", "GRACE", "CONSTANT")
+BEEP_MODES = (None, "GRACE", "CONSTANT")
+
+# phases
+P_IDLE = 0
+P_ALERT = 1
+P_SCANNED = 2
+
+# step() result flags
+ACT_STATUS = 1      # fsm.status changed
+ACT_BEEP = 2        # fsm.beep changed
+ACT_CLEAN = 4       # alert resolved by fsm.cleaner
+ACT_RAISED = 8      # a new alert started
+ACT_SCANNED = 16    # the scan counted towards the alert
+ACT_SOAP = 32       # soap use latched for the alert
+
+# why the last beep change happened; from R_WARN on they are warnings
+R_NONE = 0
+R_SCAN = 1
+R_GRACE = 2
+R_MOVED = 3
+R_RAISED = 4
+R_GRACE_EXPIRED = 5
+R_SCAN_GRACE_OVER = 6
+R_SCAN_TIMEOUT = 7
+R_WARN = R_RAISED
+
+REASONS = (
+    "",
+    "   Buzzer stopped by scan",
+    "Grace period: 15s intermittent beeping",
+    "Dishes moved during grace - TIMER RESET",
+    "RED ALERT! Both sensors detecting.",
+    "Grace expired - CONSTANT buzzing",
+    "RED after 30s grace - CONSTANT buzzing",
+    "1 min passed - not green, CONSTANT buzzing",
+)
+
+# table flags
+F_RAISE = 1         # start an alert now
+F_RESTART = 2       # restart the grace timer
+F_CLEAN = 4         # resolve if soap was used
+
+# Transition table. Rows are phase/timer combinations (see _row()),
+# columns the status this pass, entries (beep target, flags, reason).
+_ = (KEEP, 0, R_NONE)
+TABLE = (
+    #  GREEN                           YELLOW                          RED
+    # idle
+    (_,                                _,                              (GRACE, F_RAISE, R_RAISED)),
+    # alert, within grace_period_ms
+    ((OFF, F_RESTART, R_MOVED),        (OFF, F_RESTART, R_MOVED),      (GRACE, 0, R_GRACE)),
+    # alert, grace expired or already CONSTANT
+    ((CONSTANT, 0, R_GRACE_EXPIRED),   (CONSTANT, 0, R_GRACE_EXPIRED), (CONSTANT, 0, R_GRACE_EXPIRED)),
+    # scanned, within scan_grace_ms
+    ((OFF, F_CLEAN, R_NONE),           (OFF, 0, R_NONE),               (OFF, 0, R_NONE)),
+    # scanned, before scan_timeout_ms: only both sensors blocked escalates
+    ((KEEP, F_CLEAN, R_NONE),          _,                              (CONSTANT, 0, R_SCAN_GRACE_OVER)),
+    # scanned, timed out: anything but GREEN escalates
+    ((KEEP, F_CLEAN, R_NONE),          (CONSTANT, 0, R_SCAN_TIMEOUT),  (CONSTANT, 0, R_SCAN_TIMEOUT)),
+)
+del _
+
+# ticks_ms() arithmetic, inlined so the FSM needs no time module
+_TICKS_MAX = (1 << 30) - 1
+_TICKS_HALF = 1 << 29
+
+
+class AlertFSM:
+    __slots__ = ("phase", "status", "beep", "reason", "start", "scan_time",
+                 "scanned_by", "soap_used", "cleaner",
+                 "grace_period_ms", "scan_grace_ms", "scan_timeout_ms")
+
+    def __init__(self):
+        self.status = GREEN
+        self.reason = R_NONE
+        self.cleaner = None
+        self.start = 0
+        self.grace_period_ms = GRACE_PERIOD_MS
+        self.scan_grace_ms = SCAN_GRACE_MS
+        self.scan_timeout_ms = SCAN_TIMEOUT_MS
+        self.reset()
+
+    def reset(self):
+        """Drop any alert in progress (the LED status is kept)"""
+        self.phase = P_IDLE
+        self.beep = OFF
+        self.scan_time = 0
+        self.scanned_by = None
+        self.soap_used = False
+
+    def tracking(self):
+        """True while soap use counts towards the alert"""
+        return self.phase == P_SCANNED
+
+    def _row(self, now):
+        phase = self.phase
+        if phase == P_IDLE:
+            return 0
+        if phase == P_ALERT:
+            since = ((now - self.start + _TICKS_HALF) & _TICKS_MAX) - _TICKS_HALF
+            if since < self.grace_period_ms and self.beep != CONSTANT:
+                return 1
+            return 2
+        since = ((now - self.scan_time + _TICKS_HALF) & _TICKS_MAX) - _TICKS_HALF
+        if since < self.scan_grace_ms:
+            return 3
+        if since < self.scan_timeout_ms:
+            return 4
+        return 5
+
+    def step(self, now, near1, near2, scan, soap_used):
+        """Advance one loop pass; returns ACT_* flags
+
+        now is ticks_ms(), near1/near2 the ultrasonic results, scan the name
+        of a known card read this pass (or None) and soap_used whether the
+        soap tracker reported use this pass.
+        """
+        acts = 0
+        self.reason = R_NONE
+
+        if scan is not None and self.phase != P_IDLE:
+            self.phase = P_SCANNED
+            self.scanned_by = scan
+            self.scan_time = now
+            acts |= ACT_SCANNED
+            if self.beep != OFF:
+                self.beep = OFF
+                self.reason = R_SCAN
+                acts |= ACT_BEEP
+
+        if soap_used and self.phase == P_SCANNED and not self.soap_used:
+            self.soap_used = True
+            acts |= ACT_SOAP
+
+        if near1 and near2:
+            status = RED
+        elif near1 or near2:
+            status = YELLOW
+        else:
+            status = GREEN
+        if self.phase != P_IDLE and self.beep == CONSTANT:
+            status = RED
+
+        beep, flags, reason = TABLE[self._row(now)][status]
+
+        if flags & F_CLEAN and self.soap_used:
+            self.cleaner = self.scanned_by
+            self.reset()
+            acts |= ACT_CLEAN
+        else:
+            if flags & F_RAISE:
+                self.phase = P_ALERT
+                self.start = now
+                self.scanned_by = None
+                self.soap_used = False
+                self.scan_time = 0
+                acts |= ACT_RAISED
+            elif flags & F_RESTART:
+                self.start = now
+            if beep != KEEP and beep != self.beep:
+                self.beep = beep
+                self.reason = reason
+                acts |= ACT_BEEP
+
+        if status != self.status:
+            self.status = status
+            acts |= ACT_STATUS
+        return acts
+
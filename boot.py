@@ -1,41 +1,18 @@
-import esp
-import network
-import time
-import ntptime
-import machine
+# boot.py - runs before main.py on both boards
+#
+# Wi-Fi connects in the background (wifi.py): this only switches the radio
+# on and starts the first attempt, so main.py starts ESP-NOW and the
+# sensors right away and polls the connection from its loop.
 
-print('running boot')
-
-wlan = network.WLAN(network.STA_IF)
-wlan.active(True)
-
-password = '1YM-)0xR'
+import wifi
 
-if wlan.isconnected():
-    print('connected')
-    wlan.disconnect()
-    time.sleep(1)
-    print('disconnected')
-    
-if not wlan.isconnected():
-    print('connecting to network...')
-    wlan.connect('Berkeley-IoT', password)
-    time.sleep(2)
-
-    tries = 0
-    while not wlan.isconnected() and tries < 30:
-        print('...')
-        wlan.connect('Berkeley-IoT', password)
-
-        time.sleep(2)
-        tries = tries + 1
-    print('network config:', wlan.ifconfig())
-    
-    
-    if wlan.isconnected():
-        print("WiFi connected at", wlan.ifconfig()[0])
-    else:
-        print("Mission failed")
- 
-        
+print('running boot')
 
+sta = wifi.start()
+ip = sta.cached_ip()
+if sta.is_up():
+    print('WiFi connected at', sta.ip)
+elif ip:
+    print('connecting to network in the background, last IP', ip)
+else:
+    print('connecting to network in the background...')
@@ -0,0 +1,106 @@
+# budget.py - per-pass time budget with stage priorities
+#
+# The main loop asks admit(stage) before each stage it may drop. CRITICAL
+# stages (the RFID reader, the ultrasonics) always run. NORMAL stages (the
+# weight read) run unless the pass is already over budget. DEFERRABLE
+# stages (HTTP, flash writes, log output) run only while their expected
+# cost still fits what is left of the budget; otherwise they are shed and
+# asked again in the next pass, after that pass's critical work. A stage
+# that has waited max_wait_ms runs regardless, so a long busy spell cannot
+# starve the dashboard or hold a save back indefinitely.
+#
+# The expected cost of a stage is a decaying peak of its measured runs
+# (down 1/8 of the gap per run), so one slow flash write keeps the next
+# save out of crowded passes for a while. All counters live in
+# preallocated arrays; admit() and spent() allocate nothing.
+
+import time
+from array import array
+
+CRITICAL = 0
+NORMAL = 1
+DEFERRABLE = 2
+
+PRIORITY_NAMES = ("critical", "normal", "deferrable")
+
+
+class LoopBudget:
+    def __init__(self, budget_us, stages):
+        """stages: one (name, priority, max_wait_ms) per stage index"""
+        n = len(stages)
+        self.budget_us = budget_us
+        self.names = tuple(s[0] for s in stages)
+        self.prio = bytes(s[1] for s in stages)
+        self.max_wait = array("i", [s[2] for s in stages])
+        self.cost = array("i", [0] * n)     # expected cost, us
+        self.since = array("i", [0] * n)    # ticks_ms when first shed
+        self.waiting = bytearray(n)
+        self.shed = array("I", [0] * n)     # times admit() said no
+        self.forced = array("I", [0] * n)   # admitted over budget after max_wait
+        self.t0 = time.ticks_us()
+        self.passes = 0
+        self.overruns = 0
+        self.worst_us = 0
+
+    def begin(self):
+        self.t0 = time.ticks_us()
+
+    def used_us(self):
+        return time.ticks_diff(time.ticks_us(), self.t0)
+
+    def deadline(self):
+        """ticks_us value at which this pass is out of budget"""
+        return time.ticks_add(self.t0, self.budget_us)
+
+    def admit(self, stage):
+        """True if stage should run now; counts it as shed otherwise"""
+        p = self.prio[stage]
+        if p == CRITICAL:
+            return True
+        used = self.used_us()
+        if p == NORMAL:
+            fits = used < self.budget_us
+        else:
+            fits = used + self.cost[stage] <= self.budget_us
+        if not fits and self.waiting[stage]:
+            if time.ticks_diff(time.ticks_ms(), self.since[stage]) >= self.max_wait[stage]:
+                self.forced[stage] += 1
+                fits = True
+        if fits:
+            self.waiting[stage] = 0
+            return True
+        if not self.waiting[stage]:
+            self.waiting[stage] = 1
+            self.since[stage] = time.ticks_ms()
+        self.shed[stage] += 1
+        return False
+
+    def spent(self, stage, t0):
+        """Record the cost of a stage that started at t0 (ticks_us)"""
+        us = time.ticks_diff(time.ticks_us(), t0)
+        c = self.cost[stage]
+        self.cost[stage] = us if us > c else c - ((c - us) >> 3)
+
+    def done(self):
+        """End of the pass; True if it overran the budget"""
+        us = self.used_us()
+        self.passes += 1
+        if us <= self.budget_us:
+            return False
+        self.overruns += 1
+        if us - self.budget_us > self.worst_us:
+            self.worst_us = us - self.budget_us
+        return True
+
+    def as_dict(self):
+        return {
+            "budget_us": self.budget_us,
+            "passes": self.passes,
+            "overruns": self.overruns,
+            "worst_overrun_us": self.worst_us,
+            "stages": {self.names[i]: {"priority": PRIORITY_NAMES[self.prio[i]],
+                                       "cost_us": self.cost[i],
+                                       "shed": self.shed[i],
+                                       "forced": self.forced[i]}
+                       for i in range(len(self.names))},
+        }
@@ -0,0 +1,168 @@
+# calib.py - persisted load cell calibration and background re-tare
+#
+# The HX711 offset (raw counts at an empty scale) and scale (counts per
+# gram) live in calib.json, so a reboot can weigh on its first read instead
+# of sleeping and taring, which was also wrong whenever the soap bottle
+# was already on the scale at power-up.
+#
+# ZeroTracker re-tares in the background. An empty scale is the lowest
+# stable level the cell can show, so a level that stays below zero means
+# the offset was taken with something on the scale; it is corrected after
+# NEG_STABLE_N passes. A small stable level near zero while the bottle is
+# off is drift and is zeroed at most every RETARE_MIN_MS. Anything heavier
+# than ZERO_BAND_MG (a sponge left on the scale) is never tared away.
+# tared_at, retares, last_shift_g and temp are notes for judging drift over
+# time.
+#
+# Weights are small ints in milligrams from the HX711 counts onwards, so a
+# loop pass allocates no floats (each one is a heap object on the ESP32).
+# The scale is kept as a float in the file and turned into two Q-format
+# multipliers when loaded; mul_q() applies them without leaving the small
+# int range.
+
+import time
+import ringlog as log
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+CALIB_FILE = "calib.json"
+DEFAULT_SCALE = 1143.3771
+
+STABLE_N = 10           # passes the level must hold (~7 s)
+NEG_STABLE_N = 4        # a negative level cannot be real, act sooner
+STABLE_TOL_MG = 1000    # spread allowed while holding
+ZERO_BAND_MG = 5000     # drift that may be zeroed while the bottle is off
+MIN_SHIFT_MG = 300      # not worth a flash write below this
+RETARE_MIN_MS = 600000  # drift re-tares at most every 10 min
+
+MG_Q = 18               # counts -> mg multiplier, Q18
+COUNTS_Q = 17           # mg -> counts multiplier, Q17
+
+
+def mul_q(x, m, q):
+    """x * m >> q, split so no product leaves the small int range
+
+    Good for |x| < 2**23 and m < 2**18; the result is at most 2 below the
+    exact floor.
+    """
+    return ((x >> 12) * m >> (q - 12)) + ((x & 0xFFF) * m >> q)
+
+
+def div_round(a, n):
+    """a / n rounded to the nearest int (halves up), for ints"""
+    return (a + (n >> 1)) // n
+
+
+def _temperature():
+    # the original ESP32 has an on-die sensor (deg F, uncalibrated); the
+    # value is only kept as a note next to each tare
+    try:
+        import esp32
+        return esp32.raw_temperature()
+    except (ImportError, AttributeError):
+        return None
+
+
+class Calibration:
+    def __init__(self, offset=0, scale=DEFAULT_SCALE):
+        self.offset = int(offset)
+        self.scale = scale              # counts per gram, as calibrated
+        self.mg_m = int(1000 / scale * (1 << MG_Q) + 0.5)
+        self.counts_m = int(scale / 1000 * (1 << COUNTS_Q) + 0.5)
+        self.tared_at = 0
+        self.retares = 0
+        self.last_shift_g = 0.0
+        self.temp = None
+
+    @classmethod
+    def load(cls, path=CALIB_FILE):
+        """Calibration from flash, or None if there is none yet"""
+        try:
+            with open(path, "r") as f:
+                d = json.load(f)
+        except (OSError, ValueError):
+            return None
+        c = cls(d.get("offset", 0), d.get("scale", DEFAULT_SCALE))
+        c.tared_at = d.get("tared_at", 0)
+        c.retares = d.get("retares", 0)
+        c.last_shift_g = d.get("last_shift_g", 0.0)
+        c.temp = d.get("temp")
+        return c
+
+    def save(self, path=CALIB_FILE):
+        try:
+            with open(path, "w") as f:
+                json.dump(self.as_dict(), f)
+        except OSError as e:
+            log.error("Error saving calibration: %s", e)
+
+    def as_dict(self):
+        return {
+            "offset": self.offset,
+            "scale": self.scale,
+            "tared_at": self.tared_at,
+            "retares": self.retares,
+            "last_shift_g": self.last_shift_g,
+            "temp": self.temp,
+        }
+
+    def to_mg(self, counts):
+        """Net HX711 counts -> milligrams (int)"""
+        return mul_q(counts, self.mg_m, MG_Q)
+
+    def to_counts(self, mg):
+        return mul_q(mg, self.counts_m, COUNTS_Q)
+
+    def retare(self, shift_mg):
+        """Move the zero by shift_mg (the empty scale read shift_mg)"""
+        self.offset += self.to_counts(shift_mg)
+        self.last_shift_g = shift_mg / 1000
+        self.retares += 1
+        self.tared_at = time.time()
+        self.temp = _temperature()
+
+
+class ZeroTracker:
+    def __init__(self, cal):
+        self.cal = cal
+        self.run_mean = 0
+        self.run_n = 0
+        self.last_ms = None
+
+    def update(self, w, bottle_off, now):
+        """Feed one reading (mg); returns the zero shift in mg to apply, or 0
+
+        bottle_off is True when the soap detector sees no bottle on the
+        scale. The caller applies a non-zero result to the HX711 offset,
+        the soap detector and the saved calibration.
+        """
+        if self.run_n and -STABLE_TOL_MG <= w - self.run_mean <= STABLE_TOL_MG:
+            self.run_n += 1
+            self.run_mean += div_round(w - self.run_mean, self.run_n)
+        else:
+            self.run_mean = w
+            self.run_n = 1
+        level = self.run_mean
+        if level < -ZERO_BAND_MG:
+            if self.run_n < NEG_STABLE_N:
+                return 0
+            shift = level
+        elif self.run_n < STABLE_N:
+            return 0
+        elif bottle_off and -ZERO_BAND_MG <= level <= ZERO_BAND_MG:
+            if -MIN_SHIFT_MG < level < MIN_SHIFT_MG:
+                return 0
+            if (self.last_ms is not None
+                    and time.ticks_diff(now, self.last_ms) < RETARE_MIN_MS):
+                return 0
+            shift = level
+        else:
+            return 0
+
+        self.cal.retare(shift)
+        self.last_ms = now
+        self.run_n = 0
+        return shift
@@ -0,0 +1,209 @@
+# components.py - lazily started subsystems with dependencies
+#
+# Each subsystem (radio, display, load cell, ...) registers an init function
+# and the names of the components it needs. Nothing starts at import time:
+# a component is started the first time something asks for it, after its
+# dependencies, and components that do not depend on each other start
+# concurrently under uasyncio. An init that awaits (a settle delay, a
+# sensor's first conversion) lets the others run meanwhile; a plain
+# function just runs to completion.
+#
+# A failing or timed-out component is recorded and does not stop the rest;
+# only the components that depend on it fail with it. report() gives the
+# start and end time of every component (ticks_ms() since reset) and
+# critical_path() the chain of dependencies that decided when boot finished.
+
+import time
+import ringlog as log
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+# component states
+C_IDLE = 0
+C_STARTING = 1
+C_UP = 2
+C_FAILED = 3
+
+STATE_NAMES = ("IDLE", "STARTING", "UP", "FAILED")
+
+
+async def _probe():
+    pass
+
+# what calling an async function returns (a generator on MicroPython)
+_p = _probe()
+COROUTINE = type(_p)
+_p.close()
+del _p
+
+
+class Component:
+    __slots__ = ("name", "init", "deps", "timeout_ms", "state", "value",
+                 "error", "t_request", "t_start", "t_end", "task")
+
+    def __init__(self, name, init, deps, timeout_ms):
+        self.name = name
+        self.init = init
+        self.deps = deps
+        self.timeout_ms = timeout_ms
+        self.state = C_IDLE
+        self.value = None
+        self.error = None
+        self.t_request = None   # first asked for
+        self.t_start = None     # dependencies up, init called
+        self.t_end = None
+        self.task = None
+
+
+class Components:
+    def __init__(self):
+        self.items = {}
+        self.order = []
+        self.t_boot = None
+
+    def add(self, name, init, deps=(), timeout_ms=None):
+        """Register init(*dependency values) under name
+
+        init may be a plain or an async function; what it returns is the
+        component's value. timeout_ms bounds an async init.
+        """
+        for d in deps:
+            if d not in self.items:
+                raise ValueError("component %s needs unknown %s" % (name, d))
+        self.items[name] = Component(name, init, tuple(deps), timeout_ms)
+        self.order.append(name)
+
+    def _task(self, name):
+        c = self.items[name]
+        if c.task is None:
+            c.t_request = time.ticks_ms()
+            c.state = C_STARTING
+            c.task = asyncio.create_task(self._start(c))
+        return c.task
+
+    async def _start(self, c):
+        # start every dependency before waiting on any of them
+        tasks = [self._task(d) for d in c.deps]
+        try:
+            args = []
+            for d, t in zip(c.deps, tasks):
+                await t
+                dep = self.items[d]
+                if dep.state != C_UP:
+                    raise RuntimeError("needs %s" % d)
+                args.append(dep.value)
+            c.t_start = time.ticks_ms()
+            r = c.init(*args)
+            if isinstance(r, COROUTINE):
+                # an async init: run it, bounded by the timeout if any
+                if c.timeout_ms:
+                    r = await asyncio.wait_for_ms(r, c.timeout_ms)
+                else:
+                    r = await r
+            c.value = r
+            c.state = C_UP
+        except Exception as e:
+            c.error = e if not isinstance(e, asyncio.TimeoutError) else "timeout"
+            c.state = C_FAILED
+            log.error("Component %s failed: %s", c.name, c.error)
+        c.t_end = time.ticks_ms()
+
+    async def get(self, name):
+        """Value of component name, starting it (and what it needs) if idle"""
+        await self._task(name)
+        c = self.items[name]
+        if c.state != C_UP:
+            raise RuntimeError("component %s: %s" % (name, c.error))
+        return c.value
+
+    async def start(self, *names):
+        """Start the named components (all if none) concurrently"""
+        tasks = [self._task(n) for n in (names or self.order)]
+        for t in tasks:
+            await t
+
+    def boot(self, *names):
+        """Blocking start() for the top level of a program; logs the report"""
+        if self.t_boot is None:
+            self.t_boot = time.ticks_ms()
+        asyncio.run(self.start(*names))
+        self.log_report()
+        return self.failed()
+
+    def up(self, name):
+        return self.items[name].state == C_UP
+
+    def failed(self):
+        return [n for n in self.order if self.items[n].state == C_FAILED]
+
+    def report(self):
+        """One dict per component that was asked for, in registration order"""
+        out = []
+        for n in self.order:
+            c = self.items[n]
+            if c.t_request is None:
+                continue
+            out.append({
+                "name": n,
+                "state": STATE_NAMES[c.state],
+                "deps": list(c.deps),
+                "requested_ms": c.t_request,
+                "start_ms": c.t_start,
+                "end_ms": c.t_end,
+                "ms": (time.ticks_diff(c.t_end, c.t_start)
+                       if c.t_start is not None and c.t_end is not None else None),
+                "error": None if c.error is None else str(c.error),
+            })
+        return out
+
+    def critical_path(self):
+        """Names from the first to the last component to finish, each one
+        the dependency that held up the next"""
+        last = None
+        for n in self.order:
+            c = self.items[n]
+            if c.t_end is not None and (last is None or
+                                        time.ticks_diff(c.t_end, last.t_end) > 0):
+                last = c
+        path = []
+        while last is not None:
+            path.append(last.name)
+            nxt = None
+            for d in last.deps:
+                dep = self.items[d]
+                if dep.t_end is not None and (nxt is None or
+                                              time.ticks_diff(dep.t_end, nxt.t_end) > 0):
+                    nxt = dep
+            last = nxt
+        path.reverse()
+        return path
+
+    def total_ms(self):
+        """Boot start to the last component finishing"""
+        end = None
+        for c in self.items.values():
+            if c.t_end is not None and (end is None or time.ticks_diff(c.t_end, end) > 0):
+                end = c.t_end
+        if end is None or self.t_boot is None:
+            return 0
+        return time.ticks_diff(end, self.t_boot)
+
+    def log_report(self):
+        # per-component lines only at DEBUG: the boot log is flushed to the
+        # UART right before the main loop, every line there delays it
+        for r in self.report():
+            log.debug("boot: %-10s %-6s %5s ms (at %s ms)%s", r["name"], r["state"],
+                     r["ms"] if r["ms"] is not None else "-", r["start_ms"],
+                     " " + r["error"] if r["error"] else "")
+        log.info("boot: %d ms, critical path %s", self.total_ms(),
+                 " > ".join(self.critical_path()))
+
+    def as_dict(self):
+        return {
+            "components": self.report(),
+            "total_ms": self.total_ms(),
+            "critical_path": self.critical_path(),
+        }
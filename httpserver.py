@@ -0,0 +1,279 @@
+# httpserver.py - small non-blocking HTTP router with Server-Sent Events
+#
+# One HTTPServer.poll() call per main-loop pass services every socket that is
+# ready (new connections, partial requests, SSE hang-ups) and never waits on a
+# slow client, so the sensor loop keeps its cadence with several dashboards
+# connected. Given a deadline, poll() keeps going round the sockets until
+# nothing is ready or the deadline has passed, so a burst of requests is
+# answered in one pass. A response gets WRITE_TIMEOUT_MS for all of its
+# writes together, plus WRITE_MS_PER_KB for every KB the client has taken
+# so far: lwIP only buffers ~5.7 KB, so a big response (/metrics is
+# ~7.5 KB) has to wait a round trip for ACKs even to a healthy client. A
+# client that cannot keep up with that is cut off.
+
+import socket, time, uselect
+import ringlog as log
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from httpwriter import ResponseWriter
+
+JSON_HEADERS = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: application/json\r\n"
+    b"Transfer-Encoding: chunked\r\n"
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"Connection: close\r\n\r\n"
+)
+
+TEXT_HEADERS = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+    b"Transfer-Encoding: chunked\r\n"
+    b"Connection: close\r\n\r\n"
+)
+
+SSE_HEADERS = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/event-stream\r\n"
+    b"Cache-Control: no-cache\r\n"
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"Connection: keep-alive\r\n\r\n"
+)
+
+NOT_FOUND = (
+    b"HTTP/1.1 404 Not Found\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"Content-Length: 10\r\n"
+    b"Connection: close\r\n\r\n"
+    b"not found\n"
+)
+
+BAD_REQUEST = (
+    b"HTTP/1.1 400 Bad Request\r\n"
+    b"Content-Length: 0\r\n"
+    b"Connection: close\r\n\r\n"
+)
+
+BUSY = (
+    b"HTTP/1.1 503 Service Unavailable\r\n"
+    b"Content-Length: 0\r\n"
+    b"Connection: close\r\n\r\n"
+)
+
+SSE_PING = b":\n\n"
+
+MAX_PENDING = 6           # connections still sending their request
+MAX_SSE = 10              # open /events streams
+REQ_MAX = 1024            # request head bytes we are willing to buffer
+REQ_TIMEOUT_MS = 3000     # drop clients that never finish their request
+SSE_PING_MS = 15000       # comment line so dead streams get noticed
+WRITE_TIMEOUT_MS = 20     # cap on all the writes of one response,
+WRITE_MS_PER_KB = 10      # raised by this per KB sent (~100 KB/s floor)
+
+
+def parse_query(qs):
+    """'a=1&b=2' -> {'a': '1', 'b': '2'} (no percent-decoding)"""
+    out = {}
+    if qs:
+        for part in qs.split("&"):
+            k, _, v = part.partition("=")
+            if k:
+                out[k] = v
+    return out
+
+
+def send_json(w, obj):
+    w.start(JSON_HEADERS)
+    w.write(json.dumps(obj))
+    w.finish()
+
+
+class _Deadline:
+    """A client socket whose writes share one deadline, pushed back as the
+    client takes data"""
+
+    def __init__(self, cl, ms):
+        self.cl = cl
+        self.until = time.ticks_add(time.ticks_ms(), ms)
+        self.sent = 0
+
+    def sendall(self, data):
+        left = time.ticks_diff(self.until, time.ticks_ms())
+        if left <= 0:
+            raise OSError(110)      # ETIMEDOUT
+        self.cl.settimeout(left / 1000)
+        self.cl.sendall(data)
+        # whole KBs only, so small writes do not round up to a longer wait
+        kb = (self.sent + len(data)) // 1024 - self.sent // 1024
+        self.sent += len(data)
+        if kb:
+            self.until = time.ticks_add(self.until, kb * WRITE_MS_PER_KB)
+
+
+class HTTPServer:
+    def __init__(self, port=80, buf_size=512, events_path="/events"):
+        addr = socket.getaddrinfo("0.0.0.0", port)[0][-1]
+        s = socket.socket()
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind(addr)
+        s.listen(MAX_PENDING)
+        s.setblocking(False)
+        self.sock = s
+        self.poller = uselect.poll()
+        self.poller.register(s, uselect.POLLIN)
+        self.buf = bytearray(buf_size)
+        self.routes = {}
+        self.events_path = events_path
+        self.sse_hello = None
+        self.pending = {}
+        self.sse = []
+        self.last_ping = time.ticks_ms()
+
+    def route(self, path, handler):
+        """handler(w, query) writes the whole response through w"""
+        self.routes[path] = handler
+
+    # Socket plumbing
+    def poll(self, until=None):
+        """Service ready sockets; with until (a ticks_us deadline) go on
+        until nothing is ready or it has passed, the sockets left stay
+        ready for the next call"""
+        while self._service(until):
+            if until is None or time.ticks_diff(time.ticks_us(), until) > 0:
+                break
+
+        now = time.ticks_ms()
+        if self.pending:
+            for cl in list(self.pending):
+                if time.ticks_diff(now, self.pending[cl][1]) > REQ_TIMEOUT_MS:
+                    self._close(cl)
+        if self.sse and time.ticks_diff(now, self.last_ping) > SSE_PING_MS:
+            self.last_ping = now
+            for cl in list(self.sse):
+                self._push(cl, SSE_PING)
+
+    def _service(self, until):
+        """One round over the ready sockets, False if none was ready"""
+        evs = self.poller.poll(0)
+        for ev in evs:
+            obj = ev[0]
+            if obj is self.sock:
+                self._accept()
+            elif obj in self.pending:
+                self._read(obj)
+            else:
+                # an SSE client only becomes readable when it goes away
+                self._drop_sse(obj)
+            if until is not None and time.ticks_diff(time.ticks_us(), until) > 0:
+                break
+        return bool(evs)
+
+    def _accept(self):
+        try:
+            cl, addr = self.sock.accept()
+        except OSError:
+            return
+        if len(self.pending) >= MAX_PENDING:
+            cl.close()
+            return
+        cl.setblocking(False)
+        self.pending[cl] = [b"", time.ticks_ms()]
+        self.poller.register(cl, uselect.POLLIN)
+
+    def _read(self, cl):
+        try:
+            data = cl.recv(512)
+        except OSError:
+            return
+        if not data:
+            self._close(cl)
+            return
+        st = self.pending[cl]
+        st[0] += data
+        if b"\r\n\r\n" in st[0] or len(st[0]) >= REQ_MAX:
+            req = st[0]
+            del self.pending[cl]
+            self._dispatch(cl, req)
+
+    def _close(self, cl):
+        self.pending.pop(cl, None)
+        try:
+            self.poller.unregister(cl)
+        except (OSError, KeyError, ValueError):
+            pass
+        cl.close()
+
+    # Requests
+    def _dispatch(self, cl, req):
+        line = req.split(b"\r\n", 1)[0].split()
+        if len(line) < 2 or line[0] != b"GET":
+            self._reply(cl, BAD_REQUEST)
+            return
+        path, _, qs = line[1].decode("utf-8").partition("?")
+
+        if path == self.events_path:
+            self._open_sse(cl)
+            return
+
+        handler = self.routes.get(path)
+        if handler is None:
+            self._reply(cl, NOT_FOUND)
+            return
+        try:
+            handler(ResponseWriter(_Deadline(cl, WRITE_TIMEOUT_MS), self.buf),
+                    parse_query(qs))
+        except Exception as ex:
+            log.error("HTTP error: %s", ex)
+        self._close(cl)
+
+    def _reply(self, cl, resp):
+        try:
+            _Deadline(cl, WRITE_TIMEOUT_MS).sendall(resp)
+        except OSError:
+            pass
+        self._close(cl)
+
+    # Server-Sent Events
+    def _open_sse(self, cl):
+        if len(self.sse) >= MAX_SSE:
+            self._reply(cl, BUSY)
+            return
+        try:
+            cl.sendall(SSE_HEADERS)
+        except OSError:
+            self._close(cl)
+            return
+        self.sse.append(cl)
+        if self.sse_hello is not None:
+            event, data = self.sse_hello()
+            self._push(cl, self._frame(event, data))
+
+    def _drop_sse(self, cl):
+        if cl in self.sse:
+            self.sse.remove(cl)
+        self._close(cl)
+
+    def _frame(self, event, data):
+        return b"event: %s\ndata: %s\n\n" % (event.encode(), data.encode())
+
+    def _push(self, cl, frame):
+        # a client that cannot take a whole frame right now is too slow
+        # to keep; waiting on it would stall the sensor loop
+        try:
+            if cl.send(frame) == len(frame):
+                return
+        except OSError:
+            pass
+        self._drop_sse(cl)
+
+    def publish(self, event, data):
+        """Push one event (name, JSON text) to every open /events stream"""
+        if not self.sse:
+            return
+        frame = self._frame(event, data)
+        for cl in list(self.sse):
+            self._push(cl, frame)
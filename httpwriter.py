@@ -0,0 +1,87 @@
+# httpwriter.py - streaming HTTP/1.1 response writer for the DishDuty nodes
+#
+# Bodies are sent with Transfer-Encoding: chunked out of one caller-owned
+# bytearray, so a response never needs more RAM than that buffer no matter
+# how long the page is.
+
+_HEX = b"0123456789abcdef"
+
+# chunk-size field is a fixed 4 hex digits + CRLF, leading zeros are legal
+_PRE = 6
+_POST = 2
+
+
+class ResponseWriter:
+    def __init__(self, sock, buf):
+        if len(buf) <= _PRE + _POST or len(buf) > 0xFFFF + _PRE + _POST:
+            raise ValueError("bad buffer size")
+        self.sock = sock
+        self.buf = buf
+        self.mv = memoryview(buf)
+        self.end = len(buf) - _POST
+        self.pos = _PRE
+
+    def start(self, head):
+        """Send the status line and headers (a precompiled bytes constant)"""
+        self.sock.sendall(head)
+        self.pos = _PRE
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        mv = self.mv
+        i = 0
+        n = len(data)
+        while i < n:
+            room = self.end - self.pos
+            if room == 0:
+                self.flush()
+                continue
+            take = n - i
+            if take > room:
+                take = room
+            mv[self.pos:self.pos + take] = data[i:i + take]
+            self.pos += take
+            i += take
+
+    def write_int(self, v):
+        if v < 0:
+            self.write(b"-")
+            v = -v
+        # digits go straight into the buffer, no str() allocation
+        n = 1
+        t = v
+        while t >= 10:
+            t //= 10
+            n += 1
+        if self.end - self.pos < n:
+            self.flush()
+        buf = self.buf
+        p = self.pos + n
+        self.pos = p
+        while True:
+            p -= 1
+            buf[p] = 48 + v % 10
+            v //= 10
+            if v == 0:
+                break
+
+    def flush(self):
+        n = self.pos - _PRE
+        if n == 0:
+            return
+        buf = self.buf
+        buf[0] = _HEX[(n >> 12) & 0xF]
+        buf[1] = _HEX[(n >> 8) & 0xF]
+        buf[2] = _HEX[(n >> 4) & 0xF]
+        buf[3] = _HEX[n & 0xF]
+        buf[4] = 13
+        buf[5] = 10
+        buf[self.pos] = 13
+        buf[self.pos + 1] = 10
+        self.sock.sendall(self.mv[:self.pos + _POST])
+        self.pos = _PRE
+
+    def finish(self):
+        self.flush()
+        self.sock.sendall(b"0\r\n\r\n")
@@ -9,6 +9,7 @@ class HX711:
         self.dout = Pin(dout, Pin.IN)
         self.gain = 0
         self.offset = 0
+        self.idle = None    # called while waiting for a conversion
         self.set_gain(gain)
 
     def set_gain(self, gain):
@@ -25,8 +26,10 @@ class HX711:
         return self.dout.value() == 0
 
     def read(self):
+        idle = self.idle
         while not self.is_ready():
-            pass
+            if idle is not None:
+                idle()
 
         data = 0
         for _ in range(24):
@@ -50,9 +53,17 @@ class HX711:
         for _ in range(times):
             total += self.read()
             time.sleep_ms(10)
-        self.offset = total / times
+        self.offset = total // times
         return self.offset
 
+    def read_net(self, times=5):
+        """Mean of times readings minus the offset, in raw counts (int)"""
+        total = 0
+        for _ in range(times):
+            total += self.read()
+            time.sleep_ms(10)
+        return (total - self.offset * times) // times
+
     def get_units(self, scale=1, times=5):
         total = 0
         for _ in range(times):
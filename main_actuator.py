@@ -1,34 +1,71 @@
 # DishDuty Notifier Unit: OLED + LEDs + Buzzer + ESP-NOW (Receiver)
 from machine import Pin, I2C
 import time
-import network, espnow
+import espnow
+import ringlog as log
 from oled import SSD1306_I2C
 
-# ESP-NOW Setup
-wlan = network.WLAN(network.STA_IF)
-wlan.active(True)
+from components import Components
+from alert import GREEN, YELLOW, RED, OFF, GRACE, CONSTANT, STATUS_NAMES, BEEP_NAMES
+from sinks import SinkTable
 
-e = espnow.ESPNow()
-e.active(True)
+# Startup
+# Each subsystem registers as a component (components.py) and comps.boot()
+# starts them all, independent ones concurrently. A missing display no
+# longer stops the LEDs and buzzer from working.
+comps = Components()
 
+# ESP-NOW Setup
+# Frames are taken from any sensor node (receiving needs no peer entry);
+# SENSOR_LABELS only names the known ones on the display.
 SENSOR_MAC = b"\xF4\x65\x0B\x30\x1a\x84"
-e.add_peer(SENSOR_MAC)
+SENSOR_LABELS = {SENSOR_MAC: "Kitchen"}
+RXBUF = 4096        # room for a burst from many sensors between passes
+e = None
+
+# boot.py has started the station (wifi.py); the loop polls it so a failed
+# or dropped connection is retried, which keeps ESP-NOW on the AP's channel
+import wifi
+sta = wifi.start()
+
+def start_radio():
+    global e
+    e = espnow.ESPNow()
+    e.config(rxbuf=RXBUF)
+    e.active(True)
+    return e
+
+comps.add("radio", start_radio)
 
 # OLED Setup
 I2C_SCL = 32
 I2C_SDA = 15
 OLED_ADDR = 0x3D
+oled = None
 
-i2c = I2C(0, scl=Pin(I2C_SCL), sda=Pin(I2C_SDA))
-print("I2C scan:", i2c.scan())
+def start_display():
+    global oled
+    i2c = I2C(0, scl=Pin(I2C_SCL), sda=Pin(I2C_SDA))
+    found = i2c.scan()
+    log.info("I2C scan: %s", found)
+    if OLED_ADDR not in found:
+        raise OSError("no OLED at 0x%02x" % OLED_ADDR)
+    oled = SSD1306_I2C(128, 64, i2c, addr=OLED_ADDR)
+    return oled
 
-oled = SSD1306_I2C(128, 64, i2c, addr=OLED_ADDR)
+comps.add("display", start_display)
 
 # LED and Buzzer Setup
-green = Pin(14, Pin.OUT)
-red = Pin(26, Pin.OUT)
-yellow = Pin(27, Pin.OUT)
-buzzer = Pin(33, Pin.OUT)
+green = red = yellow = buzzer = None
+
+def start_outputs():
+    global green, red, yellow, buzzer
+    green = Pin(14, Pin.OUT)
+    red = Pin(26, Pin.OUT)
+    yellow = Pin(27, Pin.OUT)
+    buzzer = Pin(33, Pin.OUT)
+
+comps.add("outputs", start_outputs)
 
 def led_green():
     red.off()
@@ -71,92 +108,232 @@ def update_buzzer():
             last_beep_toggle = now
 
 # State Variables
-current_status = "GREEN"
-last_cleaner = "---"
-next_up = "---"
+# One row per sensor node; the LEDs and buzzer show the worst of them
+sinks = SinkTable(SENSOR_LABELS)
+current_status = GREEN
 
-def update_display():
-    oled.fill(0)
-    oled.text("DishDuty", 0, 0)
-    
-    status_display = ""
-    if current_status == "GREEN":
-        status_display = "Status: OK"
-    elif current_status == "YELLOW":
-        status_display = "Status: DISHES"
-    elif current_status == "RED":
-        status_display = "Status: ALERT!"
-    
-    oled.text(status_display, 0, 12)
+# Display
+# Redrawing takes ~25 ms of I2C, so frames only mark it dirty and the loop
+# redraws at most every DISPLAY_MS. With more than one sensor the display
+# pages through a summary and every sink that is not GREEN, PAGE_MS each.
+DISPLAY_MS = 500
+PAGE_MS = 4000
+STATUS_TEXT = ("Status: OK", "Status: DISHES", "Status: ALERT!")
+display_dirty = True
+last_draw = 0
+last_page = 0
+page = 0
+
+def draw_sink(i, title):
+    oled.text(title, 0, 0)
+    status = sinks.status[i] if i is not None else GREEN
+    oled.text(STATUS_TEXT[status], 0, 12)
     oled.text("----------------", 0, 24)
-    
+
     oled.text("Next Up:", 0, 32)
-    name = next_up if next_up else "---"
+    name = sinks.next_up[i] if i is not None else "---"
+    if not name:
+        name = "---"
     x_pos = max(0, (128 - len(name) * 8) // 2)
     oled.text(name, x_pos, 44)
-    
-    oled.text("Last: " + last_cleaner[:10], 0, 56)
-    
+
+    last = sinks.last[i] if i is not None else "---"
+    oled.text("Last: " + last[:10], 0, 56)
+
+def draw_summary(attention):
+    n = sinks.n_status
+    oled.text("DishDuty %d sinks" % len(sinks), 0, 0)
+    oled.text(STATUS_TEXT[current_status], 0, 12)
+    oled.text("----------------", 0, 24)
+    oled.text("R%d Y%d OK%d" % (n[RED], n[YELLOW], n[GREEN]), 0, 32)
+    for k in range(min(2, len(attention))):
+        i = attention[k]
+        oled.text(("!" if sinks.status[i] == RED else "-") + sinks.label(i)[:15],
+                  0, 44 + k * 12)
+
+def update_display():
+    global display_dirty, page
+    display_dirty = False
+    if oled is None:
+        return
+    oled.fill(0)
+    if len(sinks) <= 1:
+        draw_sink(0 if len(sinks) else None, "DishDuty")
+    else:
+        attention = sinks.attention()
+        page %= len(attention) + 1
+        if page == 0:
+            draw_summary(attention)
+        else:
+            i = attention[page - 1]
+            draw_sink(i, "%s %d/%d" % (sinks.label(i)[:11], page, len(attention)))
     oled.show()
 
+def poll_display(now):
+    """Redraw if something changed or the page is due to turn"""
+    global last_draw, last_page, page, display_dirty
+    if len(sinks) > 1 and time.ticks_diff(now, last_page) >= PAGE_MS:
+        last_page = now
+        if current_status != GREEN:
+            page += 1
+            display_dirty = True
+    if display_dirty and time.ticks_diff(now, last_draw) >= DISPLAY_MS:
+        last_draw = now
+        update_display()
+
 def apply_status():
     """Update LEDs based on status"""
-    if current_status == "GREEN":
-        led_green()
-    elif current_status == "YELLOW":
+    if current_status == YELLOW:
         led_yellow()
-    elif current_status == "RED":
+    elif current_status == RED:
         led_red()
     else:
         led_green()
 
+comps.boot()
 apply_status()
 update_display()
 
+# Message Handling
+# Status and beep frames arrive constantly, match them as raw bytes so the
+# common case needs no decode or split
+STATUS_FRAMES = (
+    (b"S|GREEN", GREEN),
+    (b"S|YELLOW", YELLOW),
+    (b"S|RED", RED),
+)
+BEEP_FRAMES = (
+    (b"B|OFF", OFF),
+    (b"B|GRACE", GRACE),
+    (b"B|CONSTANT", CONSTANT),
+)
+
+def match_frame(msg, frames):
+    for raw, value in frames:
+        if msg == raw:
+            return value
+    return None
+
+def refresh_outputs():
+    """Follow the worst status and beep mode over all sinks"""
+    global current_status, display_dirty
+    status = sinks.worst_status()
+    if status != current_status:
+        current_status = status
+        log.info("Status: %s", STATUS_NAMES[status])
+        apply_status()
+        display_dirty = True
+    mode = BEEP_NAMES[sinks.worst_beep()]
+    if mode != beep_mode:
+        set_beep_mode(mode)
+
+def set_beep_mode(mode):
+    global beep_mode
+    beep_mode = mode
+    log.info("Beep mode: %s", beep_mode)
+    if beep_mode == "OFF":
+        buzzer.off()
+
+def handle_msg(host, msg):
+    global display_dirty
+
+    i = sinks.slot(host)
+    if i is None:
+        log.warn("Sensor table full, ignoring a frame")
+        return
+
+    value = match_frame(msg, STATUS_FRAMES)
+    if value is not None:
+        if sinks.set_status(i, value):
+            log.debug("%s: %s", sinks.label(i), STATUS_NAMES[value])
+            display_dirty = True
+            refresh_outputs()
+        return
+    value = match_frame(msg, BEEP_FRAMES)
+    if value is not None:
+        if sinks.set_beep(i, value):
+            refresh_outputs()
+        return
+
+    try:
+        text = msg.decode("utf-8")
+    except:
+        log.warn("Non-text msg: %s", msg)
+        return
+
+    parts = text.split("|", 1)
+    if len(parts) != 2:
+        log.warn("Malformed msg: %s", text)
+        return
+
+    mtype, payload = parts[0], parts[1]
+
+    if mtype == "R":
+        if sinks.set_last(i, payload):
+            log.info("Last cleaner (%s): %s", sinks.label(i), payload)
+            display_dirty = True
+
+    elif mtype == "N":
+        if sinks.set_next_up(i, payload):
+            log.info("Next up (%s): %s", sinks.label(i), payload)
+            display_dirty = True
+
+    elif mtype == "S" or mtype == "B":
+        log.warn("Unknown %s value: %s", mtype, payload)
+
+    else:
+        log.warn("Unknown msg type: %s", mtype)
+
+# Power
+# The loop waits for the next frame until its own timed work is due: the
+# next GRACE toggle, a held-back redraw, a page turn, log lines still to
+# write, the next Wi-Fi step (wifi.py due_ms()). With none of that (GREEN
+# or not, buzzer OFF, display drawn, link up) it waits up to IDLE_WAIT_MS
+# at the idle clock; beeping and redrawing run at the full clock
+# (power.py).
+from power import ClockScaler
+
+IDLE_WAIT_MS = 60000
+clock = ClockScaler()
+
+def next_due_ms(now):
+    """ms until the loop has timed work of its own"""
+    due = min(IDLE_WAIT_MS, sta.due_ms(now))
+    if beep_mode == "GRACE":
+        due = min(due, BEEP_GRACE_INTERVAL - time.ticks_diff(now, last_beep_toggle))
+    if display_dirty:
+        due = min(due, DISPLAY_MS - time.ticks_diff(now, last_draw))
+    if len(sinks) > 1 and current_status != GREEN:
+        due = min(due, PAGE_MS - time.ticks_diff(now, last_page))
+    if log.pending():
+        due = 0
+    return max(0, due)
+
 # Main Loop
-print("Notifier ready. Waiting for messages...\n")
+log.info("Notifier ready. Waiting for messages...\n")
+log.flush()
+
+# The wait for the next frame is the loop's idle time; once one arrives
+# everything queued is handled before the outputs are looked at again.
+MAX_FRAMES = 32     # per pass, so the buzzer keeps its rhythm under a flood
 
 while True:
-    host, msg = e.recv(20)
-    
-    if msg:
-        try:
-            text = msg.decode("utf-8")
-        except:
-            print("Non-text msg:", msg)
-            continue
-        
-        parts = text.split("|", 1)
-        if len(parts) != 2:
-            print("Malformed msg:", text)
-            continue
-        
-        mtype, payload = parts[0], parts[1]
-        
-        if mtype == "S":
-            current_status = payload
-            print("Status:", current_status)
-            apply_status()
-            update_display()
-        
-        elif mtype == "R":
-            last_cleaner = payload
-            print("Last cleaner:", last_cleaner)
-            update_display()
-        
-        elif mtype == "N":
-            next_up = payload
-            print("Next up:", next_up)
-            update_display()
-        
-        elif mtype == "B":
-            beep_mode = payload
-            print("Beep mode:", beep_mode)
-            if beep_mode == "OFF":
-                buzzer.off()
-        
-        else:
-            print("Unknown msg type:", mtype)
-    
+    clock.set(beep_mode != "OFF" or display_dirty)
+    wait = next_due_ms(time.ticks_ms())
+    if e:
+        host, msg = e.irecv(wait)
+        n = 0
+        while msg:
+            handle_msg(host, msg)
+            n += 1
+            if n == MAX_FRAMES:
+                break
+            host, msg = e.irecv(0)
+    else:
+        time.sleep_ms(wait)
+
+    now = time.ticks_ms()
+    sta.poll(now)
+    poll_display(now)
     update_buzzer()
-    time.sleep_ms(50)
+    log.drain(4)
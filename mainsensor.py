@@ -1,26 +1,67 @@
 # DishDuty Sensor Unit: Ultrasonic + Load Cell + RFID + ESP-NOW
-# Simple HTTP server for viewing counts and duty order
+# Small HTTP server: stats page, JSON API and live /events stream
 
 from machine import Pin, SPI
-import time, sys, uselect, socket
-import network, espnow
+from micropython import const
+from ubinascii import hexlify
+import time, sys, io, uselect
+import espnow
+import ringlog as log
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+# Loop instrumentation switch. With METRICS = const(0) the compiler drops
+# every `if METRICS:` block, so the stripped build pays nothing.
+METRICS = const(1)
+# Heap telemetry and scheduled GC (same stripping rule as METRICS)
+HEAP_STATS = const(1)
+# Record raw sensor readings to flash for offline replay (sensortrace.py)
+TRACE = const(0)
 
 # WiFi and ESP-NOW Setup
-wlan = network.WLAN(network.STA_IF)
-local_ip = wlan.ifconfig()[0]
-print("Open http://%s/ to view DishDuty stats" % local_ip)
+# boot.py has started the station; it connects in the background and the
+# main loop polls it, nothing here waits for the access point
+import wifi
+sta = wifi.start()
+
+def on_wifi_up(ip):
+    log.info("Open http://%s/ to view DishDuty stats", ip)
 
-e = espnow.ESPNow()
-e.active(True)
+sta.on_up = on_wifi_up
+if sta.is_up():
+    on_wifi_up(sta.ip)
+
+# Startup
+# Every subsystem below registers as a component (components.py). Nothing
+# starts here; comps.boot() before the main loop starts them all, the
+# independent ones concurrently, and logs a per-component boot report
+# (also at /api/boot).
+from components import Components
+
+comps = Components()
 
 NOTIFIER_MAC = b"\xF4\x65\x0B\x34\x1A\x84"
-e.add_peer(NOTIFIER_MAC)
+e = None
+
+def start_radio():
+    global e
+    e = espnow.ESPNow()
+    e.active(True)
+    e.add_peer(NOTIFIER_MAC)
+    return e
+
+comps.add("radio", start_radio)
 
 def send_msg(text):
+    if e is None:
+        return
     try:
         e.send(NOTIFIER_MAC, text)
     except OSError as ex:
-        print("ESP-NOW send error:", ex)
+        log.error("ESP-NOW send error: %s", ex)
 
 # People and data management
 try:
@@ -40,6 +81,29 @@ UID_TO_NAME = {
 ALL_NAMES = sorted(set(UID_TO_NAME.values()))
 COUNTS_FILE = "dish_counts.json"
 DUTY_FILE = "duty_order.json"
+USERS_FILE = "users.json"
+
+def set_users(users):
+    """Replace the card registry (UID hex -> name)"""
+    global ALL_NAMES
+    UID_TO_NAME.clear()
+    UID_TO_NAME.update(users)
+    ALL_NAMES = sorted(set(UID_TO_NAME.values()))
+
+def load_users():
+    # users.json, written by a serial import, overrides the built-in table
+    try:
+        with open(USERS_FILE, "r") as f:
+            set_users(json.load(f))
+    except:
+        pass
+
+def save_users():
+    try:
+        with open(USERS_FILE, "w") as f:
+            json.dump(UID_TO_NAME, f)
+    except Exception as e:
+        log.error("Error saving users: %s", e)
 
 def load_counts():
     try:
@@ -56,7 +120,7 @@ def save_counts(counts):
         with open(COUNTS_FILE, "w") as f:
             json.dump(counts, f)
     except Exception as e:
-        print("Error saving counts:", e)
+        log.error("Error saving counts: %s", e)
 
 def load_duty_order():
     try:
@@ -64,6 +128,10 @@ def load_duty_order():
             order = json.load(f)
     except:
         order = list(ALL_NAMES)
+    return clean_duty_order(order)
+
+def clean_duty_order(order):
+    """order with unknown and repeated names dropped, missing ones appended"""
     seen = set()
     cleaned = []
     for n in order:
@@ -80,116 +148,286 @@ def save_duty_order(order):
         with open(DUTY_FILE, "w") as f:
             json.dump(order, f)
     except Exception as e:
-        print("Error saving duty order:", e)
+        log.error("Error saving duty order: %s", e)
 
-name_counts = load_counts()
-duty_order = load_duty_order()
+name_counts = {}
+duty_order = []
 last_cleaner = None
 next_up_name = None
+# ALL_NAMES by duty, kept by recompute_next_up() so a page view streams it
+# without sorting (or allocating) anything
+roster = []
 
 def sorted_names_by_duty():
+    place = {}
+    for i, n in enumerate(duty_order):
+        place[n] = i
     return sorted(
         ALL_NAMES,
-        key=lambda n: (name_counts.get(n, 0), duty_order.index(n)),
+        key=lambda n: (name_counts.get(n, 0), place.get(n, 0)),
     )
 
 def recompute_next_up():
-    global next_up_name
-    ordered = sorted_names_by_duty()
-    next_up_name = ordered[0] if ordered else "---"
+    """Re-sort the roster; call after any change to counts, order or names"""
+    global next_up_name, roster
+    roster = sorted_names_by_duty()
+    next_up_name = roster[0] if roster else "---"
     return next_up_name
 
-recompute_next_up()
-
-print("Initial counts:", name_counts)
-print("Duty order:", duty_order)
-print("Next up:", next_up_name)
+def start_store():
+    global name_counts, duty_order
+    load_users()
+    name_counts = load_counts()
+    duty_order = load_duty_order()
+    recompute_next_up()
+    log.info("Initial counts: %s", name_counts)
+    log.info("Duty order: %s", duty_order)
+    log.info("Next up: %s", next_up_name)
 
-send_msg(("N|" + next_up_name).encode("utf-8"))
+comps.add("store", start_store)
 
 # HTTP Server
-def render_html(counts, next_up, last_cleaner):
-    total = sum(counts.values())
-    ordered_names = sorted_names_by_duty()
-    rows = ""
-    for name in ordered_names:
-        cnt = counts.get(name, 0)
-        rows += f"<tr><td>{name}</td><td>{cnt}</td></tr>"
-    last_text = last_cleaner if last_cleaner else "---"
-    next_text = next_up if next_up else "---"
-    return f"""HTTP/1.1 200 OK
-Content-Type: text/html
-
-<!DOCTYPE html>
+from httpserver import HTTPServer, send_json, TEXT_HEADERS
+
+HTTP_BUF_SIZE = 512
+
+HTML_HEADERS = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/html; charset=utf-8\r\n"
+    b"Transfer-Encoding: chunked\r\n"
+    b"Connection: close\r\n\r\n"
+)
+
+HTML_HEAD = b"""<!DOCTYPE html>
 <html>
 <head>
   <meta charset="utf-8">
   <title>DishDuty Sensor</title>
   <style>
-    body {{font-family:system-ui;background:#020617;color:#e5e7eb;display:flex;justify-content:center;padding:24px}}
-    .card {{background:#020617;border-radius:16px;border:1px solid #1f2937;padding:20px 24px;max-width:460px;width:100%}}
-    h1 {{margin-top:0;font-size:20px}}
-    table {{width:100%;border-collapse:collapse;margin-top:8px;margin-bottom:12px}}
-    th,td {{text-align:left;padding:4px 0;border-bottom:1px solid #111827}}
-    th {{color:#9ca3af;font-weight:500}}
-    .total {{font-size:13px;color:#9ca3af;margin-top:4px}}
-    .meta {{font-size:13px;color:#9ca3af;margin-top:8px}}
+    body {font-family:system-ui;background:#020617;color:#e5e7eb;display:flex;justify-content:center;padding:24px}
+    .card {background:#020617;border-radius:16px;border:1px solid #1f2937;padding:20px 24px;max-width:460px;width:100%}
+    h1 {margin-top:0;font-size:20px}
+    table {width:100%;border-collapse:collapse;margin-top:8px;margin-bottom:12px}
+    th,td {text-align:left;padding:4px 0;border-bottom:1px solid #111827}
+    th {color:#9ca3af;font-weight:500}
+    .total {font-size:13px;color:#9ca3af;margin-top:4px}
+    .meta {font-size:13px;color:#9ca3af;margin-top:8px}
   </style>
 </head>
 <body>
   <div class="card">
-    <h1>DishDuty · Sensor Node</h1>
+    <h1>DishDuty \xc2\xb7 Sensor Node</h1>
     <p class="meta">Tracks completed dish cycles with soap usage verification.</p>
     <table>
       <tr><th>Name</th><th>Dishes done</th></tr>
-      {rows}
-    </table>
-    <div class="total">Total: <strong>{total}</strong></div>
-    <div class="meta">Next up: <strong>{next_text}</strong><br/>Last: <strong>{last_text}</strong></div>
-  </div>
-</body>
-</html>"""
-
-def start_http_server():
-    addr = socket.getaddrinfo("0.0.0.0", 80)[0][-1]
-    s = socket.socket()
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    s.bind(addr)
-    s.listen(2)
-    s.setblocking(False)
-    print("HTTP server: http://%s/" % local_ip)
-    return s
-
-http_sock = start_http_server()
-
-def handle_http_client():
-    try:
-        cl, addr = http_sock.accept()
-    except OSError:
-        return
+"""
+
+def render_html(w, counts, next_up, last_cleaner):
+    """Stream the stats page through a ResponseWriter, row by row"""
+    total = 0
+    for v in counts.values():
+        total += v
+    w.start(HTML_HEADERS)
+    w.write(HTML_HEAD)
+    for name in roster:
+        w.write(b"      <tr><td>")
+        w.write(name)
+        w.write(b"</td><td>")
+        w.write_int(counts.get(name, 0))
+        w.write(b"</td></tr>\n")
+    w.write(b'    </table>\n    <div class="total">Total: <strong>')
+    w.write_int(total)
+    w.write(b'</strong></div>\n    <div class="meta">Next up: <strong>')
+    w.write(next_up if next_up else "---")
+    w.write(b"</strong><br/>Last: <strong>")
+    w.write(last_cleaner if last_cleaner else "---")
+    w.write(b"</strong></div>\n  </div>\n</body>\n</html>\n")
+    w.finish()
+
+def render_index(w, query):
+    render_html(w, name_counts, next_up_name, last_cleaner)
+
+def state_dict():
+    return {
+        "status": STATUS_NAMES[alert.status],
+        "beep_mode": BEEP_MODES[alert.beep],
+        "alert_active": alert.phase != P_IDLE,
+        "scanned_by": alert.scanned_by,
+        "soap_used": alert.soap_used,
+        "weight": weight / 1000,
+        "soap_state": soap.state,
+        "next_up": next_up_name,
+        "last_cleaner": last_cleaner,
+    }
+
+def api_state(w, query):
+    send_json(w, state_dict())
+
+def api_counts(w, query):
+    send_json(w, {
+        "counts": name_counts,
+        "duty_order": duty_order,
+        "next_up": next_up_name,
+    })
+
+def api_history(w, query):
     try:
-        req = cl.recv(1024).decode("utf-8")
-        if not req:
-            cl.close()
-            return
-        resp = render_html(name_counts, next_up_name, last_cleaner)
-        cl.sendall(resp.encode("utf-8"))
-    except Exception as ex:
-        print("HTTP error:", ex)
-    finally:
-        cl.close()
+        since = int(query.get("since", 0))
+    except ValueError:
+        since = 0
+    events = []
+    for seq, t, kind, value in history:
+        if seq > since:
+            events.append({"seq": seq, "t": t, "kind": kind, "value": value})
+    # "now" lets a collector turn the ticks_ms stamps into wall time
+    send_json(w, {"events": events, "seq": event_seq, "now": time.ticks_ms()})
+
+def sse_hello():
+    return "state", json.dumps(state_dict())
+
+http = None
+
+# Loop Budget
+# A pass is ~640 ms of work (the HX711 read alone is ~510 ms) plus a 50 ms
+# sleep. RFID and the ultrasonics run every pass, the weight read unless
+# the pass has already overrun; HTTP, flash writes and log output come
+# last and are shed while they do not fit (budget.py)
+from budget import LoopBudget, NORMAL, DEFERRABLE
+
+LOOP_BUDGET_US = 700000
+B_WEIGHT = const(0)
+B_HTTP = const(1)
+B_SAVE = const(2)
+B_LOG = const(3)
+
+budget = LoopBudget(LOOP_BUDGET_US, (
+    ("weight", NORMAL, 2000),
+    # under httpserver's REQ_TIMEOUT_MS, a waiting client is still served
+    ("http", DEFERRABLE, 2000),
+    ("save", DEFERRABLE, 5000),
+    ("log", DEFERRABLE, 2000),
+))
+
+def api_budget(w, query):
+    send_json(w, budget.as_dict())
+
+# Loop Metrics
+if METRICS:
+    from metrics import LoopMetrics, render_prometheus
+
+    ST_HTTP = const(0)
+    ST_RFID = const(1)
+    ST_WEIGHT = const(2)
+    ST_US1 = const(3)
+    ST_US2 = const(4)
+    ST_SAVE = const(5)
+
+    stats = LoopMetrics(("http", "rfid", "weight", "us1", "us2", "save"),
+                        LOOP_BUDGET_US)
+
+    def render_metrics(w, query):
+        render_prometheus(w, stats, TEXT_HEADERS, budget)
+
+# Heap Telemetry
+if HEAP_STATS:
+    from memstats import HeapTelemetry
+
+    heap = HeapTelemetry(collect_after=16384, low_water=8192)
+
+    def api_heap(w, query):
+        send_json(w, heap.as_dict())
+
+def api_wifi(w, query):
+    send_json(w, sta.as_dict())
+
+def api_boot(w, query):
+    send_json(w, comps.as_dict())
+
+def render_log(w, query):
+    log.render_text(w, TEXT_HEADERS)
+
+def start_http():
+    global http
+    http = HTTPServer(port=80, buf_size=HTTP_BUF_SIZE)
+    http.route("/", render_index)
+    http.route("/api/state", api_state)
+    http.route("/api/counts", api_counts)
+    http.route("/api/history", api_history)
+    http.route("/api/wifi", api_wifi)
+    http.route("/api/calib", api_calib)
+    http.route("/api/boot", api_boot)
+    http.route("/api/budget", api_budget)
+    http.route("/log", render_log)
+    if METRICS:
+        http.route("/metrics", render_metrics)
+    if HEAP_STATS:
+        http.route("/api/heap", api_heap)
+    http.sse_hello = sse_hello
+    return http
+
+comps.add("http", start_http)
+
+def handle_http_client(until=None):
+    if http is not None:
+        http.poll(until)
+
+# Event History
+# Everything sent to the notifier is also kept here and pushed to /events,
+# plus "soap" events (milligrams used) for soap use during an alert
+HISTORY_LEN = 64
+EVENT_KINDS = {"S": "status", "B": "beep", "R": "clean", "N": "next"}
+history = []
+event_seq = 0
+
+def record_event(kind, value):
+    global event_seq
+    event_seq += 1
+    t = time.ticks_ms()
+    history.append((event_seq, t, kind, value))
+    if len(history) > HISTORY_LEN:
+        history.pop(0)
+    # the JSON is only built while someone has /events open
+    if http is not None and http.sse:
+        http.publish(kind, json.dumps(
+            {"seq": event_seq, "t": t, "kind": kind, "value": value}))
+
+# Status and beep messages are sent often, keep them pre-encoded
+PRE_ENCODED = {
+    "S": {"GREEN": b"S|GREEN", "YELLOW": b"S|YELLOW", "RED": b"S|RED"},
+    "B": {"OFF": b"B|OFF", "GRACE": b"B|GRACE", "CONSTANT": b"B|CONSTANT"},
+}
+
+def emit(mtype, payload):
+    """Send one message to the notifier and record it as a live event"""
+    table = PRE_ENCODED.get(mtype)
+    msg = table.get(payload) if table else None
+    if msg is None:
+        msg = (mtype + "|" + payload).encode("utf-8")
+    send_msg(msg)
+    record_event(EVENT_KINDS[mtype], payload)
+
+def start_announce(*_):
+    emit("N", next_up_name)
+
+comps.add("announce", start_announce, deps=("radio", "store", "http"))
 
 # Ultrasonic Sensors
 TRIG1, ECHO1 = 32, 33
 TRIG2, ECHO2 = 27, 14
 
-trig1 = Pin(TRIG1, Pin.OUT)
-echo1 = Pin(ECHO1, Pin.IN)
-trig2 = Pin(TRIG2, Pin.OUT)
-echo2 = Pin(ECHO2, Pin.IN)
-trig1.off()
-trig2.off()
-time.sleep_ms(200)
+trig1 = echo1 = trig2 = echo2 = None
+
+async def start_ultrasonic():
+    global trig1, echo1, trig2, echo2
+    trig1 = Pin(TRIG1, Pin.OUT)
+    echo1 = Pin(ECHO1, Pin.IN)
+    trig2 = Pin(TRIG2, Pin.OUT)
+    echo2 = Pin(ECHO2, Pin.IN)
+    trig1.off()
+    trig2.off()
+    await asyncio.sleep_ms(200)
+
+comps.add("ultrasonic", start_ultrasonic)
 
 US_MIN = 1.0
 US_MAX = 7.0
@@ -215,336 +453,393 @@ def distance_cm(trig, echo):
 INTERVAL_MS = 500
 OFFSET_MS = 250
 
-now = time.ticks_ms()
-next_us1 = now
-next_us2 = time.ticks_add(now, OFFSET_MS)
-last_status = "GREEN"
-
 # Load Cell (HX711)
 from hx711 import HX711
+from calib import Calibration, ZeroTracker, CALIB_FILE
 
 DT, SCK = 12, 13
-hx = HX711(dout=DT, sck=SCK)
-CAL = 1143.3771
+LOADCELL_TIMEOUT_MS = 3000
+hx = None
+cal = None
+zero = None
+
+async def hx_ready(dout):
+    # DOUT goes low when a conversion is ready (every 100 ms, the first
+    # one ~400 ms after power-up); wait without holding up the others
+    while dout.value():
+        await asyncio.sleep_ms(2)
+
+async def start_loadcell():
+    global hx, cal, zero
+    # the globals are only set once everything worked, the loop skips
+    # the load cell while hx is None
+    await hx_ready(Pin(DT, Pin.IN))
+    h = HX711(dout=DT, sck=SCK)
+    c = Calibration.load(CALIB_FILE)
+    if c is None:
+        # first boot: tare on whatever is on the scale, ZeroTracker
+        # corrects it the first time the bottle is lifted
+        log.info("No calibration on flash, taring load cell...")
+        total = 0
+        for _ in range(5):
+            await hx_ready(h.dout)
+            total += h.read()
+        c = Calibration(total // 5)
+        c.save(CALIB_FILE)
+    else:
+        log.info("Calibration loaded: offset %d, scale %.4f", c.offset, c.scale)
+    h.offset = c.offset
+    hx, cal, zero = h, c, ZeroTracker(c)
+    log.info("Load cell ready.\n")
+    return hx
 
-print("Taring load cell...")
-time.sleep(2)
-hx.tare()
-print("Load cell ready.\n")
+comps.add("loadcell", start_loadcell, timeout_ms=LOADCELL_TIMEOUT_MS)
 
-soap_baseline = None
-soap_state = "no_bottle"
-last_soap_weight = 0.0
+def api_calib(w, query):
+    send_json(w, cal.as_dict() if cal else {})
 
-SOAP_PRESENT_THRESHOLD = 100
-SOAP_USE_THRESHOLD = 3
-SOAP_EMPTY_THRESHOLD = 75
-SOAP_NEW_BOTTLE_DELTA = 300
+weight = 0        # mg
 
 def read_weight():
-    w = hx.get_units(scale=CAL, times=6)
-    if abs(w) < 0.5:
-        w = 0.0
-    return w
-
-def process_soap_weight(w, should_track=True):
-    global soap_baseline, soap_state, last_soap_weight
-    
-    if w < SOAP_PRESENT_THRESHOLD:
-        if soap_state != "removed":
-            if should_track:
-                print("Soap bottle lifted/removed.")
-            soap_state = "removed"
-        last_soap_weight = w
-        return False
-    
-    if soap_state == "removed" and w >= SOAP_PRESENT_THRESHOLD:
-        if should_track:
-            print("Soap bottle placed back. Weight: %.1f g" % w)
-        
-        if soap_baseline is None:
-            soap_baseline = w
-            if should_track:
-                print("   Baseline set: %.1f g" % soap_baseline)
-        else:
-            delta = w - soap_baseline
-            if delta < -SOAP_USE_THRESHOLD:
-                if should_track:
-                    soap_used = abs(delta)
-                    print("   Soap used: %.1f grams" % soap_used)
-                    soap_baseline = w
-                    if soap_baseline < SOAP_EMPTY_THRESHOLD:
-                        print("   Bottle nearly empty: %.1f g" % soap_baseline)
-                else:
-                    print("   Soap movement before scan - not counted")
-                    soap_baseline = w
-                soap_state = "present"
-                last_soap_weight = w
-                return should_track
-            elif abs(delta) > SOAP_NEW_BOTTLE_DELTA:
-                if should_track:
-                    print("   New bottle detected! Weight: %.1f g" % w)
-                soap_baseline = w
-                soap_state = "present"
-                last_soap_weight = w
-                return False
-            else:
-                if should_track:
-                    print("   No soap use detected (delta: %.1f g)" % delta)
-        soap_state = "present"
-        last_soap_weight = w
-        return False
-    
-    if soap_state == "present":
-        if soap_baseline and soap_baseline < SOAP_EMPTY_THRESHOLD:
-            if should_track and time.ticks_ms() % 30000 < 500:
-                print("   Bottle nearly empty: %.1f g" % soap_baseline)
-        last_soap_weight = w
-    return False
+    """Net weight in mg, an int; readings within 0.5 g of zero read 0"""
+    if hx is None:
+        return 0
+    mg = cal.to_mg(hx.read_net(6))
+    if -500 < mg < 500:
+        mg = 0
+    return mg
 
-# Alert State Machine
-alert_active = False
-alert_start_time = 0
-last_scan_time = 0
-grace_period_ms = 15000
-scan_grace_ms = 30000
-scan_timeout_ms = 60000
-last_rfid_scan = None
-soap_used_during_alert = False
-beep_mode = None
+from soap import SoapDetector
+soap = SoapDetector()
 
 # RFID Scanner
+# Every reader hangs off the same SPI bus with its own CS pin; a second
+# tap point is one more entry in CS_RFID (rfidpool.py polls them together)
 from mfrc22 import MFRC522
+from rfidpool import ReaderPool
 
 SCK_RFID, MOSI, MISO = 5, 19, 21
-CS_RFID, RST_RFID = 26, 25
-
-poll = uselect.poll()
-poll.register(sys.stdin, uselect.POLLIN)
+CS_RFID = (26,)
+RST_RFID = 25
+
+rfid = None
+
+def start_rfid():
+    global rfid
+    rst_pin = Pin(RST_RFID, Pin.OUT)
+    rst_pin.value(1)
+    spi = SPI(2, baudrate=2500000, polarity=0, phase=0,
+              sck=Pin(SCK_RFID), mosi=Pin(MOSI), miso=Pin(MISO))
+    rfid = ReaderPool([MFRC522(spi=spi, cs=Pin(cs, Pin.OUT)) for cs in CS_RFID])
+    log.info("RFID ready (%d reader(s)).\n", len(rfid))
+    return rfid
+
+comps.add("rfid", start_rfid)
+
+# Serial Link
+# Framed bulk export/import over USB serial (seriallink.py, host side in
+# sim/serialclient.py); a lone "r" typed in a terminal still resets the
+# counts
+from seriallink import SerialLink
+
+def reset_counts():
+    for k in name_counts:
+        name_counts[k] = 0
+    save_counts(name_counts)
+    log.info("\n*** COUNTS RESET ***")
+    recompute_next_up()
 
-def check_for_reset_from_serial():
-    global name_counts
-    res = poll.poll(0)
-    if res:
-        ch = sys.stdin.read(1)
-        if ch in ("r", "R"):
-            for k in name_counts:
-                name_counts[k] = 0
-            save_counts(name_counts)
-            print("\n*** COUNTS RESET ***")
-            recompute_next_up()
+def on_serial_text(ch):
+    if ch == 0x72 or ch == 0x52:        # "r", "R"
+        reset_counts()
 
-rst_pin = Pin(RST_RFID, Pin.OUT)
-rst_pin.value(1)
+def json_source(obj):
+    return io.BytesIO(json.dumps(obj).encode())
 
-spi = SPI(2, baudrate=2500000, polarity=0, phase=0,
-          sck=Pin(SCK_RFID), mosi=Pin(MOSI), miso=Pin(MISO))
-rfid = MFRC522(spi=spi, cs=Pin(CS_RFID, Pin.OUT))
+def announce_next_up():
+    recompute_next_up()
+    emit("N", next_up_name)
+
+def import_counts(data):
+    counts = json.loads(data)
+    if not isinstance(counts, dict):
+        raise ValueError("expected {name: count}")
+    for k, v in counts.items():
+        if not isinstance(v, int) or v < 0:
+            raise ValueError("bad count for %s" % k)
+    name_counts.clear()
+    name_counts.update(counts)
+    for n in ALL_NAMES:
+        name_counts.setdefault(n, 0)
+    save_counts(name_counts)
+    log.info("Counts imported: %s", name_counts)
+    announce_next_up()
+
+def import_order(data):
+    order = json.loads(data)
+    if not isinstance(order, list):
+        raise ValueError("expected [name, ...]")
+    duty_order[:] = clean_duty_order(order)
+    save_duty_order(duty_order)
+    log.info("Duty order imported: %s", duty_order)
+    announce_next_up()
+
+def import_users(data):
+    users = json.loads(data)
+    if not isinstance(users, dict) or not users:
+        raise ValueError("expected {uid: name}")
+    for uid, name in users.items():
+        if len(uid) != 8 or not isinstance(name, str):
+            raise ValueError("bad entry %s" % uid)
+        int(uid, 16)
+    set_users({uid.upper(): name for uid, name in users.items()})
+    save_users()
+    for n in ALL_NAMES:
+        name_counts.setdefault(n, 0)
+    duty_order[:] = clean_duty_order(duty_order)
+    save_counts(name_counts)
+    save_duty_order(duty_order)
+    log.info("Users imported: %d cards, %d names", len(UID_TO_NAME), len(ALL_NAMES))
+    announce_next_up()
 
-print("RFID ready.\n")
+poll = uselect.poll()
+poll.register(sys.stdin, uselect.POLLIN)
+link = SerialLink(sys.stdin.buffer, sys.stdout.buffer, poll, on_serial_text)
+link.resource("counts", lambda: json_source(name_counts), import_counts)
+link.resource("order", lambda: json_source(duty_order), import_order)
+link.resource("users", lambda: json_source(UID_TO_NAME), import_users)
+link.resource("trace", lambda: open(TRACE_FILE, "rb"))
+link_idle = link.service
+
+# Deferred Flash Writes
+# register_clean() and the background re-tare only mark what changed; the
+# loop writes it out once a pass has room for it (B_SAVE)
+SAVE_COUNTS = const(1)
+SAVE_ORDER = const(2)
+SAVE_CALIB = const(4)
+unsaved = 0
+
+def flush_saves():
+    global unsaved
+    pending = unsaved
+    unsaved = 0
+    if pending & SAVE_COUNTS:
+        save_counts(name_counts)
+    if pending & SAVE_ORDER:
+        save_duty_order(duty_order)
+    if pending & SAVE_CALIB:
+        cal.save(CALIB_FILE)
 
 # Clean Event Registration
 def register_clean(name):
-    global alert_active, last_cleaner, duty_order
-    global soap_used_during_alert, last_rfid_scan, beep_mode
-    global last_scan_time
+    global last_cleaner, unsaved
     
-    print("DISH CLEAN CONFIRMED by", name)
+    log.info("DISH CLEAN CONFIRMED by %s", name)
     
     name_counts[name] = name_counts.get(name, 0) + 1
-    save_counts(name_counts)
-    
     if name in duty_order:
         duty_order.remove(name)
     duty_order.append(name)
-    save_duty_order(duty_order)
+    unsaved |= SAVE_COUNTS | SAVE_ORDER
     
     last_cleaner = name
     recompute_next_up()
     
-    print("Updated counts:", name_counts)
-    print("New duty order:", duty_order)
-    print("Next up:", next_up_name)
+    log.info("Updated counts: %s", name_counts)
+    log.info("New duty order: %s", duty_order)
+    log.info("Next up: %s", next_up_name)
     
-    alert_active = False
-    soap_used_during_alert = False
-    last_rfid_scan = None
-    beep_mode = None
-    last_scan_time = 0
-    
-    send_msg(("R|" + name).encode("utf-8"))
-    send_msg(("N|" + next_up_name).encode("utf-8"))
-    send_msg(b"S|GREEN")
-    send_msg(b"B|OFF")
+    emit("R", name)
+    emit("N", next_up_name)
+    emit("S", "GREEN")
+    emit("B", "OFF")
+
+# Alert State Machine
+from alert import (AlertFSM, P_IDLE, STATUS_NAMES, BEEP_NAMES, BEEP_MODES,
+                   REASONS, R_WARN, ACT_STATUS, ACT_BEEP, ACT_CLEAN,
+                   ACT_RAISED, ACT_SCANNED, ACT_SOAP)
+
+alert = AlertFSM()
+
+def run_alert_actions(acts):
+    """Turn AlertFSM.step() flags into notifier messages and log lines"""
+    if acts & ACT_SCANNED:
+        log.info("   Scan recorded during alert.\n   Soap used: %s", alert.soap_used)
+    if acts & ACT_SOAP:
+        log.info("   Soap usage logged during alert!")
+        record_event("soap", soap.consumed)
+    if acts & ACT_CLEAN:
+        register_clean(alert.cleaner)
+    elif acts & ACT_BEEP:
+        emit("B", BEEP_NAMES[alert.beep])
+        if alert.reason >= R_WARN:
+            log.warn(REASONS[alert.reason])
+        elif alert.reason:
+            log.info(REASONS[alert.reason])
+        if acts & ACT_RAISED:
+            log.info("   15s grace beeping started.")
+    if acts & ACT_STATUS:
+        log.info("Status: %s", STATUS_NAMES[alert.status])
+        emit("S", STATUS_NAMES[alert.status])
+
+# Sensor Trace
+TRACE_FILE = "trace.bin"
+if TRACE:
+    from sensortrace import TraceWriter
+    tracer = TraceWriter(TRACE_FILE, max_bytes=262144)
+    log.info("Recording sensor trace to %s", TRACE_FILE)
 
 # Main Loop
-print("Starting main loop...")
-print("US thresholds: %.1f - %.1f cm" % (US_MIN, US_MAX))
+BANNER_TOP = "\n" + "=" * 40
+BANNER_BOTTOM = "=" * 40 + "\n"
+# a scan is a handful of lines; they go in as few ring records as possible,
+# every record is a tuple and a timestamp on the heap
+SCAN_HEAD = BANNER_TOP + "\nRFID DETECTED!\n   UID: %s (reader %d)"
+LOG_DRAIN_PER_PASS = 4
+RFID_HOLD_MS = 1000     # a card that was just read is still in the field
+# heap budget on top for a pass that reads a card: the UID string, the
+# scan's log records and whatever the alert does with it (events, frames)
+SCAN_ALLOC = 1024
+
+def on_card(i, uid, now):
+    """Reader i read uid: log it and feed the scan to the alert"""
+    if HEAP_STATS:
+        heap.allow(SCAN_ALLOC)
+    uid_str = hexlify(bytes(uid[:4])).decode().upper()
+    if TRACE:
+        tracer.rfid(now, uid)
+    log.info(SCAN_HEAD, uid_str, i)
+    
+    if uid_str in UID_TO_NAME:
+        name = UID_TO_NAME[uid_str]
+        log.info("   Name: %s\n   Alert active: %s", name, alert.phase != P_IDLE)
+        
+        # feed the scan in straight away (with the last ultrasonic
+        # results) so the buzzer stops now rather than after this
+        # pass's weight read
+        acts = alert.step(now, near1, near2, name, False)
+        if not acts & ACT_SCANNED:
+            log.info("   Scan outside alert")
+        run_alert_actions(acts)
+    else:
+        log.warn("   Unknown UID!")
+    log.info(BANNER_BOTTOM)
+
+comps.boot()
+
+log.info("Starting main loop...")
+log.info("US thresholds: %.1f - %.1f cm", US_MIN, US_MAX)
+log.flush()
+
+near1, near2 = False, False
+now = time.ticks_ms()
+next_us1 = now
+next_us2 = time.ticks_add(now, OFFSET_MS)
 
 while True:
     now = time.ticks_ms()
+    budget.begin()
+    if HEAP_STATS:
+        heap.begin()
+    if METRICS:
+        loop_t0 = time.ticks_us()
     
-    handle_http_client()
-    
-    # RFID
-    check_for_reset_from_serial()
-    stat, _ = rfid.request(rfid.REQIDL)
-    if stat == rfid.OK:
-        stat, uid = rfid.anticoll()
-        if stat == rfid.OK:
-            uid_str = "".join("{:02X}".format(b) for b in uid[:4])
-            print("\n" + "="*40)
-            print("RFID DETECTED!")
-            print("   UID:", uid_str)
-            
-            if uid_str in UID_TO_NAME:
-                name = UID_TO_NAME[uid_str]
-                print("   Name:", name)
-                print("   Alert active:", alert_active)
-                
-                if alert_active:
-                    last_rfid_scan = name
-                    last_scan_time = now
-                    print("   Scan recorded during alert.")
-                    print("   Soap used:", soap_used_during_alert)
-                    if beep_mode is not None:
-                        beep_mode = None
-                        send_msg(b"B|OFF")
-                        print("   Buzzer stopped by scan")
-                else:
-                    print("   Scan outside alert")
-            else:
-                print("   Unknown UID!")
-            print("="*40 + "\n")
-            
-            rfid.select_tag(uid)
-            rfid.stop_crypto1()
-            time.sleep(1)
-    
-    # Load Cell
-    weight = read_weight()
-    if now % 5000 < 100:
-        print("Weight: %.1f g | Baseline: %s | State: %s" % 
-              (weight, soap_baseline if soap_baseline else "None", soap_state))
-    
-    should_track_soap = alert_active and last_rfid_scan is not None
-    soap_was_used = process_soap_weight(weight, should_track_soap)
+    sta.poll(now)
     
-    if soap_was_used:
-        soap_used_during_alert = True
-        print("   Soap usage logged during alert!")
+    # RFID (critical)
+    # while a transfer runs the HX711 wait serves it too
+    busy = link.service()
+    if hx is not None:
+        hx.idle = link_idle if busy else None
+    if METRICS:
+        t0 = time.ticks_us()
+    found = rfid.poll() if rfid else 0
+    if found:
+        for i in range(len(rfid)):
+            if (found >> i) & 1:
+                uid = rfid.read(i)
+                if uid is not None:
+                    on_card(i, uid, now)
+                    # poll this reader again after RFID_HOLD_MS instead
+                    # of sleeping through it, the rest keep their schedule
+                    rfid.release(i, uid, RFID_HOLD_MS)
+    if METRICS:
+        stats.span(ST_RFID, t0)
     
-    # Ultrasonics
-    near1, near2 = False, False
+    # Load Cell (normal)
+    soap_was_used = False
+    if budget.admit(B_WEIGHT):
+        t0 = time.ticks_us()
+        weight = read_weight()
+        budget.spent(B_WEIGHT, t0)
+        if METRICS:
+            stats.span(ST_WEIGHT, t0)
+        if TRACE:
+            tracer.weight(now, weight)
+        if now % 5000 < 100:
+            log.info("Weight: %.1f g | Baseline: %s | State: %s", weight / 1000,
+                     soap.baseline / 1000 if soap.baseline else "None", soap.state)
+        
+        soap_was_used = soap.process(weight, alert.tracking(), now)
+        bottle_off = soap.state in ("removed", "no_bottle")
+        shift = zero.update(weight, bottle_off, now) if zero else 0
+        if shift:
+            hx.offset = cal.offset
+            soap.rezero(shift)
+            unsaved |= SAVE_CALIB
+            log.info("Load cell re-tared in background (%.1f g)", shift / 1000)
     
+    # Ultrasonics (critical)
+    # near1/near2 hold the latest reading until the sensor is due again
     if time.ticks_diff(now, next_us1) >= 0:
+        if METRICS:
+            t0 = time.ticks_us()
         d1 = distance_cm(trig1, echo1)
+        if METRICS:
+            stats.span(ST_US1, t0)
+        if TRACE:
+            tracer.distance(now, 1, d1)
         next_us1 = time.ticks_add(now, INTERVAL_MS)
-        if d1 is not None and US_MIN < d1 < US_MAX:
-            near1 = True
+        near1 = d1 is not None and US_MIN < d1 < US_MAX
     
     if time.ticks_diff(now, next_us2) >= 0:
+        if METRICS:
+            t0 = time.ticks_us()
         d2 = distance_cm(trig2, echo2)
+        if METRICS:
+            stats.span(ST_US2, t0)
+        if TRACE:
+            tracer.distance(now, 2, d2)
         next_us2 = time.ticks_add(now, INTERVAL_MS)
-        if d2 is not None and US_MIN < d2 < US_MAX:
-            near2 = True
+        near2 = d2 is not None and US_MIN < d2 < US_MAX
     
     # Buzzer and LED State Machine
-    both_blocked = near1 and near2
-    new_status = last_status
-    
-    if alert_active:
-        # Determine LED status
-        if beep_mode == "CONSTANT":
-            new_status = "RED"
-        elif beep_mode == "GRACE":
-            if near1 and near2:
-                new_status = "RED"
-            elif near1 or near2:
-                new_status = "YELLOW"
-            else:
-                new_status = "GREEN"
-        else:
-            if near1 and near2:
-                new_status = "RED"
-            elif near1 or near2:
-                new_status = "YELLOW"
-            else:
-                new_status = "GREEN"
-        
-        # Check if fully resolved
-        if new_status == "GREEN" and last_rfid_scan and soap_used_during_alert:
-            register_clean(last_rfid_scan)
-        else:
-            # Buzzer logic
-            if last_scan_time > 0:
-                since_scan = time.ticks_diff(now, last_scan_time)
-                
-                if since_scan < scan_grace_ms:
-                    if beep_mode is not None:
-                        beep_mode = None
-                        send_msg(b"B|OFF")
-                
-                elif since_scan < scan_timeout_ms:
-                    if both_blocked:
-                        if beep_mode != "CONSTANT":
-                            beep_mode = "CONSTANT"
-                            send_msg(b"B|CONSTANT")
-                            print("RED after 30s grace - CONSTANT buzzing")
-                
-                else:
-                    if new_status != "GREEN":
-                        if beep_mode != "CONSTANT":
-                            beep_mode = "CONSTANT"
-                            send_msg(b"B|CONSTANT")
-                            print("1 min passed - not green, CONSTANT buzzing")
-            
-            else:
-                since_alert = time.ticks_diff(now, alert_start_time)
-                
-                if beep_mode == "CONSTANT":
-                    pass
-                
-                elif since_alert < grace_period_ms:
-                    if both_blocked:
-                        if beep_mode != "GRACE":
-                            beep_mode = "GRACE"
-                            send_msg(b"B|GRACE")
-                            print("Grace period: 15s intermittent beeping")
-                    else:
-                        beep_mode = None
-                        send_msg(b"B|OFF")
-                        alert_start_time = now
-                        print("Dishes moved during grace - TIMER RESET")
-                
-                else:
-                    if beep_mode != "CONSTANT":
-                        beep_mode = "CONSTANT"
-                        send_msg(b"B|CONSTANT")
-                        print("Grace expired - CONSTANT buzzing")
+    run_alert_actions(alert.step(now, near1, near2, None, soap_was_used))
     
-    else:
-        # Not in alert - check for trigger
-        if near1 and near2:
-            alert_active = True
-            alert_start_time = now
-            last_rfid_scan = None
-            soap_used_during_alert = False
-            beep_mode = "GRACE"
-            last_scan_time = 0
-            new_status = "RED"
-            print("\nRED ALERT! Both sensors detecting.")
-            print("   15s grace beeping started.")
-            send_msg(b"B|GRACE")
-        elif near1 or near2:
-            new_status = "YELLOW"
-        else:
-            new_status = "GREEN"
+    # Deferrable: flash writes and HTTP wait for a pass with room
+    if unsaved and budget.admit(B_SAVE):
+        t0 = time.ticks_us()
+        flush_saves()
+        budget.spent(B_SAVE, t0)
+        if METRICS:
+            stats.span(ST_SAVE, t0)
     
-    # Send Status if Changed
-    if new_status != last_status:
-        last_status = new_status
-        print("Status:", new_status)
-        send_msg(("S|" + new_status).encode("utf-8"))
+    # the server stops at the deadline by itself, so HTTP has no expected
+    # cost to fit: it runs whenever the pass has time left
+    if budget.admit(B_HTTP):
+        t0 = time.ticks_us()
+        handle_http_client(budget.deadline())
+        if METRICS:
+            stats.span(ST_HTTP, t0)
     
-    time.sleep_ms(50)
\ No newline at end of file
+    if METRICS:
+        stats.loop_done(loop_t0)
+    if HEAP_STATS:
+        heap.end()
+        heap.idle()
+    if log.pending() and budget.admit(B_LOG):
+        t0 = time.ticks_us()
+        log.drain(LOG_DRAIN_PER_PASS)
+        budget.spent(B_LOG, t0)
+    budget.done()
+    link.sleep_ms(50)
@@ -0,0 +1,108 @@
+# memstats.py - heap / GC telemetry for the main loop
+#
+# begin() and end() bracket one loop pass and record how many bytes it
+# allocated. idle() is called at the quiet point of the pass (right before
+# the sleep) and is the only place a collection is normally run: automatic
+# collections are switched off, so the heap is only swept when we choose
+# to, not in the middle of an ultrasonic echo or an SPI transfer.
+#
+# With a budget set, end() counts the passes that allocated more. A pass
+# with known extra work (a card scan) raises its own limit with allow().
+
+import gc, time
+
+
+class AllocationBudgetError(Exception):
+    pass
+
+
+class HeapTelemetry:
+    def __init__(self, collect_after=16384, low_water=8192,
+                 budget=None, strict=False):
+        # collect once this many bytes were allocated since the last sweep,
+        # or straight away if free memory drops under low_water
+        self.collect_after = collect_after
+        self.low_water = low_water
+        self.budget = budget
+        self.strict = strict
+
+        self.iter_alloc = 0
+        self.max_iter_alloc = 0
+        self.peak_alloc = 0
+        self.min_free = gc.mem_free()
+        self.over_budget = 0
+        self.collections = 0
+        self.unscheduled = 0
+        self.last_collect_us = 0
+        self.max_collect_us = 0
+        self._start = 0
+        self._allowed = 0
+
+        gc.collect()
+        self._since = gc.mem_alloc()
+        gc.disable()
+
+    def begin(self):
+        self._start = gc.mem_alloc()
+        self._allowed = 0
+
+    def allow(self, n):
+        """Let the current pass allocate n bytes over the budget"""
+        self._allowed += n
+
+    def end(self):
+        used = gc.mem_alloc()
+        d = used - self._start
+        if d < 0:
+            # the heap shrank, so MicroPython had to collect on its own
+            # (allocation failure) somewhere inside this pass
+            self.unscheduled += 1
+            d = 0
+            self._since = used
+        self.iter_alloc = d
+        if d > self.max_iter_alloc:
+            self.max_iter_alloc = d
+        if used > self.peak_alloc:
+            self.peak_alloc = used
+        free = gc.mem_free()
+        if free < self.min_free:
+            self.min_free = free
+        limit = self.budget
+        if limit is not None and d > limit + self._allowed:
+            self.over_budget += 1
+            if self.strict:
+                raise AllocationBudgetError(
+                    "loop pass allocated %d bytes (budget %d)"
+                    % (d, limit + self._allowed))
+
+    def idle(self):
+        """Scheduled collection point, returns True if a sweep ran"""
+        used = gc.mem_alloc()
+        if (used - self._since < self.collect_after
+                and gc.mem_free() > self.low_water):
+            return False
+        t0 = time.ticks_us()
+        gc.collect()
+        us = time.ticks_diff(time.ticks_us(), t0)
+        self.collections += 1
+        self.last_collect_us = us
+        if us > self.max_collect_us:
+            self.max_collect_us = us
+        self._since = gc.mem_alloc()
+        return True
+
+    def as_dict(self):
+        return {
+            "free": gc.mem_free(),
+            "alloc": gc.mem_alloc(),
+            "peak_alloc": self.peak_alloc,
+            "min_free": self.min_free,
+            "iter_alloc": self.iter_alloc,
+            "max_iter_alloc": self.max_iter_alloc,
+            "budget": self.budget,
+            "over_budget": self.over_budget,
+            "collections": self.collections,
+            "unscheduled_collections": self.unscheduled,
+            "last_collect_us": self.last_collect_us,
+            "max_collect_us": self.max_collect_us,
+        }
@@ -0,0 +1,153 @@
+# metrics.py - per-stage loop timing with fixed-bucket histograms
+#
+# Spans are plain ticks_us() differences fed into preallocated arrays, so
+# observing a sample allocates nothing. render_prometheus() writes the
+# numbers out in Prometheus text format for the /metrics endpoint.
+
+import time
+from array import array
+
+# Bucket upper bounds in microseconds, the last bucket is +Inf
+BUCKETS_US = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000,
+              100000, 250000, 1000000)
+
+_LE = tuple(b'"%d.%06d"' % (b // 1000000, b % 1000000) for b in BUCKETS_US)
+
+
+class Histogram:
+    __slots__ = ("name", "counts", "count", "sum_s", "sum_us", "max_us")
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = array("I", [0] * (len(BUCKETS_US) + 1))
+        self.count = 0
+        # the sum is split so it stays a small int for decades of uptime
+        self.sum_s = 0
+        self.sum_us = 0
+        self.max_us = 0
+
+    def observe(self, us):
+        i = 0
+        for b in BUCKETS_US:
+            if us <= b:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum_us += us
+        if self.sum_us >= 1000000:
+            self.sum_s += self.sum_us // 1000000
+            self.sum_us %= 1000000
+        if us > self.max_us:
+            self.max_us = us
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = self.sum_s = self.sum_us = self.max_us = 0
+
+
+class LoopMetrics:
+    def __init__(self, stages, budget_us):
+        self.stages = [Histogram(s) for s in stages]
+        self.loop = Histogram("loop")
+        self.budget_us = budget_us
+        self.overruns = 0
+        self.worst_overrun_us = 0
+
+    def span(self, stage, t0):
+        """Record the time since t0 (a ticks_us value) against a stage index"""
+        self.stages[stage].observe(time.ticks_diff(time.ticks_us(), t0))
+
+    def loop_done(self, t0):
+        us = time.ticks_diff(time.ticks_us(), t0)
+        self.loop.observe(us)
+        if us > self.budget_us:
+            self.overruns += 1
+            if us - self.budget_us > self.worst_overrun_us:
+                self.worst_overrun_us = us - self.budget_us
+
+
+def _write_seconds(w, s, us):
+    w.write_int(s)
+    w.write(b".")
+    w.write(b"%06d" % us)
+
+
+def _write_hist(w, h, metric):
+    label = b'stage="' + h.name.encode() + b'"'
+    cum = 0
+    for i in range(len(h.counts)):
+        cum += h.counts[i]
+        w.write(metric)
+        w.write(b"_bucket{")
+        w.write(label)
+        w.write(b",le=")
+        w.write(_LE[i] if i < len(_LE) else b'"+Inf"')
+        w.write(b"} ")
+        w.write_int(cum)
+        w.write(b"\n")
+    w.write(metric)
+    w.write(b"_sum{")
+    w.write(label)
+    w.write(b"} ")
+    _write_seconds(w, h.sum_s, h.sum_us)
+    w.write(b"\n")
+    w.write(metric)
+    w.write(b"_count{")
+    w.write(label)
+    w.write(b"} ")
+    w.write_int(h.count)
+    w.write(b"\n")
+
+
+def render_prometheus(w, m, headers, budget=None):
+    w.start(headers)
+    w.write(b"# HELP dishduty_stage_seconds Time spent per main loop stage.\n"
+            b"# TYPE dishduty_stage_seconds histogram\n")
+    for h in m.stages:
+        _write_hist(w, h, b"dishduty_stage_seconds")
+    _write_hist(w, m.loop, b"dishduty_stage_seconds")
+
+    w.write(b"# HELP dishduty_stage_max_seconds Slowest observed stage.\n"
+            b"# TYPE dishduty_stage_max_seconds gauge\n")
+    for h in m.stages + [m.loop]:
+        w.write(b'dishduty_stage_max_seconds{stage="')
+        w.write(h.name)
+        w.write(b'"} ')
+        _write_seconds(w, h.max_us // 1000000, h.max_us % 1000000)
+        w.write(b"\n")
+
+    w.write(b"# HELP dishduty_loop_overruns_total Passes over the loop budget.\n"
+            b"# TYPE dishduty_loop_overruns_total counter\n"
+            b"dishduty_loop_overruns_total ")
+    w.write_int(m.overruns)
+    w.write(b"\n# HELP dishduty_loop_worst_overrun_seconds Largest overrun.\n"
+            b"# TYPE dishduty_loop_worst_overrun_seconds gauge\n"
+            b"dishduty_loop_worst_overrun_seconds ")
+    _write_seconds(w, m.worst_overrun_us // 1000000,
+                   m.worst_overrun_us % 1000000)
+    w.write(b"\n")
+    if budget is not None:
+        # stages a budget.LoopBudget shed, and ran late after max_wait_ms
+        for metric, counts, help_ in (
+                (b"dishduty_stage_shed_total", budget.shed,
+                 b"Passes a stage was shed to stay in budget."),
+                (b"dishduty_stage_forced_total", budget.forced,
+                 b"Runs of a shed stage forced after its longest wait.")):
+            w.write(b"# HELP ")
+            w.write(metric)
+            w.write(b" ")
+            w.write(help_)
+            w.write(b"\n# TYPE ")
+            w.write(metric)
+            w.write(b" counter\n")
+            for i in range(len(counts)):
+                w.write(metric)
+                w.write(b'{stage="')
+                w.write(budget.names[i])
+                w.write(b'"} ')
+                w.write_int(counts[i])
+                w.write(b"\n")
+    w.finish()
+
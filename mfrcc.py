@@ -153,6 +153,37 @@ class MFRC522:
 
 		return stat, bits
 
+	# request() in two halves, for polling several readers on one bus
+	# (rfidpool.py): request_start() sends the REQA/WUPA and returns,
+	# request_poll() reads ComIrqReg once and returns None while the
+	# exchange runs, then OK, NOTAGERR when the receive timer ran out
+	# with no answer, or ERR.
+	def request_start(self, mode):
+
+		self._wreg(0x0D, 0x07)
+		self._wreg(0x02, 0x77 | 0x80)
+		self._cflags(0x04, 0x80)
+		self._sflags(0x0A, 0x80)
+		self._wreg(0x01, 0x00)
+		self._wreg(0x09, mode)
+		self._wreg(0x01, 0x0C)
+		self._sflags(0x0D, 0x80)
+
+	def request_poll(self):
+
+		n = self._rreg(0x04)
+		if not n & 0x31:
+			return None
+		self._cflags(0x0D, 0x80)
+		if not n & 0x30:
+			return self.NOTAGERR
+		if self._rreg(0x06) & 0x1B:
+			return self.ERR
+		n = self._rreg(0x0A)
+		lbits = self._rreg(0x0C) & 0x07
+		bits = (n - 1) * 8 + lbits if lbits else n * 8
+		return self.OK if bits == 0x10 else self.ERR
+
 	def anticoll(self):
 
 		ser_chk = 0
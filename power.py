@@ -0,0 +1,35 @@
+# power.py - CPU clock switching for the notifier
+#
+# The notifier spends nearly all its time waiting for ESP-NOW frames, and
+# for most of the day nothing on it moves: the LEDs are static, the
+# buzzer is OFF and the display is drawn. ClockScaler drops machine.freq()
+# to FREQ_IDLE for those stretches and brings it back to FREQ_ACTIVE while
+# there is work to pace (beeping, redrawing). machine.freq() is only
+# called when the wanted clock changes.
+#
+# The ESP32 port's machine.lightsleep() powers the radio down, and a
+# frame sent meanwhile is lost (sensor nodes only send on change), so the
+# notifier does not use it: its "sleep" is the irecv() wait, capped at
+# main_actuator.py's IDLE_WAIT_MS (60 s) when nothing is due. The CPU idles
+# there until the radio delivers a frame or the cap runs out.
+
+import machine
+
+FREQ_ACTIVE = 160000000
+FREQ_IDLE = 80000000        # the lowest clock the radio keeps working at
+
+
+class ClockScaler:
+    def __init__(self, active=FREQ_ACTIVE, idle=FREQ_IDLE):
+        self.active = active
+        self.idle = idle
+        self.hz = machine.freq()
+        self.switches = 0
+
+    def set(self, busy):
+        """Run at the active clock if busy, else at the idle one"""
+        hz = self.active if busy else self.idle
+        if hz != self.hz:
+            machine.freq(hz)
+            self.hz = hz
+            self.switches += 1
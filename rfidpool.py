@@ -0,0 +1,85 @@
+# rfidpool.py - several MFRC522 readers on one SPI bus
+#
+# The readers share SCK/MOSI/MISO and each has its own CS pin. The
+# driver's request() starts a REQA and then reads ComIrqReg until a card
+# answers or 2000 reads have gone by; it does not stop at TimerIRq, so an
+# empty field holds the bus ~68 ms per reader. poll() sends the REQA on
+# every reader first and then reads each reader's ComIrqReg in turn until
+# it has its answer or its receive timer (~15 ms) ran out. The readers
+# wait out their receive windows together while the bus goes round them,
+# so a pass costs about one timeout, not one per reader.
+#
+# UIDs come back tagged with the index of the reader that saw them. A
+# reader that has just read a card is put on hold for a while (the card is
+# still in its field); the others keep being polled.
+
+import time
+from array import array
+
+from mfrc22 import MFRC522
+
+POLL_TIMEOUT_US = 30000     # twice the receive timer the driver programs
+
+
+class ReaderPool:
+    def __init__(self, readers):
+        n = len(readers)
+        self.readers = readers
+        self.mask = (1 << n) - 1
+        self.held = 0                           # bit i: reader i on hold
+        self.hold_until = array("i", [0] * n)   # ticks_ms
+        self.passes = 0
+        self.cards = array("I", [0] * n)        # UIDs read per reader
+        self.stuck = array("I", [0] * n)        # polls that never finished
+
+    def __len__(self):
+        return len(self.readers)
+
+    def poll(self, mode=MFRC522.REQIDL):
+        """REQA on every reader not on hold; bitmask of readers a card answered"""
+        rs = self.readers
+        n = len(rs)
+        if self.held:
+            now = time.ticks_ms()
+            for i in range(n):
+                if (self.held >> i) & 1 and time.ticks_diff(now, self.hold_until[i]) >= 0:
+                    self.held &= ~(1 << i)
+        waiting = self.mask & ~self.held
+        for i in range(n):
+            if (waiting >> i) & 1:
+                rs[i].request_start(mode)
+        found = 0
+        t0 = time.ticks_us()
+        while waiting:
+            for i in range(n):
+                if (waiting >> i) & 1:
+                    stat = rs[i].request_poll()
+                    if stat is not None:
+                        waiting &= ~(1 << i)
+                        if stat == MFRC522.OK:
+                            found |= 1 << i
+            if waiting and time.ticks_diff(time.ticks_us(), t0) > POLL_TIMEOUT_US:
+                # a reader that is missing or wedged; the next request
+                # starts from idle anyway
+                for i in range(n):
+                    if (waiting >> i) & 1:
+                        self.stuck[i] += 1
+                break
+        self.passes += 1
+        return found
+
+    def read(self, i):
+        """UID (with its check byte) of the card poll() found on reader i, or None"""
+        stat, uid = self.readers[i].anticoll()
+        if stat != MFRC522.OK:
+            return None
+        self.cards[i] += 1
+        return uid
+
+    def release(self, i, uid, hold_ms):
+        """Select the card and leave it, then skip reader i for hold_ms"""
+        r = self.readers[i]
+        r.select_tag(uid)
+        r.stop_crypto1()
+        self.hold_until[i] = time.ticks_add(time.ticks_ms(), hold_ms)
+        self.held |= 1 << i
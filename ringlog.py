@@ -0,0 +1,135 @@
+# ringlog.py - leveled logging into an in-RAM ring, drained to UART later
+#
+# A log call below the current level costs one comparison. An enabled call
+# only stores the format string and its arguments; the % formatting and
+# the blocking UART write happen in drain(), which the main loop calls at
+# its idle point with a per-pass record limit. The ring also keeps the
+# most recent records for the /log HTTP endpoint.
+
+import sys, time
+
+DEBUG = 10
+INFO = 20
+WARN = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARN: "WARN", ERROR: "ERROR"}
+
+RING_LEN = 64
+
+level = INFO
+dropped = 0
+
+_t = [0] * RING_LEN
+_lv = bytearray(RING_LEN)
+_fmt = [None] * RING_LEN
+_args = [None] * RING_LEN
+_head = 0       # records ever logged
+_drained = 0    # records ever written out
+
+
+def set_level(lv):
+    global level
+    level = lv
+
+
+def _format(fmt, args):
+    try:
+        return fmt % args
+    except Exception:
+        return fmt + " " + repr(args)
+
+
+def _push(lv, fmt, args):
+    global _head, _drained, dropped
+    for a in args:
+        if isinstance(a, (dict, list, bytearray)):
+            fmt = _format(fmt, args)
+            args = None
+            break
+    i = _head % RING_LEN
+    _t[i] = time.ticks_ms()
+    _lv[i] = lv
+    _fmt[i] = fmt
+    _args[i] = args
+    _head += 1
+    if _head - _drained > RING_LEN:
+        # UART fell a whole ring behind, the oldest record is gone
+        dropped += 1
+        _drained += 1
+
+
+def debug(fmt, *args):
+    if level <= DEBUG:
+        _push(DEBUG, fmt, args)
+
+
+def info(fmt, *args):
+    if level <= INFO:
+        _push(INFO, fmt, args)
+
+
+def warn(fmt, *args):
+    if level <= WARN:
+        _push(WARN, fmt, args)
+
+
+def error(fmt, *args):
+    if level <= ERROR:
+        _push(ERROR, fmt, args)
+
+
+def _text(i):
+    fmt = _fmt[i]
+    args = _args[i]
+    if not args:
+        return fmt
+    return _format(fmt, args)
+
+
+def pending():
+    return _head - _drained
+
+
+def drain(max_records=4, out=None):
+    """Write up to max_records waiting records, returns how many were written"""
+    global _drained
+    if out is None:
+        out = sys.stdout
+    n = 0
+    while _drained < _head and n < max_records:
+        i = _drained % RING_LEN
+        if _lv[i] >= WARN:
+            out.write(LEVEL_NAMES[_lv[i]])
+            out.write(": ")
+        out.write(_text(i))
+        out.write("\n")
+        _drained += 1
+        n += 1
+    return n
+
+
+def flush(out=None):
+    while drain(RING_LEN, out):
+        pass
+
+
+def records():
+    """Yield (ticks_ms, level, text) for the records still in the ring"""
+    first = _head - RING_LEN if _head > RING_LEN else 0
+    for k in range(first, _head):
+        i = k % RING_LEN
+        yield _t[i], _lv[i], _text(i)
+
+
+def render_text(w, headers):
+    w.start(headers)
+    for t, lv, text in records():
+        w.write_int(t)
+        w.write(b" ")
+        w.write(LEVEL_NAMES[lv])
+        w.write(b" ")
+        w.write(text)
+        w.write(b"\n")
+    w.finish()
+
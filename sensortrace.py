@@ -0,0 +1,206 @@
+# sensortrace.py - compact binary trace of the sensor node's raw readings
+#
+# File layout: the 4-byte header b"DDT\x01", then records of
+#
+#   kind (1 byte) | ms since previous record (varint) | payload
+#
+#   K_WEIGHT  int32 LE, milligrams (after read_weight's dead band)
+#   K_DIST1   int16 LE, millimetres, -1 when there was no echo
+#   K_DIST2   int16 LE, as K_DIST1
+#   K_RFID    4 UID bytes
+#
+# The first record's delta is its absolute ticks_ms value. Records logged
+# in the same loop pass share its `now`, so a delta of 0 means "same pass";
+# every pass has one K_WEIGHT record, unless the loop budget shed the
+# weight read (budget.py). A pass with both distances
+# read is 15 bytes, about 1.9 MB a day at ~0.7 s/pass; the default
+# max_bytes covers the first 3 hours or so after boot.
+#
+# The writer fills a preallocated buffer and appends it to flash when
+# nearly full, so a pass costs a few byte stores and a file write happens
+# roughly every 60 passes. Recording stops at max_bytes.
+#
+# A reset does not wipe the recording: the writer appends, and every boot
+# after the first starts a new segment with another copy of the header.
+# records() carries the clock on across a segment start (how long the
+# board was down is not known), so times stay increasing.
+
+import os, time
+
+MAGIC = b"DDT\x01"
+
+K_WEIGHT = 1
+K_DIST1 = 2
+K_DIST2 = 3
+K_RFID = 4
+
+# largest record: kind + 5-byte varint + 4-byte payload
+_REC_MAX = 10
+
+
+class TraceWriter:
+    def __init__(self, path, buf_size=512, max_bytes=262144, append=True):
+        self.path = path
+        self.buf = bytearray(buf_size)
+        self.pos = 0
+        self.max_bytes = max_bytes
+        self.written = 0
+        self.records = 0
+        self.full = False
+        self._last = None
+        if append:
+            try:
+                self.written = os.stat(path)[6]
+            except OSError:
+                pass
+        self._f = open(path, "ab" if append else "wb")
+        if self.written + len(MAGIC) > max_bytes:
+            self.full = True
+            return
+        self._f.write(MAGIC)
+        self.written += len(MAGIC)
+
+    def _head(self, kind, now):
+        if self.pos + _REC_MAX > len(self.buf):
+            self.flush()
+            if self.full:
+                return False
+        if self._last is None:
+            d = now
+        else:
+            d = time.ticks_diff(now, self._last)
+            if d < 0:
+                d = 0
+        self._last = now
+        buf = self.buf
+        p = self.pos
+        buf[p] = kind
+        p += 1
+        while d >= 0x80:
+            buf[p] = (d & 0x7F) | 0x80
+            d >>= 7
+            p += 1
+        buf[p] = d
+        self.pos = p + 1
+        self.records += 1
+        return True
+
+    def _int(self, v, n):
+        buf = self.buf
+        p = self.pos
+        for i in range(n):
+            buf[p + i] = v & 0xFF
+            v >>= 8
+        self.pos = p + n
+
+    def weight(self, now, mg):
+        if not self.full and self._head(K_WEIGHT, now):
+            self._int(mg, 4)
+
+    def distance(self, now, which, cm):
+        if not self.full and self._head(K_DIST1 if which == 1 else K_DIST2, now):
+            if cm is None:
+                mm = -1
+            else:
+                mm = int(cm * 10 + 0.5)
+                if mm > 32767:
+                    mm = 32767
+            self._int(mm, 2)
+
+    def rfid(self, now, uid):
+        if not self.full and self._head(K_RFID, now):
+            buf = self.buf
+            p = self.pos
+            for i in range(4):
+                buf[p + i] = uid[i]
+            self.pos = p + 4
+
+    def flush(self):
+        if self.pos:
+            if self.written + self.pos > self.max_bytes:
+                self.full = True
+                self.pos = 0
+                return
+            self._f.write(memoryview(self.buf)[:self.pos])
+            self._f.flush()
+            self.written += self.pos
+            self.pos = 0
+
+    def close(self):
+        self.flush()
+        self._f.close()
+
+
+def _signed(v, bits):
+    return v - (1 << bits) if v & (1 << (bits - 1)) else v
+
+
+def records(data):
+    """Yield (t_ms, kind, value) from trace bytes; t_ms does not wrap
+
+    value is grams (float) for K_WEIGHT, cm (float) or None for the
+    distances, and the 4 UID bytes for K_RFID.
+    """
+    if data[:4] != MAGIC:
+        raise ValueError("not a DishDuty trace")
+    p = 4
+    n = len(data)
+    t = 0
+    while p < n:
+        if data[p:p + 4] == MAGIC:
+            # the node was reset, a new segment starts here
+            p += 4
+            continue
+        kind = data[p]
+        p += 1
+        d = 0
+        shift = 0
+        while True:
+            b = data[p]
+            p += 1
+            d |= (b & 0x7F) << shift
+            shift += 7
+            if not b & 0x80:
+                break
+        t += d
+        if kind == K_WEIGHT:
+            v = _signed(int.from_bytes(data[p:p + 4], "little"), 32) / 1000.0
+            p += 4
+        elif kind == K_DIST1 or kind == K_DIST2:
+            mm = _signed(int.from_bytes(data[p:p + 2], "little"), 16)
+            v = None if mm < 0 else mm / 10.0
+            p += 2
+        elif kind == K_RFID:
+            v = bytes(data[p:p + 4])
+            p += 4
+        else:
+            raise ValueError("bad record kind %d at offset %d" % (kind, p - 1))
+        yield t, kind, v
+
+
+def passes(data):
+    """Group records into loop passes: (now, weight, d1, d2, uid)
+
+    d1/d2 are False when that sensor was not read in the pass, None when
+    it was read but saw no echo. uid is None when nothing was scanned,
+    weight None when the pass skipped the weight read.
+    """
+    now = None
+    w = d1 = d2 = uid = None
+    for t, kind, v in records(data):
+        if t != now:
+            if now is not None:
+                yield now, w, d1, d2, uid
+            now = t
+            w = uid = None
+            d1 = d2 = False
+        if kind == K_WEIGHT:
+            w = v
+        elif kind == K_DIST1:
+            d1 = v
+        elif kind == K_DIST2:
+            d2 = v
+        else:
+            uid = v
+    if now is not None:
+        yield now, w, d1, d2, uid
@@ -0,0 +1,357 @@
+# seriallink.py - framed binary protocol on the USB serial port
+#
+# Frames, in both directions:
+#
+#   0xA5 | type (1) | seq (1) | length (2, LE) | payload | CRC-32 (4, LE)
+#
+# The CRC (binascii.crc32) covers type..payload. Bytes between frames are
+# text: the node's log output on the way to the host, single-key commands
+# typed into a terminal on the way to the node (handed to on_text). A
+# payload is at most MAX_PAYLOAD bytes, so a whole frame fits the ESP32
+# port's 260-byte stdin ring buffer.
+#
+#   host -> node                          node -> host
+#   HELLO                                 HELLO "version max_payload names..."
+#   GET   offset (4) | name               ACK, then DATA... and END total (4)
+#   PUT   size (4) | name                 ACK
+#   DATA  chunk                           ACK with the chunk's seq
+#   END                                   ACK, or ERR text if the import failed
+#
+# Exports stream without waiting for the host; a host that lost a chunk
+# sends GET again from the offset it has (DATA frames before that GET's
+# ACK belong to the old stream). Imports go chunk by chunk, each ACKed,
+# because the node can only buffer about one frame; a repeated seq is
+# ACKed again without being stored twice.
+#
+# SerialLink never blocks on the port: service() reads only what is
+# already buffered (up to RX_BUDGET bytes) and sends at most one frame.
+# It never raises either: a frame that cannot be handled (a name that is
+# not UTF-8, an import function or export stream that fails) is answered
+# with ERR and the link carries on.
+# The main loop calls it once a pass; while a transfer is running it is
+# also called from the waits the loop would otherwise spin or sleep in.
+
+import time
+
+try:
+    from ubinascii import crc32
+except ImportError:
+    from binascii import crc32
+
+VERSION = 1
+SYNC = 0xA5
+HEADER = 5          # sync, type, seq, length
+TRAILER = 4         # CRC-32
+MAX_PAYLOAD = 240
+RX_BUDGET = 512     # bytes read per service() call
+IMPORT_MAX = 4096   # largest resource a PUT may send
+STALE_MS = 100      # a frame takes ~22 ms at 115200; drop one stuck longer
+
+T_HELLO = 1
+T_ACK = 2
+T_ERR = 3
+T_GET = 4
+T_PUT = 5
+T_DATA = 6
+T_END = 7
+
+# FrameReader states
+_HUNT = 0
+_HEAD = 1
+_BODY = 2
+
+
+def frame(buf, ftype, seq, n):
+    """Frame the n payload bytes at buf[HEADER:]; returns the frame length"""
+    buf[0] = SYNC
+    buf[1] = ftype
+    buf[2] = seq & 0xFF
+    buf[3] = n & 0xFF
+    buf[4] = n >> 8
+    end = HEADER + n
+    c = crc32(memoryview(buf)[1:end])
+    buf[end] = c & 0xFF
+    buf[end + 1] = (c >> 8) & 0xFF
+    buf[end + 2] = (c >> 16) & 0xFF
+    buf[end + 3] = (c >> 24) & 0xFF
+    return end + TRAILER
+
+
+def pack(ftype, seq, payload=b""):
+    """One frame as bytes (host side)"""
+    buf = bytearray(HEADER + len(payload) + TRAILER)
+    buf[HEADER:HEADER + len(payload)] = payload
+    frame(buf, ftype, seq, len(payload))
+    return bytes(buf)
+
+
+class FrameReader:
+    """Byte-at-a-time frame parser; calls on_frame(type, seq, payload)
+
+    payload is a memoryview into the reader's buffer, valid until the next
+    byte is fed. Frames with a bad CRC or length are counted in `bad` and
+    dropped; the parser then hunts for the next sync byte.
+    """
+
+    def __init__(self, on_frame, on_text=None, max_payload=MAX_PAYLOAD):
+        self.on_frame = on_frame
+        self.on_text = on_text
+        self.max = max_payload
+        self.buf = bytearray(HEADER + max_payload + TRAILER)
+        self.mv = memoryview(self.buf)
+        self.state = _HUNT
+        self.pos = 0
+        self.need = 0
+        self.frames = 0
+        self.bad = 0
+
+    def feed(self, b):
+        st = self.state
+        if st == _HUNT:
+            if b == SYNC:
+                self.buf[0] = b
+                self.pos = 1
+                self.state = _HEAD
+            elif self.on_text is not None:
+                self.on_text(b)
+            return
+        buf = self.buf
+        p = self.pos
+        buf[p] = b
+        p += 1
+        self.pos = p
+        if st == _HEAD:
+            if p == HEADER:
+                n = buf[3] | (buf[4] << 8)
+                if n > self.max:
+                    self.bad += 1
+                    self.state = _HUNT
+                    return
+                self.need = HEADER + n + TRAILER
+                self.state = _BODY
+        elif p == self.need:
+            self.state = _HUNT
+            end = p - TRAILER
+            c = crc32(self.mv[1:end])
+            # compare in halves, c does not fit a small int
+            if ((c & 0xFFFF) == buf[end] | (buf[end + 1] << 8)
+                    and (c >> 16) == buf[end + 2] | (buf[end + 3] << 8)):
+                self.frames += 1
+                self.on_frame(buf[1], buf[2], self.mv[HEADER:end])
+            else:
+                self.bad += 1
+
+    def reset(self):
+        """Drop a partial frame (a corrupted length may still be waiting)"""
+        self.state = _HUNT
+
+    def feed_bytes(self, data):
+        for b in data:
+            self.feed(b)
+
+
+class _Import:
+    def __init__(self, name, size, fn):
+        self.name = name
+        self.buf = bytearray(size)
+        self.pos = 0
+        self.fn = fn
+        self.seq = -1       # last DATA seq stored
+
+
+class SerialLink:
+    """Node side of the protocol on a binary stream pair
+
+    stdin needs readinto(), stdout write(); poller is a uselect.poll with
+    stdin registered for POLLIN. Resources are registered with resource():
+    export() returns a stream with readinto() (a file or io.BytesIO),
+    import_(data) applies the received bytes or raises ValueError.
+    """
+
+    def __init__(self, stdin, stdout, poller, on_text=None):
+        self.stdin = stdin
+        self.stdout = stdout
+        self.poller = poller
+        self.reader = FrameReader(self._frame, on_text)
+        self.tx = bytearray(HEADER + MAX_PAYLOAD + TRAILER)
+        self.txv = memoryview(self.tx)
+        self.body = self.txv[HEADER:HEADER + MAX_PAYLOAD]
+        self.one = bytearray(1)
+        self.resources = {}
+        self.src = None         # export in progress
+        self.src_seq = 0
+        self.sent = 0
+        self.put = None         # import in progress
+        self.end_seq = -1       # seq of the last END that was ACKed
+        self.rx_bytes = 0
+        self.rx_at = 0
+        self.tx_bytes = 0
+        self.errors = 0
+
+    def resource(self, name, export=None, import_=None):
+        self.resources[name] = (export, import_)
+
+    @property
+    def active(self):
+        return self.src is not None or self.put is not None
+
+    def service(self):
+        """Handle buffered input, send one export chunk; True while busy"""
+        one = self.one
+        stdin = self.stdin
+        poller = self.poller
+        feed = self.reader.feed
+        n = 0
+        while n < RX_BUDGET:
+            for _ in poller.ipoll(0):
+                break
+            else:
+                break
+            stdin.readinto(one)
+            feed(one[0])
+            n += 1
+        if n:
+            self.rx_bytes += n
+            self.rx_at = time.ticks_ms()
+        elif (self.reader.state != _HUNT
+              and time.ticks_diff(time.ticks_ms(), self.rx_at) > STALE_MS):
+            # a corrupted length is waiting for bytes that will not come
+            self.reader.reset()
+        if self.src is not None:
+            try:
+                self._export_chunk()
+            except Exception as ex:
+                self.src = None
+                self._error(self.src_seq, "export: %s" % ex)
+        return self.src is not None or self.put is not None
+
+    def sleep_ms(self, ms):
+        """time.sleep_ms() that keeps a running transfer moving"""
+        if not self.active:
+            time.sleep_ms(ms)
+            return
+        deadline = time.ticks_add(time.ticks_ms(), ms)
+        while self.service() and time.ticks_diff(deadline, time.ticks_ms()) > 0:
+            pass
+        rest = time.ticks_diff(deadline, time.ticks_ms())
+        if rest > 0:
+            time.sleep_ms(rest)
+
+    # Sending
+    def _write(self, ftype, seq, n):
+        end = frame(self.tx, ftype, seq, n)
+        self.stdout.write(self.txv[:end])
+        self.tx_bytes += end
+
+    def _send(self, ftype, seq, data=b""):
+        n = len(data)
+        self.tx[HEADER:HEADER + n] = data
+        self._write(ftype, seq, n)
+
+    def _error(self, seq, msg):
+        self.errors += 1
+        self._send(T_ERR, seq, msg.encode()[:MAX_PAYLOAD])
+
+    def _export_chunk(self):
+        n = self.src.readinto(self.body)
+        if n:
+            self._write(T_DATA, self.src_seq, n)
+            self.src_seq = (self.src_seq + 1) & 0xFF
+            self.sent += n
+        else:
+            self.src.close()
+            self.src = None
+            self._send(T_END, self.src_seq, self.sent.to_bytes(4, "little"))
+
+    # Receiving
+    def _frame(self, ftype, seq, payload):
+        try:
+            self._dispatch(ftype, seq, payload)
+        except Exception as ex:
+            self._error(seq, "frame type %d: %s" % (ftype, ex))
+
+    def _dispatch(self, ftype, seq, payload):
+        if ftype == T_DATA:
+            self._data(seq, payload)
+        elif ftype == T_GET:
+            self._get(seq, int.from_bytes(payload[:4], "little"),
+                      str(bytes(payload[4:]), "utf-8"))
+        elif ftype == T_PUT:
+            self._put(seq, int.from_bytes(payload[:4], "little"),
+                      str(bytes(payload[4:]), "utf-8"))
+        elif ftype == T_END:
+            self._end(seq)
+        elif ftype == T_HELLO:
+            names = " ".join(sorted(self.resources))
+            self._send(T_HELLO, seq, ("%d %d %s" % (VERSION, MAX_PAYLOAD,
+                                                    names)).encode())
+        else:
+            self._error(seq, "bad frame type %d" % ftype)
+
+    def _get(self, seq, offset, name):
+        fn = self.resources.get(name, (None, None))[0]
+        if fn is None:
+            self._error(seq, "no export " + name)
+            return
+        if self.src is not None:
+            self.src.close()
+            self.src = None
+        try:
+            src = fn()
+            if offset:
+                src.seek(offset)
+        except OSError as ex:
+            self._error(seq, "%s: %s" % (name, ex))
+            return
+        self.src = src
+        self.src_seq = 0
+        self.sent = offset
+        self._send(T_ACK, seq)
+
+    def _put(self, seq, size, name):
+        fn = self.resources.get(name, (None, None))[1]
+        if fn is None:
+            self._error(seq, "no import " + name)
+        elif size > IMPORT_MAX:
+            self._error(seq, "%s: %d bytes, at most %d" % (name, size, IMPORT_MAX))
+        else:
+            self.put = _Import(name, size, fn)
+            self._send(T_ACK, seq)
+
+    def _data(self, seq, payload):
+        p = self.put
+        if p is None:
+            self._error(seq, "no import running")
+            return
+        if seq != p.seq:
+            n = len(payload)
+            if p.pos + n > len(p.buf):
+                self.put = None
+                self._error(seq, "%s: more data than announced" % p.name)
+                return
+            p.buf[p.pos:p.pos + n] = payload
+            p.pos += n
+            p.seq = seq
+        self._send(T_ACK, seq)
+
+    def _end(self, seq):
+        p = self.put
+        if p is None:
+            # the host did not hear our ACK and sent END again
+            if seq == self.end_seq:
+                self._send(T_ACK, seq)
+            else:
+                self._error(seq, "no import running")
+            return
+        self.put = None
+        if p.pos != len(p.buf):
+            self._error(seq, "%s: %d of %d bytes" % (p.name, p.pos, len(p.buf)))
+            return
+        try:
+            p.fn(p.buf)
+        except Exception as ex:
+            self._error(seq, "%s: %s" % (p.name, ex))
+            return
+        self.end_seq = seq
+        self._send(T_ACK, seq)
+
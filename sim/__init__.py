@@ -0,0 +1,77 @@
+# sim - deterministic host simulator for the DishDuty nodes
+#
+# Runs mainsensor.py / main_actuator.py (and boot.py) unmodified on CPython
+# against stand-ins for machine, espnow, network, socket, uselect and a
+# virtual time.ticks_* clock. See sim/dishduty.py for the two-node setup
+# and the end-to-end benchmarks.
+
+import subprocess, tempfile, tracemalloc
+
+from .kernel import Scheduler, SimExit
+from .radio import Air, AccessPoint
+from .node import Node, REPO, decode_chunked
+
+
+def firmware_tree(rev):
+    """Export the firmware at git revision rev into a temp dir, for A/B runs"""
+    out = tempfile.mkdtemp(prefix="dishduty-%s-" % rev.replace("/", "_"))
+    archive = subprocess.run(["git", "-C", REPO, "archive", rev],
+                             check=True, capture_output=True).stdout
+    subprocess.run(["tar", "-x", "-C", out], input=archive, check=True)
+    return out
+
+
+class Simulation:
+    def __init__(self, latency_us=1200, ap=None, trace_alloc=False, repo=None):
+        # repo: directory the node programs and modules are loaded from,
+        # defaults to this checkout (see firmware_tree() for other revisions)
+        self.repo = repo or REPO
+        self.sched = Scheduler()
+        self.air = Air(self.sched, latency_us)
+        self.ap = ap if ap is not None else AccessPoint()
+        self.nodes = []
+        if trace_alloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def add_node(self, name, programs, mac, **kw):
+        node = Node(self, name, programs, mac, **kw)
+        self.nodes.append(node)
+        return node
+
+    def start(self):
+        for n in self.nodes:
+            if n.task is None:
+                n.start()
+        return self
+
+    @property
+    def now_us(self):
+        return self.sched.now()
+
+    def run_for(self, seconds, stop=None):
+        return self.sched.run_until(self.sched.now() + int(seconds * 1000000), stop)
+
+    def run_until(self, t_us, stop=None):
+        return self.sched.run_until(t_us, stop)
+
+    def wait(self, cond, timeout_s=10.0, step_s=0.01):
+        """Run in small steps until cond() holds, returns False on timeout"""
+        end = self.sched.now() + int(timeout_s * 1000000)
+        while not cond():
+            if self.sched.now() >= end:
+                return False
+            self.run_until(min(end, self.sched.now() + int(step_s * 1000000)))
+        return True
+
+    def http(self, node, path, timeout_s=5.0):
+        conn = node.http_get(path)
+        if not self.wait(lambda: conn.closed, timeout_s):
+            raise TimeoutError("%s %s did not finish" % (node.name, path))
+        return decode_chunked(conn.take())
+
+    def close(self):
+        self.sched.kill_all()
+
+
+__all__ = ["Simulation", "Node", "Air", "AccessPoint", "SimExit",
+           "decode_chunked", "firmware_tree"]
@@ -0,0 +1,209 @@
+# sim/aio.py - uasyncio stand-in on the node's virtual clock
+#
+# The subset the node programs use: run, create_task, sleep/sleep_ms,
+# gather, wait_for/wait_for_ms, Event and Task.cancel. Tasks are plain
+# coroutines stepped by a small ready queue; when nothing is runnable the
+# node sleeps in virtual time until the earliest wake-up, so a task that
+# awaits a sleep lets the others run exactly as on the board.
+
+import types
+
+SWITCH_US = 30      # cost of resuming a task
+
+
+class CancelledError(BaseException):
+    pass
+
+
+class _Park:
+    """Yielded to the loop: wake at wake_us and/or when obj is ready"""
+    __slots__ = ("wake_us", "obj")
+
+    def __init__(self, wake_us=None, obj=None):
+        self.wake_us = wake_us
+        self.obj = obj
+
+    def __await__(self):
+        yield self
+
+
+def asyncio_module(node):
+    sched = node.sched
+    m = types.ModuleType("asyncio")
+    m.CancelledError = CancelledError
+    m.TimeoutError = TimeoutError
+    loop = {"tasks": [], "current": None, "seq": 0}
+
+    class Task:
+        def __init__(self, coro):
+            self.coro = coro
+            self.done_ = False
+            self.result = None
+            self.exc = None
+            self.waiters = []
+            self.cancel_req = False
+            loop["seq"] += 1
+            self.seq = loop["seq"]
+            self.wake_us = sched.now()
+            self.parked_on = None
+            loop["tasks"].append(self)
+
+        def _ready(self):
+            return self.done_
+
+        def done(self):
+            return self.done_
+
+        def cancel(self):
+            if self.done_:
+                return False
+            self.cancel_req = True
+            _unpark(self)
+            self.wake_us = sched.now()
+            return True
+
+        def __await__(self):
+            while not self.done_:
+                yield _Park(obj=self)
+            if self.exc is not None:
+                raise self.exc
+            return self.result
+
+    def _unpark(task):
+        obj = task.parked_on
+        if obj is not None:
+            task.parked_on = None
+            if task in obj.waiters:
+                obj.waiters.remove(task)
+
+    def _notify(obj):
+        now = sched.now()
+        for t in obj.waiters:
+            t.parked_on = None
+            t.wake_us = now
+        obj.waiters = []
+
+    def _step(task):
+        _unpark(task)   # woken by its deadline rather than by the object
+        loop["current"] = task
+        sched.spend(SWITCH_US)
+        try:
+            if task.cancel_req:
+                task.cancel_req = False
+                y = task.coro.throw(CancelledError())
+            else:
+                y = task.coro.send(None)
+        except StopIteration as e:
+            task.done_ = True
+            task.result = e.value
+        except BaseException as e:
+            task.done_ = True
+            task.exc = e
+        else:
+            if not isinstance(y, _Park):
+                # a bare yield: let the others run, come back at once
+                task.wake_us = sched.now()
+            elif y.obj is not None and y.obj._ready():
+                task.wake_us = sched.now()
+            else:
+                task.wake_us = y.wake_us
+                if y.obj is not None:
+                    task.parked_on = y.obj
+                    y.obj.waiters.append(task)
+        loop["current"] = None
+        if task.done_:
+            loop["tasks"].remove(task)
+            _notify(task)
+
+    def _run_until(main):
+        while not main.done_:
+            best = None
+            for t in loop["tasks"]:
+                if t.wake_us is not None and (best is None or (t.wake_us, t.seq)
+                                              < (best.wake_us, best.seq)):
+                    best = t
+            if best is None:
+                raise RuntimeError("asyncio: all tasks blocked")
+            if best.wake_us > sched.now():
+                node.sleep_until(best.wake_us)
+            _step(best)
+
+    def create_task(coro):
+        return Task(coro)
+
+    def run(coro):
+        main = coro if isinstance(coro, Task) else Task(coro)
+        _run_until(main)
+        if main.exc is not None:
+            raise main.exc
+        return main.result
+
+    def sleep_ms(ms):
+        return _Park(wake_us=sched.now() + max(0, int(ms)) * 1000)
+
+    def sleep(s):
+        return _Park(wake_us=sched.now() + max(0, int(s * 1000000)))
+
+    async def gather(*aws, return_exceptions=False):
+        tasks = [a if isinstance(a, Task) else Task(a) for a in aws]
+        out = []
+        for t in tasks:
+            try:
+                out.append(await t)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                out.append(e)
+        return out
+
+    async def wait_for_ms(aw, ms):
+        t = aw if isinstance(aw, Task) else Task(aw)
+        if not t.done_:
+            await _Park(wake_us=sched.now() + int(ms) * 1000, obj=t)
+        if not t.done_:
+            t.cancel()
+            raise TimeoutError
+        return await t
+
+    async def wait_for(aw, timeout):
+        if timeout is None:
+            return await aw
+        return await wait_for_ms(aw, int(timeout * 1000))
+
+    class Event:
+        def __init__(self):
+            self.state = False
+            self.waiters = []
+
+        def _ready(self):
+            return self.state
+
+        def is_set(self):
+            return self.state
+
+        def set(self):
+            self.state = True
+            _notify(self)
+
+        def clear(self):
+            self.state = False
+
+        async def wait(self):
+            while not self.state:
+                await _Park(obj=self)
+            return True
+
+    def current_task():
+        return loop["current"]
+
+    m.Task = Task
+    m.create_task = create_task
+    m.run = run
+    m.sleep = sleep
+    m.sleep_ms = sleep_ms
+    m.gather = gather
+    m.wait_for = wait_for
+    m.wait_for_ms = wait_for_ms
+    m.Event = Event
+    m.current_task = current_task
+    return m
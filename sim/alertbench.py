@@ -0,0 +1,68 @@
+# sim/alertbench.py - AlertFSM invariants and step() rate
+#
+#   python -m sim.alertbench
+#   python -m sim.alertbench --steps 1000000 --seed 7
+#
+# Fuzzes alert.AlertFSM with random ultrasonic readings, scans and soap
+# uses at loop-like intervals and asserts its invariants after every step,
+# then times step() on the host with no scans or soap.
+
+import argparse, random, time
+
+from alert import (AlertFSM, P_IDLE, P_SCANNED, OFF, GRACE, CONSTANT, GREEN,
+                   RED, ACT_SCANNED, ACT_CLEAN, ACT_RAISED)
+
+
+def fuzz(steps, rng):
+    fsm = AlertFSM()
+    now = 0
+    for _ in range(steps):
+        now += rng.choice((50, 690, 690, 5000, 20000))
+        near = rng.random() < 0.6
+        near1 = near and rng.random() < 0.9
+        near2 = near and rng.random() < 0.9
+        scan = "Paul" if rng.random() < 0.01 else None
+        soap = rng.random() < 0.02 and fsm.tracking()
+        was, beep = fsm.phase, fsm.beep
+        acts = fsm.step(now, near1, near2, scan, soap)
+        assert fsm.phase != P_IDLE or fsm.beep == OFF
+        if beep == CONSTANT and not acts & ACT_SCANNED:
+            # CONSTANT keeps the LED red until someone scans
+            assert fsm.status == RED and fsm.beep == CONSTANT
+        if acts & ACT_CLEAN:
+            assert was == P_SCANNED or scan is not None
+            assert fsm.cleaner == "Paul" and fsm.status == GREEN
+        if acts & ACT_RAISED:
+            assert was == P_IDLE and near1 and near2 and fsm.beep == GRACE
+
+
+def rate(n, rng):
+    inputs = [(rng.random() < 0.5, rng.random() < 0.5) for _ in range(1024)]
+    fsm = AlertFSM()
+    step = fsm.step
+    t0 = time.perf_counter()
+    now = 0
+    for i in range(n):
+        near1, near2 = inputs[i & 1023]
+        now += 690
+        step(now, near1, near2, None, False)
+    return time.perf_counter() - t0
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m sim.alertbench")
+    p.add_argument("--steps", type=int, default=200000, help="fuzzed steps")
+    p.add_argument("--timed", type=int, default=1000000, help="timed steps")
+    p.add_argument("--seed", type=int, default=5)
+    args = p.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    fuzz(args.steps, rng)
+    dt = rate(args.timed, rng)
+    print("fuzzed %d steps, invariants hold" % args.steps)
+    print("step(): %.2f us each, %.2f M steps/s"
+          % (dt * 1e6 / args.timed, args.timed / dt / 1e6))
+
+
+if __name__ == "__main__":
+    main()
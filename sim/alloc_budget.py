@@ -0,0 +1,64 @@
+# sim/alloc_budget.py - fail if a sensor loop pass allocates over budget
+#
+#   python -m sim.alloc_budget --budget 1024 --seconds 120
+#
+# Runs mainsensor.py in the simulator with tracemalloc behind gc.mem_alloc()
+# and arms memstats.HeapTelemetry with the byte budget once the node has
+# booted. A pass is charged its tracemalloc peak over the heap level it
+# started at (sim/modules.py gc_module), so short-lived temporaries count
+# as well as what the pass keeps: it is what MicroPython, with automatic
+# collection off, would have to sweep up later. Temporaries that are never
+# alive at the same time count once, so the figure is a lower bound. A
+# pass that reads a card may go SCAN_ALLOC (mainsensor.py) over the
+# budget. Exit status is 1 when any pass went over budget.
+
+import argparse, sys
+
+from .dishduty import DishDuty
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m sim.alloc_budget")
+    p.add_argument("--budget", type=int, default=1024)
+    p.add_argument("--seconds", type=float, default=120.0)
+    p.add_argument("--fidelity", choices=("bus", "fast"), default="fast")
+    p.add_argument("--with-scan", action="store_true",
+                   help="block the sink and tap a card during the run")
+    args = p.parse_args(argv)
+
+    dd = DishDuty(fidelity=args.fidelity, trace_alloc=True)
+    sim = dd.sim
+    if not sim.wait(lambda: dd.sensor.g("heap") is not None
+                    and dd.sensor.g("stats") is not None
+                    and dd.sensor.g("stats").loop.count > 5, 60):
+        print("sensor node did not reach its main loop")
+        return 2
+    heap = dd.sensor.g("heap")
+    scan = dd.sensor.g("SCAN_ALLOC", 0)
+    heap.budget = args.budget
+    heap.over_budget = 0
+    heap.max_iter_alloc = 0
+
+    if args.with_scan:
+        t = sim.now_us + 2000000
+        dd.sink.dishes(t, True)
+        dd.sink.tap(t + 5000000, "Paul")
+        dd.sink.dishes(t + 15000000, False)
+
+    passes0 = dd.sensor.g("stats").loop.count
+    sim.run_for(args.seconds)
+    passes = dd.sensor.g("stats").loop.count - passes0
+    d = heap.as_dict()
+    dd.close()
+
+    print("passes:            %d" % passes)
+    print("budget:            %d bytes/pass, %d more with a card scan"
+          % (args.budget, scan))
+    print("worst pass:        %d bytes" % d["max_iter_alloc"])
+    print("passes over:       %d" % d["over_budget"])
+    print("scheduled sweeps:  %d" % d["collections"])
+    return 1 if d["over_budget"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
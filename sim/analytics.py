@@ -0,0 +1,618 @@
+# sim/analytics.py - fairness, latency, soap and dirty-hour statistics
+#
+#   python -m sim.analytics collect http://192.168.4.7/ kitchen.jsonl --node Kitchen
+#   python -m sim.analytics synth year.dde --nodes 50 --days 365
+#   python -m sim.analytics report year.dde kitchen.jsonl --tz 1
+#   python -m sim.analytics bench --days 365
+#
+# Event history of any number of sensor nodes is loaded into NumPy columns
+# (t, node, kind, value), sorted by node and time, and every statistic is
+# a handful of searchsorted/cumsum passes and bincount group-bys with no
+# Python per event. `bench` checks the result against a plain per-record
+# loop and times both.
+#
+# Inputs, mixed freely on the command line:
+#   *.jsonl  one event per line: {"node", "t" (unix ms), "kind", "value"},
+#            kinds and values as in the node's /api/history; what `collect`
+#            writes while polling a node
+#   *.dde    b"DDE\x01", u32 LE header length, a JSON header {"nodes": [...],
+#            "names": [...]}, then 16-byte records (t int64 unix ms, node
+#            u16, kind u8, pad, value int32); what `synth` writes
+#
+# Statistics:
+#   fairness  cleans per person per --period days and Jain's index over
+#             them (1.0: everyone cleaned equally often, 1/n: one person)
+#   latency   alert start (a node's status leaves GREEN) to the clean that
+#             resolved it; alerts ended without a scan have none
+#   soap      grams logged between alert start and its clean
+#   dirty     sink-minutes away from GREEN by local hour and weekday
+#
+# numpy is needed by this tool only (pip install numpy); the firmware and
+# the rest of sim/ do without it.
+
+import argparse, json, os, sys, tempfile, time, urllib.request
+
+from .node import REPO
+
+if REPO not in sys.path:
+    sys.path.insert(0, REPO)
+
+from alert import GREEN, STATUS_NAMES, BEEP_NAMES
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAGIC = b"DDE\x01"
+KINDS = ("status", "beep", "clean", "next", "soap")
+K_STATUS, K_BEEP, K_CLEAN, K_NEXT, K_SOAP = range(5)
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+TICKS_MASK = 0x3FFFFFFF     # ticks_ms() wraps at 2**30 on the ESP32
+
+
+def _record():
+    return np.dtype([("t", "<i8"), ("node", "<u2"), ("kind", "u1"),
+                     ("pad", "u1"), ("value", "<i4")])
+
+
+class Events:
+    """Columnar event log, sorted by (node, t) with ties in input order"""
+
+    def __init__(self, t, node, kind, value, nodes, names):
+        order = np.lexsort((t, node))
+        self.t = np.asarray(t, np.int64)[order]
+        self.node = np.asarray(node, np.int32)[order]
+        self.kind = np.asarray(kind, np.uint8)[order]
+        self.value = np.asarray(value, np.int64)[order]
+        self.nodes = list(nodes)    # node index -> label
+        self.names = list(names)    # value of clean/next events -> name
+
+    def __len__(self):
+        return len(self.t)
+
+
+# Loading and saving
+class _Tables:
+    """Node labels and person names shared by every input file"""
+
+    def __init__(self):
+        self.nodes = []
+        self.names = []
+        self._node = {}
+        self._name = {}
+
+    def node(self, label):
+        i = self._node.get(label)
+        if i is None:
+            i = self._node[label] = len(self.nodes)
+            self.nodes.append(label)
+        return i
+
+    def name(self, name):
+        i = self._name.get(name)
+        if i is None:
+            i = self._name[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+
+def _load_jsonl(path, tables):
+    kind_of = {k: i for i, k in enumerate(KINDS)}
+    t, node, kind, value = [], [], [], []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            e = json.loads(line)
+            k = kind_of.get(e["kind"])
+            if k is None:
+                continue
+            v = e["value"]
+            if k == K_STATUS:
+                v = STATUS_NAMES.index(v)
+            elif k == K_BEEP:
+                v = BEEP_NAMES.index(v)
+            elif k == K_CLEAN or k == K_NEXT:
+                v = tables.name(v)
+            t.append(e["t"])
+            node.append(tables.node(e["node"]))
+            kind.append(k)
+            value.append(v)
+    return (np.array(t, np.int64), np.array(node, np.int64),
+            np.array(kind, np.int64), np.array(value, np.int64))
+
+
+def _load_dde(path, tables):
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != MAGIC:
+        raise ValueError("%s: not a DishDuty event dump" % path)
+    n = int.from_bytes(data[4:8], "little")
+    head = json.loads(data[8:8 + n])
+    rec = np.frombuffer(data, _record(), offset=8 + n)
+    node_map = np.array([tables.node(x) for x in head["nodes"]] or [0], np.int64)
+    name_map = np.array([tables.name(x) for x in head["names"]] or [0], np.int64)
+    kind = rec["kind"].astype(np.int64)
+    value = rec["value"].astype(np.int64)
+    named = (kind == K_CLEAN) | (kind == K_NEXT)
+    value[named] = name_map[value[named]]
+    return rec["t"].astype(np.int64), node_map[rec["node"]], kind, value
+
+
+def load(paths):
+    """One Events from .jsonl and .dde files"""
+    tables = _Tables()
+    cols = [[], [], [], []]
+    for path in paths:
+        loader = _load_dde if path.endswith(".dde") else _load_jsonl
+        for c, a in zip(cols, loader(path, tables)):
+            c.append(a)
+    cols = [np.concatenate(c) if c else np.zeros(0, np.int64) for c in cols]
+    return Events(*cols, tables.nodes, tables.names)
+
+
+def save_dde(path, ev):
+    rec = np.zeros(len(ev), _record())
+    rec["t"] = ev.t
+    rec["node"] = ev.node
+    rec["kind"] = ev.kind
+    rec["value"] = ev.value
+    head = json.dumps({"nodes": ev.nodes, "names": ev.names}).encode()
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(head).to_bytes(4, "little"))
+        f.write(head)
+        f.write(rec.tobytes())
+
+
+def save_jsonl(path, ev, limit=None):
+    n = len(ev) if limit is None else min(limit, len(ev))
+    with open(path, "w") as f:
+        for t, node, kind, value in zip(ev.t[:n].tolist(), ev.node[:n].tolist(),
+                                        ev.kind[:n].tolist(), ev.value[:n].tolist()):
+            if kind == K_STATUS:
+                value = STATUS_NAMES[value]
+            elif kind == K_BEEP:
+                value = BEEP_NAMES[value]
+            elif kind == K_CLEAN or kind == K_NEXT:
+                value = ev.names[value]
+            f.write(json.dumps({"node": ev.nodes[node], "t": t,
+                                "kind": KINDS[kind], "value": value}))
+            f.write("\n")
+
+
+def collect(url, path, label, every=10.0, polls=None):
+    """Poll a sensor node's /api/history and append its events to path
+
+    The node stamps events with ticks_ms(); its reply carries the current
+    ticks as "now", so each event gets the wall time it happened at rather
+    than the time it was fetched. A node that rebooted (seq went back) is
+    read again from the start of its history.
+    """
+    base = url.rstrip("/") + "/api/history?since=%d"
+    since = 0
+    n = 0
+    with open(path, "a") as out:
+        while polls is None or n < polls:
+            n += 1
+            with urllib.request.urlopen(base % since, timeout=10) as r:
+                doc = json.loads(r.read())
+            wall = int(time.time() * 1000)
+            if doc["seq"] < since:
+                since = 0
+                continue
+            for e in doc["events"]:
+                age = (doc["now"] - e["t"]) & TICKS_MASK
+                out.write(json.dumps({"node": label, "t": wall - age,
+                                      "kind": e["kind"], "value": e["value"]}))
+                out.write("\n")
+            out.flush()
+            since = doc["seq"]
+            time.sleep(every)
+
+
+# Statistics
+class Stats:
+    """What report() prints; arrays are per alert, person or hour"""
+
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+
+def _origin(ev, tz_ms):
+    """Local midnight (as unix ms) before the first event"""
+    return (int(ev.t.min()) + tz_ms) // DAY_MS * DAY_MS - tz_ms
+
+
+def _binned(a, b, width):
+    """(first bin, length of [a, b) intervals falling in each bin)
+
+    Total covered length left of x is F(x) = sum over a < x of (x - a)
+    minus sum over b < x of (x - b); with a and b sorted that is two
+    searchsorted lookups into prefix sums per bin edge.
+    """
+    k0 = int(a.min()) // width
+    k1 = -(-int(b.max()) // width)
+    edges = np.arange(k0, k1 + 1, dtype=np.int64) * width
+    base = edges[0]
+    x = edges - base
+    total = np.zeros(len(edges), np.int64)
+    for ends, sign in ((np.sort(a), 1), (np.sort(b), -1)):
+        pre = np.concatenate(([0], np.cumsum(ends - base)))
+        i = np.searchsorted(ends, edges)
+        total += sign * (i * x - pre[i])
+    return k0, np.diff(total)
+
+
+def analyse(ev, period_days=30, tz_hours=0.0):
+    t, node, kind, value = ev.t, ev.node, ev.kind, ev.value
+    n = len(t)
+    tz = int(tz_hours * HOUR_MS)
+    origin = _origin(ev, tz)
+    names = len(ev.names)
+
+    # cleans per person per period
+    clean = np.flatnonzero(kind == K_CLEAN)
+    period = (t[clean] - origin) // (period_days * DAY_MS)
+    periods = int(period.max()) + 1 if len(clean) else 0
+    fairness = np.bincount(period * names + value[clean],
+                           minlength=periods * names).reshape(periods, names)
+
+    # alert starts: a status event off GREEN after GREEN (or first seen)
+    st = np.flatnonzero(kind == K_STATUS)
+    sv, sn = value[st], node[st]
+    after_green = np.ones(len(st), bool)
+    after_green[1:] = (sv[:-1] == GREEN) | (sn[:-1] != sn[1:])
+    starts = st[(sv != GREEN) & after_green]
+
+    # each start's clean is the first clean after it, on the same node and
+    # before that node's next start
+    i = np.searchsorted(clean, starts)
+    pc = clean[np.minimum(i, len(clean) - 1)] if len(clean) else starts
+    nxt = np.append(starts[1:], n)
+    ok = (i < len(clean)) & (pc < nxt) & (node[pc] == node[starts])
+    ps, pc = starts[ok], pc[ok]
+    # soap logged between the two: prefix sums over the soap events only
+    sp = np.flatnonzero(kind == K_SOAP)
+    soap = np.concatenate(([0], np.cumsum(value[sp])))
+    soap_mg = soap[np.searchsorted(sp, pc)] - soap[np.searchsorted(sp, ps)]
+
+    # dirty intervals: a status off GREEN until the node's next status, or
+    # its last event
+    last = np.append(np.flatnonzero(node[1:] != node[:-1]), n - 1)
+    node_end = np.zeros(len(ev.nodes), np.int64)
+    node_end[node[last]] = t[last]
+    end = node_end[sn]
+    same = np.zeros(len(st), bool)
+    same[:-1] = sn[:-1] == sn[1:]
+    end[same] = t[st[1:]][same[:-1]]
+    dirty = sv != GREEN
+    hourly = np.zeros(24 * 7, np.int64)
+    if dirty.any():
+        k0, ms = _binned(t[st][dirty] + tz, end[dirty] + tz, HOUR_MS)
+        k = np.arange(k0, k0 + len(ms))
+        # 1970-01-01 was a Thursday
+        slot = ((k // 24 + 3) % 7) * 24 + k % 24
+        hourly = np.bincount(slot, weights=ms, minlength=24 * 7).astype(np.int64)
+
+    return Stats(origin=origin, period_days=period_days, fairness=fairness,
+                 alerts=len(starts), latency=t[pc] - t[ps],
+                 soap=soap_mg, cleaner=value[pc],
+                 dirty=hourly.reshape(7, 24),
+                 days=-(-(int(t.max()) - origin) // DAY_MS) if n else 0)
+
+
+def analyse_naive(ev, period_days=30, tz_hours=0.0):
+    """analyse() as one Python loop over the records, for bench"""
+    tz = int(tz_hours * HOUR_MS)
+    origin = _origin(ev, tz)
+    period_ms = period_days * DAY_MS
+    fairness = {}
+    latency, soap, cleaner = [], [], []
+    alerts = 0
+    by_hour = {}
+
+    def add_dirty(a, b):
+        a += tz
+        b += tz
+        while a < b:
+            k = a // HOUR_MS
+            e = min(b, (k + 1) * HOUR_MS)
+            by_hour[k] = by_hour.get(k, 0) + e - a
+            a = e
+
+    cur = None
+    status = since = open_t = None
+    open_soap = 0
+    last_t = None
+    rows = zip(ev.t.tolist(), ev.node.tolist(), ev.kind.tolist(),
+               ev.value.tolist())
+    for t, node, kind, value in rows:
+        if node != cur:
+            if status is not None and status != GREEN:
+                add_dirty(since, last_t)
+            cur = node
+            status = open_t = None
+        last_t = t
+        if kind == K_STATUS:
+            if status is not None and status != GREEN:
+                add_dirty(since, t)
+            if value != GREEN and (status is None or status == GREEN):
+                alerts += 1
+                open_t = t
+                open_soap = 0
+            status = value
+            since = t
+        elif kind == K_SOAP:
+            if open_t is not None:
+                open_soap += value
+        elif kind == K_CLEAN:
+            key = ((t - origin) // period_ms, value)
+            fairness[key] = fairness.get(key, 0) + 1
+            if open_t is not None:
+                latency.append(t - open_t)
+                soap.append(open_soap)
+                cleaner.append(value)
+                open_t = None
+    if status is not None and status != GREEN:
+        add_dirty(since, last_t)
+
+    periods = max([p for p, _ in fairness], default=-1) + 1
+    fair = [[fairness.get((p, w), 0) for w in range(len(ev.names))]
+            for p in range(periods)]
+    dirty = [[0] * 24 for _ in range(7)]
+    for k, ms in by_hour.items():
+        dirty[(k // 24 + 3) % 7][k % 24] += ms
+    return Stats(origin=origin, period_days=period_days, fairness=fair,
+                 alerts=alerts, latency=latency, soap=soap, cleaner=cleaner,
+                 dirty=dirty)
+
+
+def same_stats(a, b):
+    return (a.alerts == b.alerts
+            and all(np.array_equal(getattr(a, k), getattr(b, k))
+                    for k in ("fairness", "latency", "soap", "cleaner", "dirty")))
+
+
+def jain(counts):
+    """Jain's fairness index of each row"""
+    c = np.asarray(counts, np.float64)
+    sq = (c * c).sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        j = c.sum(axis=-1) ** 2 / (c.shape[-1] * sq)
+    return np.where(sq > 0, j, 1.0)
+
+
+def _by_group(group, vals, groups):
+    """(count, median, p90, mean) of vals per group"""
+    order = np.lexsort((vals, group))
+    g, v = group[order], vals[order]
+    lo = np.searchsorted(g, np.arange(groups))
+    cnt = np.bincount(g, minlength=groups)
+    nz = np.maximum(cnt, 1)
+    med = v[np.minimum(lo + (nz - 1) // 2, len(v) - 1)] if len(v) else cnt * 0
+    p90 = v[np.minimum(lo + (nz - 1) * 9 // 10, len(v) - 1)] if len(v) else cnt * 0
+    mean = np.bincount(g, weights=v, minlength=groups) / nz
+    return cnt, np.where(cnt > 0, med, 0), np.where(cnt > 0, p90, 0), mean
+
+
+def _date(ms):
+    return time.strftime("%Y-%m-%d", time.gmtime(ms / 1000))
+
+
+def report(ev, st, out=sys.stdout):
+    w = out.write
+    people = ev.names
+    np_ = len(people)
+    w("%d events from %d node(s), %s .. %s (%d days)\n\n"
+      % (len(ev), len(ev.nodes), _date(st.origin),
+         _date(st.origin + (st.days - 1) * DAY_MS), st.days))
+
+    w("cleans per %d days\n" % st.period_days)
+    w("%-10s " % "from" + "".join("%9s" % p[:9] for p in people)
+      + " %9s %6s\n" % ("total", "Jain"))
+    fair = np.asarray(st.fairness).reshape(-1, np_)
+    for p, row in enumerate(fair):
+        w("%-10s " % _date(st.origin + p * st.period_days * DAY_MS)
+          + "".join("%9d" % c for c in row)
+          + " %9d %6.3f\n" % (row.sum(), jain(row)))
+    total = fair.sum(axis=0)
+    w("%-10s " % "all" + "".join("%9d" % c for c in total)
+      + " %9d %6.3f\n\n" % (total.sum(), jain(total)))
+
+    lat = np.asarray(st.latency, np.int64)
+    soap = np.asarray(st.soap, np.int64)
+    who = np.asarray(st.cleaner, np.int64)
+    w("alerts: %d, resolved by a clean: %d (%.0f%%)\n"
+      % (st.alerts, len(lat), 100.0 * len(lat) / max(1, st.alerts)))
+    w("%-10s %7s | %-22s | %-20s\n" % ("cleaner", "cleans", "alert->clean min p50 p90",
+                                      "soap g p50 mean none"))
+    rows = [("all", np.zeros(len(lat), np.int64), 1)] + [
+        (p, who, np_) for p in people]
+    for i, (label, group, groups) in enumerate(rows):
+        k = 0 if i == 0 else i - 1
+        cnt, lmed, lp90, _ = _by_group(group, lat, groups)
+        _, smed, _, smean = _by_group(group, soap, groups)
+        none = np.bincount(group[soap == 0], minlength=groups)
+        w("%-10s %7d | %10.1f %11.1f | %6.1f %6.1f %5.0f%%\n"
+          % (label[:10], cnt[k], lmed[k] / 60000, lp90[k] / 60000,
+             smed[k] / 1000, smean[k] / 1000, 100.0 * none[k] / max(1, cnt[k])))
+
+    dirty = np.asarray(st.dirty, np.int64)
+    per_hour = dirty.sum(axis=0) / max(1, st.days) / 60000
+    w("\ndirty sink-minutes per day, by local hour\n")
+    top = per_hour.max() or 1
+    for h in range(24):
+        w("  %02d:00 %7.1f %s\n" % (h, per_hour[h], "#" * int(40 * per_hour[h] / top)))
+    weeks = max(1, st.days / 7)
+    flat = dirty.reshape(-1)
+    w("busiest hours of the week\n")
+    for s in np.argsort(-flat, kind="stable")[:5]:
+        w("  %s %02d:00 %7.0f min/week\n" % (WEEKDAYS[s // 24], s % 24,
+                                              flat[s] / weeks / 60000))
+
+
+# Synthetic history
+PEOPLE = ("Svanik", "Paul", "Pranav")
+# share of dish episodes starting in each local hour: meals and late snacks
+HOUR_WEIGHT = (1, 0, 0, 0, 0, 0, 2, 8, 10, 5, 2, 3,
+               9, 8, 3, 2, 2, 4, 8, 12, 11, 7, 4, 2)
+START_MS = 1735689600000    # 2025-01-01 00:00 UTC
+
+
+def synth(nodes=50, days=365, episodes=12, seed=1, start_ms=START_MS):
+    """Event history of nodes sinks, shaped like the sensor node's
+
+    Per dish episode: S YELLOW, then usually S RED and B GRACE; then
+    mostly soap, R, N, S GREEN and B OFF at the clean, else S GREEN once
+    the dishes go away unscanned. Who cleans drifts over the months.
+    """
+    rng = np.random.default_rng(seed)
+    per_node = days * episodes
+    e = nodes * per_node
+    node = np.repeat(np.arange(nodes), per_node)
+    day = np.tile(np.repeat(np.arange(days), episodes), nodes)
+    p = np.array(HOUR_WEIGHT, np.float64)
+    hour = rng.choice(24, e, p=p / p.sum())
+    t0 = start_ms + day * DAY_MS + hour * HOUR_MS + rng.integers(0, HOUR_MS, e)
+    order = np.lexsort((t0, node))
+    t0 = t0[order]
+    day = (t0 - start_ms) // DAY_MS
+    gap = np.full(e, DAY_MS, np.int64)
+    gap[:-1] = np.where(node[1:] == node[:-1], t0[1:] - t0[:-1], DAY_MS)
+
+    dur = np.minimum(rng.lognormal(np.log(12 * 60000), 0.8, e).astype(np.int64),
+                     gap * 9 // 10)
+    dur = np.maximum(dur, 3)
+    red = rng.random(e) < 0.8
+    t_red = t0 + np.minimum(rng.integers(5000, 120000, e), dur // 3)
+    cleaned = rng.random(e) < 0.9
+    soaped = cleaned & (rng.random(e) < 0.92)
+    t1 = t0 + dur
+    t_soap = t1 - np.maximum(1, np.minimum(rng.integers(5000, 60000, e), dur // 3))
+    soap_mg = np.maximum(500, rng.normal(6000, 1500, e)).astype(np.int64)
+
+    # each person's share swings on a ~quarterly cycle
+    phase = rng.uniform(0, 2 * np.pi, len(PEOPLE))
+    share = 1 + 0.6 * np.sin(2 * np.pi * day[:, None] / 91 + phase)
+    cum = np.cumsum(share / share.sum(axis=1, keepdims=True), axis=1)
+    who = (rng.random(e)[:, None] > cum).sum(axis=1)
+    nxt = (who + 1 + rng.integers(0, len(PEOPLE) - 1, e)) % len(PEOPLE)
+
+    one = np.ones(e, bool)
+    slots = (   # (when, kind, value, present)
+        (t0, K_STATUS, 1, one),
+        (t_red, K_STATUS, 2, red),
+        (t_red, K_BEEP, 1, red),
+        (t_soap, K_SOAP, soap_mg, soaped),
+        (t1, K_CLEAN, who, cleaned),
+        (t1, K_NEXT, nxt, cleaned),
+        (t1, K_STATUS, 0, one),
+        (t1, K_BEEP, 0, red),
+    )
+    cols = [np.stack([np.broadcast_to(x, e) for x in c], axis=1)
+            for c in zip(*slots)]
+    keep = cols[3].reshape(-1).astype(bool)
+    t, kind, value = (c.reshape(-1)[keep] for c in cols[:3])
+    node_col = np.repeat(node, len(slots))[keep]
+    return Events(t, node_col, kind, value,
+                  ["Sink %02d" % i for i in range(nodes)], PEOPLE)
+
+
+JSONL_BENCH = 200000
+
+
+def _timed(fn, *args, **kw):
+    t0 = time.perf_counter()
+    r = fn(*args, **kw)
+    return r, time.perf_counter() - t0
+
+
+def cmd_synth(args):
+    ev = synth(args.nodes, args.days, args.episodes, args.seed)
+    save_dde(args.out, ev)
+    print("%s: %d events, %d nodes, %d days (%.1f MB)"
+          % (args.out, len(ev), args.nodes, args.days, os.path.getsize(args.out) / 1e6))
+
+
+def cmd_report(args):
+    ev, t_load = _timed(load, args.files)
+    if not len(ev):
+        sys.exit("no events")
+    st, t_stats = _timed(analyse, ev, args.period, args.tz)
+    report(ev, st)
+    print("\nloaded in %.2f s, analysed in %.2f s" % (t_load, t_stats))
+
+
+def cmd_bench(args):
+    ev, t_synth = _timed(synth, args.nodes, args.days, args.episodes, args.seed)
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "bench.dde")
+        save_dde(path, ev)
+        ev, t_load = _timed(load, [path])
+        # JSON lines are parsed per record, time a slice of them
+        path = os.path.join(d, "bench.jsonl")
+        save_jsonl(path, ev, JSONL_BENCH)
+        part, t_json = _timed(load, [path])
+    fast, t_fast = _timed(analyse, ev, args.period, args.tz)
+    slow, t_slow = _timed(analyse_naive, ev, args.period, args.tz)
+    same = same_stats(fast, slow)
+    print("%d events, %d nodes, %d days (synth %.2f s, load %.2f s)"
+          % (len(ev), len(ev.nodes), args.days, t_synth, t_load))
+    print("ingest .jsonl   %8.0f events/s, .dde %.0f events/s"
+          % (len(part) / t_json, len(ev) / t_load))
+    print("per-record loop %8.2f s  %10.0f events/s" % (t_slow, len(ev) / t_slow))
+    print("vectorized      %8.2f s  %10.0f events/s  (%.0fx)"
+          % (t_fast, len(ev) / t_fast, t_slow / t_fast))
+    print("same results:   %s" % ("yes" if same else "NO"))
+    return 0 if same else 1
+
+
+def cmd_collect(args):
+    collect(args.url, args.out, args.node, args.every)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m sim.analytics")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    def stats_args(a):
+        a.add_argument("--period", type=int, default=30, help="days per fairness row")
+        a.add_argument("--tz", type=float, default=0.0,
+                       help="local time offset from UTC in hours")
+
+    def synth_args(a, days):
+        a.add_argument("--nodes", type=int, default=50)
+        a.add_argument("--days", type=int, default=days)
+        a.add_argument("--episodes", type=int, default=12, help="per node and day")
+        a.add_argument("--seed", type=int, default=1)
+
+    a = sub.add_parser("collect", help="poll a node's /api/history into a .jsonl")
+    a.add_argument("url")
+    a.add_argument("out")
+    a.add_argument("--node", required=True, help="label for this node's events")
+    a.add_argument("--every", type=float, default=10.0, help="seconds between polls")
+    a.set_defaults(fn=cmd_collect)
+    a = sub.add_parser("synth", help="write a synthetic .dde history")
+    a.add_argument("out")
+    synth_args(a, 365)
+    a.set_defaults(fn=cmd_synth)
+    a = sub.add_parser("report")
+    a.add_argument("files", nargs="+")
+    stats_args(a)
+    a.set_defaults(fn=cmd_report)
+    a = sub.add_parser("bench", help="vectorized vs per-record loop")
+    synth_args(a, 365)
+    stats_args(a)
+    a.set_defaults(fn=cmd_bench)
+    args = p.parse_args(argv)
+    if np is None:
+        sys.exit("sim.analytics needs numpy (pip install numpy)")
+    return args.fn(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
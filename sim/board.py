@@ -0,0 +1,309 @@
+# sim/board.py - machine.Pin/SPI/I2C/Timer stand-ins for one simulated node
+#
+# Every bus operation charges virtual time to the running node and bumps
+# the counters in Board.stats, so driver costs can be read straight off a
+# simulation run.
+
+import types
+
+
+class BusStats:
+    __slots__ = ("pin_reads", "pin_writes", "pin_toggles",
+                 "spi_transactions", "spi_bytes", "spi_us",
+                 "i2c_transactions", "i2c_bytes", "i2c_us")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        for k in self.__slots__:
+            setattr(self, k, 0)
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+# Costs of one Python-level bus operation on an ESP32 running MicroPython
+PIN_OP_US = 2
+SPI_CALL_US = 12
+I2C_CALL_US = 40
+# A pin polled in a tight loop is fast-forwarded in steps of at most this
+SPIN_STEP_US = 1000
+
+
+class Board:
+    def __init__(self, node):
+        self.node = node
+        self.sched = node.sched
+        self.values = {}
+        self.inputs = {}
+        self.listeners = {}
+        self.stats = BusStats()
+        self.spi_devices = []
+        self.i2c_devices = {}
+        self.timers = []
+        self.freq_hz = 160000000
+        self._last_read = None
+
+    # Pin level plumbing used by device models
+    def drive(self, pin_id, source):
+        """source(t_us) -> (level, next_change_us or None)"""
+        self.inputs[pin_id] = source
+
+    def listen(self, pin_id, fn):
+        self.listeners.setdefault(pin_id, []).append(fn)
+
+    def level(self, pin_id):
+        return self.values.get(pin_id, 0)
+
+    def read_pin(self, pin_id):
+        st = self.stats
+        st.pin_reads += 1
+        src = self.inputs.get(pin_id)
+        now = self.sched.now()
+        if src is None:
+            self._last_read = None
+            self.sched.spend(PIN_OP_US)
+            return self.values.get(pin_id, 0)
+        if self._last_read == pin_id:
+            # busy-wait on an input: jump towards its next edge instead of
+            # charging thousands of 2 us reads one by one
+            level, nxt = src(now)
+            step = SPIN_STEP_US
+            if nxt is not None and nxt - now < step:
+                step = max(PIN_OP_US, nxt - now)
+            self.sched.spend(step)
+        else:
+            self._last_read = pin_id
+            self.sched.spend(PIN_OP_US)
+        level, nxt = src(self.sched.now())
+        return level
+
+    def write_pin(self, pin_id, v):
+        st = self.stats
+        st.pin_writes += 1
+        self._last_read = None
+        v = 1 if v else 0
+        old = self.values.get(pin_id, 0)
+        self.values[pin_id] = v
+        if old != v:
+            st.pin_toggles += 1
+        self.sched.spend(PIN_OP_US)
+        for fn in self.listeners.get(pin_id, ()):
+            fn(v, self.sched.now())
+
+    def run_timers(self):
+        now_ms = self.sched.now() // 1000
+        for t in self.timers:
+            t._due(now_ms)
+
+    def machine_module(self):
+        board = self
+        m = types.ModuleType("machine")
+
+        class Pin:
+            IN = 1
+            OUT = 3
+            OPEN_DRAIN = 7
+            PULL_UP = 1
+            PULL_DOWN = 2
+            IRQ_RISING = 1
+            IRQ_FALLING = 2
+
+            def __init__(self, id, mode=-1, pull=-1, value=None):
+                self.id = id
+                self.mode = mode
+                if value is not None:
+                    board.write_pin(id, value)
+
+            def init(self, mode=-1, pull=-1, value=None):
+                if value is not None:
+                    board.write_pin(self.id, value)
+
+            def value(self, v=None):
+                if v is None:
+                    return board.read_pin(self.id)
+                board.write_pin(self.id, v)
+
+            def __call__(self, v=None):
+                return self.value(v)
+
+            def on(self):
+                board.write_pin(self.id, 1)
+
+            def off(self):
+                board.write_pin(self.id, 0)
+
+            def irq(self, handler=None, trigger=3):
+                return None
+
+            def __repr__(self):
+                return "Pin(%s)" % self.id
+
+        class SPI:
+            MSB = 0
+            LSB = 1
+
+            def __init__(self, id, baudrate=1000000, polarity=0, phase=0,
+                         bits=8, firstbit=0, sck=None, mosi=None, miso=None):
+                self.id = id
+                self.baudrate = baudrate
+
+            def init(self, baudrate=None, **kw):
+                if baudrate:
+                    self.baudrate = baudrate
+
+            def deinit(self):
+                pass
+
+            def _xfer(self, out, n):
+                st = board.stats
+                st.spi_transactions += 1
+                st.spi_bytes += n
+                us = SPI_CALL_US + (n * 8 * 1000000) // self.baudrate
+                st.spi_us += us
+                board._last_read = None
+                board.sched.spend(us)
+                res = bytearray(n)
+                for dev in board.spi_devices:
+                    if dev.selected():
+                        r = dev.transfer(out if out is not None else bytes(n))
+                        if r is not None:
+                            res[:] = r[:n]
+                return res
+
+            def write(self, buf):
+                self._xfer(bytes(buf), len(buf))
+
+            def read(self, n, write=0x00):
+                return bytes(self._xfer(bytes([write]) * n, n))
+
+            def readinto(self, buf, write=0x00):
+                buf[:] = self._xfer(bytes([write]) * len(buf), len(buf))
+
+            def write_readinto(self, wbuf, rbuf):
+                rbuf[:] = self._xfer(bytes(wbuf), len(wbuf))
+
+        class I2C:
+            def __init__(self, id=0, scl=None, sda=None, freq=400000):
+                self.id = id
+                self.freq = freq
+
+            def _cost(self, n):
+                st = board.stats
+                st.i2c_transactions += 1
+                st.i2c_bytes += n
+                # address byte + data, 9 clocks per byte with the ACK bit
+                us = I2C_CALL_US + ((n + 1) * 9 * 1000000) // self.freq
+                st.i2c_us += us
+                board._last_read = None
+                board.sched.spend(us)
+
+            def scan(self):
+                self._cost(0)
+                return sorted(board.i2c_devices)
+
+            def writeto(self, addr, buf, stop=True):
+                self._cost(len(buf))
+                dev = board.i2c_devices.get(addr)
+                if dev is None:
+                    raise OSError(19)   # ENODEV, the real port says the same
+                dev.write(bytes(buf))
+                return 1
+
+            def writevto(self, addr, bufs, stop=True):
+                data = b"".join(bytes(b) for b in bufs)
+                return self.writeto(addr, data, stop)
+
+            def readfrom(self, addr, n, stop=True):
+                self._cost(n)
+                dev = board.i2c_devices.get(addr)
+                if dev is None:
+                    raise OSError(19)
+                return dev.read(n)
+
+        SoftI2C = I2C
+
+        class Timer:
+            ONE_SHOT = 0
+            PERIODIC = 1
+
+            def __init__(self, id=-1, **kw):
+                self.callback = None
+                self.period = 0
+                self.mode = 1
+                self.next_ms = None
+                board.timers.append(self)
+                if kw:
+                    self.init(**kw)
+
+            def init(self, mode=1, period=1000, callback=None, freq=None):
+                if freq:
+                    period = 1000 // freq
+                self.mode = mode
+                self.period = period
+                self.callback = callback
+                self.next_ms = board.sched.now() // 1000 + period
+
+            def deinit(self):
+                self.next_ms = None
+
+            def _due(self, now_ms):
+                while self.next_ms is not None and now_ms >= self.next_ms:
+                    if self.mode == Timer.PERIODIC:
+                        self.next_ms += self.period
+                    else:
+                        self.next_ms = None
+                    if self.callback:
+                        self.callback(self)
+
+        class UART:
+            def __init__(self, id, baudrate=115200, **kw):
+                self.id = id
+                self.baudrate = baudrate
+
+            def write(self, buf):
+                board.sched.spend(len(buf) * 10 * 1000000 // self.baudrate)
+                return len(buf)
+
+            def any(self):
+                return 0
+
+            def read(self, n=-1):
+                return None
+
+        def freq(hz=None):
+            if hz is None:
+                return board.freq_hz
+            board.freq_hz = hz
+            board.node.on_freq(hz)
+
+        def lightsleep(ms=None):
+            board.node.on_lightsleep(ms)
+
+        def deepsleep(ms=None):
+            board.node.on_lightsleep(ms)
+
+        def reset():
+            raise SystemExit("machine.reset()")
+
+        def unique_id():
+            return bytes(board.node.mac)
+
+        def idle():
+            board.sched.spend(PIN_OP_US)
+
+        m.Pin = Pin
+        m.SPI = SPI
+        m.SoftSPI = SPI
+        m.I2C = I2C
+        m.SoftI2C = SoftI2C
+        m.Timer = Timer
+        m.UART = UART
+        m.freq = freq
+        m.lightsleep = lightsleep
+        m.deepsleep = deepsleep
+        m.reset = reset
+        m.unique_id = unique_id
+        m.idle = idle
+        return m
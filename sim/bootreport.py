@@ -0,0 +1,344 @@
+# sim/bootreport.py - how long the sensor node takes to become useful
+#
+#   python -m sim.bootreport weight                  # this checkout
+#   python -m sim.bootreport weight --before HEAD~1  # A/B against a revision
+#   python -m sim.bootreport net --before HEAD~1
+#   python -m sim.bootreport components [--before REV]
+#
+# weight: time from power-up to the first loop pass whose weight reading is
+# within VALID_G of what is really on the scale. Four boots: a cold first
+# boot (empty flash) and a warm reboot (flash kept from a previous run),
+# each with the scale empty and with the soap bottle already standing on
+# it. In the bottle-on cases someone lifts the bottle at LIFT_AT_S for a
+# few seconds and puts it back, which is when a wrong tare can be noticed.
+#
+# net: time from power-up to the first weight reading and to the first
+# answered GET /api/state (the station has an IP and the loop serves HTTP),
+# plus the connect() calls made on the way. Boots: cold (empty flash),
+# warm (flash from a previous run), soft reset (the Wi-Fi association
+# survived, flash kept) and an access point that only comes up after
+# AP_DOWN_S.
+#
+# components: both nodes at bus fidelity, cold and warm, plus a notifier
+# whose OLED is missing. Prints each node's per-component boot report
+# (components.py) with the critical path marked and fails (exit status 1)
+# if a node takes longer than its STARTUP_BUDGET_MS from reset to its main
+# loop or a component other than the missing display fails.
+
+import argparse, shutil, sys, tempfile
+
+from . import Simulation, AccessPoint, firmware_tree, decode_chunked
+from .dishduty import DishDuty, Sink, BOTTLE_G
+
+VALID_G = 2.0
+LIFT_AT_S = 60
+LIMIT_S = 120
+ST_WEIGHT = 2   # mainsensor.ST_WEIGHT
+PASS_US = 1000000
+NET_LIMIT_S = 60
+AP_DOWN_S = 20
+SETTLE_S = 5
+STARTUP_BUDGET_MS = {"sensor": 1500, "notifier": 500}
+
+
+def first_valid_weight(dd, limit_s=LIMIT_S, step_s=0.05):
+    """(s to first reading, s to first valid reading or None)
+
+    A reading only counts while what is on the scale did not change during
+    the pass that took it. The node keeps running to limit_s either way so
+    whatever it saves to flash is there for the next boot.
+    """
+    sim = dd.sim
+    end = int(limit_s * 1000000)
+    seen = 0
+    first = valid = None
+    while sim.now_us < end:
+        sim.run_for(step_s)
+        stats = dd.sensor.g("stats")
+        if stats is None:
+            continue
+        n = stats.stages[ST_WEIGHT].count
+        if n == seen:
+            continue
+        seen = n
+        if first is None:
+            first = sim.now_us / 1e6
+        if valid is not None:
+            continue
+        w = dd.sensor.g("weight")
+        if isinstance(w, int):
+            w /= 1000       # mg since the fixed-point weight path
+        truth = dd.sink.grams(sim.now_us)
+        if (abs(w - truth) < VALID_G
+                and dd.sink.grams(max(0, sim.now_us - PASS_US)) == truth):
+            valid = sim.now_us / 1e6
+    return first, valid
+
+
+def boot(repo, fs, bottle_on):
+    sink = Sink(bottle_on_us=0 if bottle_on else 10 ** 15)
+    if bottle_on:
+        sink.soap(LIFT_AT_S * 1000000, 0.0, lift_us=5000000)
+    dd = DishDuty(fidelity="fast", sensor_fs=fs, repo=repo, sink=sink)
+    try:
+        return first_valid_weight(dd)
+    finally:
+        dd.close()
+
+
+def run_weight(repo):
+    """Results for the four boots: {(warm, bottle_on): (first, valid)}"""
+    out = {}
+    for bottle_on in (False, True):
+        fs = tempfile.mkdtemp(prefix="dishduty-flash-")
+        try:
+            # cold boot on empty flash; let it run long enough to have
+            # saved whatever it persists, then reboot on the same flash
+            out[(False, bottle_on)] = boot(repo, fs, bottle_on)
+            out[(True, bottle_on)] = boot(repo, fs, bottle_on)
+        finally:
+            shutil.rmtree(fs, ignore_errors=True)
+    return out
+
+
+def _fmt(r):
+    first, valid = r
+    if valid is None:
+        return "never (first reading %.1f s)" % first if first else "no reading"
+    return "%.1f s" % valid
+
+
+def cmd_weight(args):
+    revs = [("this checkout", None)]
+    if args.before:
+        revs.insert(0, (args.before, firmware_tree(args.before)))
+    results = []
+    for name, repo in revs:
+        results.append((name, run_weight(repo)))
+        if repo:
+            shutil.rmtree(repo, ignore_errors=True)
+
+    print("time to first valid weight (within %.0f g), bottle %.0f g, limit %d s"
+          % (VALID_G, BOTTLE_G, LIMIT_S))
+    print("%-26s" % "boot" + "".join("%-30s" % n for n, _ in results))
+    for warm in (False, True):
+        for bottle_on in (False, True):
+            label = "%s, %s" % ("warm reboot" if warm else "cold boot",
+                                "bottle on" if bottle_on else "scale empty")
+            print("%-26s" % label + "".join(
+                "%-30s" % _fmt(r[(warm, bottle_on)]) for _, r in results))
+
+
+def watch_net(dd, ap_up_s=None, limit_s=NET_LIMIT_S, step_s=0.01):
+    """(s to first weight reading, s to HTTP ready or None, connect() calls)
+
+    ap_up_s: the access point is switched on at this time
+    """
+    sim = dd.sim
+    node = dd.sensor
+    end = int(limit_s * 1000000)
+    first = ready = conn = None
+    while sim.now_us < end and ready is None:
+        sim.run_for(step_s)
+        if ap_up_s is not None and sim.now_us >= ap_up_s * 1000000:
+            sim.ap.up = True
+        stats = node.g("stats")
+        if first is None and stats is not None and stats.stages[ST_WEIGHT].count:
+            first = sim.now_us / 1e6
+        if conn is not None:
+            if not conn.closed:
+                continue
+            if decode_chunked(conn.take())[0] == 200:
+                ready = sim.now_us / 1e6
+            conn = None
+            continue
+        wlan = node.wlan.get(0)
+        if wlan is not None and wlan.isconnected() and 80 in node.listeners:
+            conn = node.http_get("/api/state")
+    wlan = node.wlan.get(0)
+    return first, ready, wlan.connects if wlan is not None else 0
+
+
+def soft_reset(node, ap):
+    """Leave the station associated, as it is after a soft reset"""
+    wlan = node.modules["network"].WLAN(0)
+    wlan.active_ = True
+    wlan.target = ap.ssid
+    wlan.ip = ap.lease()
+    wlan.bssid = ap.bssid
+    wlan.channel_ = ap.channel
+
+
+def boot_net(repo, fs, how):
+    ap = AccessPoint(up=how != "ap-down")
+    sim = Simulation(ap=ap, repo=repo)
+    dd = DishDuty(fidelity="fast", sensor_fs=fs, sim=sim)
+    try:
+        if how == "soft-reset":
+            soft_reset(dd.sensor, ap)
+        r = watch_net(dd, AP_DOWN_S if how == "ap-down" else None)
+        # stay up a while, as a real boot would, so what the node saves once
+        # the link is up (wifi.py's cache) is on flash for the next boot
+        sim.run_for(SETTLE_S)
+        return r
+    finally:
+        dd.close()
+
+
+NET_BOOTS = ("cold", "warm", "soft-reset", "ap-down")
+
+
+def run_net(repo):
+    out = {}
+    fs = tempfile.mkdtemp(prefix="dishduty-flash-")
+    try:
+        for how in NET_BOOTS:
+            out[how] = boot_net(repo, fs, how)
+    finally:
+        shutil.rmtree(fs, ignore_errors=True)
+    return out
+
+
+def cmd_net(args):
+    revs = [("this checkout", None)]
+    if args.before:
+        revs.insert(0, (args.before, firmware_tree(args.before)))
+    results = []
+    for name, repo in revs:
+        results.append((name, run_net(repo)))
+        if repo:
+            shutil.rmtree(repo, ignore_errors=True)
+
+    print("boot -> first weight reading / HTTP ready (GET /api/state) / "
+          "connect() calls; AP down for the first %d s in ap-down" % AP_DOWN_S)
+    print("%-12s" % "boot" + "".join("%-30s" % n for n, _ in results))
+    for how in NET_BOOTS:
+        cols = []
+        for _, r in results:
+            first, ready, connects = r[how]
+            cols.append("%-30s" % ("%s / %s / %d" % (
+                "%.2f s" % first if first is not None else "-",
+                "%.2f s" % ready if ready is not None else "never",
+                connects)))
+        print("%-12s" % how + "".join(cols))
+
+
+def loop_started(node):
+    """The program has reached its main loop (globals set just before it)"""
+    g = node.globals or {}
+    if node.name == "sensor":
+        return "near1" in g
+    return "host" in g
+
+
+def boot_components(repo, fs, oled=True, limit_s=10):
+    """{node name: (ms from reset to main loop or None, comps or None)}"""
+    sim = Simulation(repo=repo)
+    dd = DishDuty(fidelity="bus", sensor_fs=fs, sim=sim, oled=oled)
+    out = {}
+    try:
+        nodes = (dd.sensor, dd.notifier)
+        end = limit_s * 1000000
+        while sim.now_us < end and len(out) < len(nodes):
+            try:
+                sim.run_for(0.001)
+            except RuntimeError as e:
+                # a program died during startup; it never reaches its loop
+                print("  (%s)" % e)
+            for n in nodes:
+                if n.name not in out and loop_started(n):
+                    out[n.name] = sim.now_us // 1000
+                if n.task.done and n.name not in out:
+                    out[n.name] = None
+        return {n.name: (out.get(n.name), n.g("comps")) for n in nodes}
+    finally:
+        dd.close()
+
+
+def print_components(name, loop_ms, comps):
+    if comps is None:
+        print("  %-9s main loop at %s ms" % (name, loop_ms))
+        return
+    path = comps.critical_path()
+    print("  %-9s main loop at %s ms, components %d ms, critical path %s"
+          % (name, loop_ms, comps.total_ms(), " > ".join(path)))
+    for r in comps.report():
+        print("    %s %-10s %-6s %5s -> %5s ms %5s ms  %s%s" % (
+            "*" if r["name"] in path else " ", r["name"], r["state"],
+            r["start_ms"] if r["start_ms"] is not None else "-", r["end_ms"],
+            r["ms"] if r["ms"] is not None else "-",
+            "after " + ", ".join(r["deps"]) if r["deps"] else "",
+            "  (" + r["error"] + ")" if r["error"] else ""))
+
+
+COMPONENT_BOOTS = (("cold", True), ("warm", True), ("no OLED", False))
+
+
+def cmd_components(args):
+    problems = []
+    before = {}
+    if args.before:
+        tree = firmware_tree(args.before)
+        fs = tempfile.mkdtemp(prefix="dishduty-flash-")
+        try:
+            for label, oled in COMPONENT_BOOTS:
+                before[label] = boot_components(tree, fs, oled)
+        finally:
+            shutil.rmtree(fs, ignore_errors=True)
+            shutil.rmtree(tree, ignore_errors=True)
+
+    fs = tempfile.mkdtemp(prefix="dishduty-flash-")
+    try:
+        for label, oled in COMPONENT_BOOTS:
+            res = boot_components(None, fs, oled)
+            print("%s boot%s" % (label, "" if not before else " (%s: %s)" % (
+                args.before, ", ".join(
+                    "%s loop at %s ms" % (n, before[label][n][0])
+                    for n in ("sensor", "notifier")))))
+            for name in ("sensor", "notifier"):
+                loop_ms, comps = res[name]
+                print_components(name, loop_ms, comps)
+                budget = STARTUP_BUDGET_MS[name]
+                if loop_ms is None or loop_ms > budget:
+                    problems.append("%s %s: main loop at %s ms, budget %d ms"
+                                    % (label, name, loop_ms, budget))
+                failed = comps.failed() if comps else []
+                if oled:
+                    expected = []
+                else:
+                    expected = ["display"] if name == "notifier" else []
+                if failed != expected:
+                    problems.append("%s %s: failed components %s, expected %s"
+                                    % (label, name, failed, expected))
+    finally:
+        shutil.rmtree(fs, ignore_errors=True)
+
+    for p in problems:
+        print("FAIL " + p)
+    if problems:
+        sys.exit(1)
+    print("OK: every boot within budget (%s)" % ", ".join(
+        "%s %d ms" % kv for kv in sorted(STARTUP_BUDGET_MS.items())))
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m sim.bootreport")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    a = sub.add_parser("weight")
+    a.add_argument("--before", metavar="REV",
+                   help="also run the firmware at this git revision")
+    a.set_defaults(fn=cmd_weight)
+    a = sub.add_parser("net")
+    a.add_argument("--before", metavar="REV",
+                   help="also run the firmware at this git revision")
+    a.set_defaults(fn=cmd_net)
+    a = sub.add_parser("components")
+    a.add_argument("--before", metavar="REV",
+                   help="also time the firmware at this git revision")
+    a.set_defaults(fn=cmd_components)
+    args = p.parse_args(argv)
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# sim/contention.py - sensor loop timing when everything happens at once
+#
+#   python -m sim.contention                          # this checkout
+#   python -m sim.contention --before HEAD~1 --minutes 10
+#
+# Runs the two-node setup (bus fidelity by default) and piles work onto
+# the sensor node: bursts of one to four dashboard requests every few
+# seconds, and dish episodes with a card scan, soap and a confirmed clean
+# (two flash writes, FLASH_MS each: one that has to erase a sector) every
+# EPISODE_S. The sink is empty between episodes, so every ping is a missed
+# echo that runs into distance_cm()'s timeout.
+#
+# Reported per firmware revision, from the pins and radio the node
+# drives rather than from its own counters:
+#   us gap     worst time between two pings of ultrasonic 1 (due every
+#              INTERVAL_MS, so this is the sensor's worst sampling delay)
+#   rfid gap   worst time between two RFID polls, ignoring the second
+#              after a scan that the firmware deliberately leaves alone
+#   tap        card in the field -> first poll that sees it, worst case
+#   http       dashboard request -> response complete, p50 and worst
+#   pass       slowest loop pass (the node's own /metrics histogram)
+# plus, where the firmware has a loop budget, passes over budget and
+# how often each stage was shed or forced through.
+
+import argparse, random, shutil
+
+from . import firmware_tree
+from .dishduty import DishDuty
+
+BOOT_S = 15.0
+EPISODE_S = 40.0
+FLASH_MS = 60
+PATHS = ("/", "/api/state", "/api/counts", "/api/history", "/metrics")
+POLL_GAP_US = 20000     # transceives closer than this belong to one poll
+HOLD_US = 1000000       # the firmware's pause after reading a card
+NAMES = ("Svanik", "Paul", "Pranav")
+
+
+def load(sim, dd, t0, t1, seed):
+    """Schedule the contention; returns (dashboard conns, tap times)"""
+    sched = sim.sched
+    node = dd.sensor
+    rng = random.Random(seed)
+    conns = []
+    taps = []
+
+    t = t0 + 5000000
+    while t < t1 - 30000000:
+        who = rng.choice(NAMES)
+        dd.sink.dishes(t, True)
+        scan = t + rng.randrange(4, 8) * 1000000
+        dd.sink.tap(scan, who)
+        taps.append(scan)
+        dd.sink.soap(scan + 6000000, rng.uniform(4.0, 9.0))
+        dd.sink.dishes(scan + rng.randrange(14, 20) * 1000000, False)
+        t += int(EPISODE_S * 1000000)
+
+    def dashboards():
+        t = t0
+        while True:
+            t += rng.randrange(3000000, 8000000)
+            if t >= t1:
+                return
+            sched.sleep_until(t)
+            for _ in range(rng.randint(1, 4)):
+                conns.append(node.http_get(rng.choice(PATHS)))
+
+    sched.spawn("dashboards", dashboards, t0)
+    return conns, taps
+
+
+def gaps(times):
+    return [b - a for a, b in zip(times, times[1:])]
+
+
+def run(repo, seconds, fidelity, flash_ms=FLASH_MS, seed=1):
+    dd = DishDuty(fidelity=fidelity, repo=repo)
+    sim = dd.sim
+    dd.sensor.flash_write_us = flash_ms * 1000
+    pings = []
+    polls = []
+
+    dd.sensor.board.listen(32, lambda v, t: pings.append(t) if v else None)
+    card_at = dd.sink.card_at
+
+    def polled(t):
+        if not polls or t - polls[-1][1] > POLL_GAP_US:
+            polls.append([t, t, False])
+        polls[-1][1] = t
+        card = card_at(t)
+        if card is not None:
+            polls[-1][2] = True
+        return card
+    dd.sink.card_at = polled
+    if fidelity == "bus":
+        dd.rfid.card = polled
+
+    sim.run_for(BOOT_S)
+    t0 = sim.now_us
+    t1 = t0 + int(seconds * 1000000)
+    conns, taps = load(sim, dd, t0, t1, seed)
+    counts0 = sum(dd.counts().values())
+    sim.run_until(t1)
+    sim.run_for(5.0)
+
+    pings = [t for t in pings if t0 <= t < t1]
+    polls = [p for p in polls if t0 <= p[0] < t1]
+    rfid_gaps = []
+    for a, b in zip(polls, polls[1:]):
+        gap = b[0] - a[0]
+        if a[2]:
+            gap -= HOLD_US
+        rfid_gaps.append(gap)
+    tap_lat = []
+    for t in taps:
+        seen = next((p[0] for p in polls if p[0] >= t and p[2]), None)
+        if seen is not None:
+            tap_lat.append(seen - t)
+    http = sorted(c.t_closed - c.t_open for c in conns if c.t_closed is not None)
+
+    stats = dd.sensor.g("stats")
+    budget = dd.sensor.g("budget")
+    r = {
+        "us_gap": max(gaps(pings)) if len(pings) > 1 else 0,
+        "rfid_gap": max(rfid_gaps) if rfid_gaps else 0,
+        "tap": max(tap_lat) if tap_lat else 0,
+        "taps_seen": len(tap_lat),
+        "taps": len(taps),
+        "http_p50": http[len(http) // 2] if http else 0,
+        "http_max": http[-1] if http else 0,
+        "http_done": len(http),
+        "http": len(conns),
+        "pass": stats.loop.max_us if stats else 0,
+        "cleans": sum(dd.counts().values()) - counts0,
+        "budget": budget.as_dict() if budget is not None else None,
+    }
+    dd.close()
+    return r
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m sim.contention")
+    p.add_argument("--minutes", type=float, default=5.0)
+    p.add_argument("--fidelity", choices=("bus", "fast"), default="bus")
+    p.add_argument("--flash-ms", type=int, default=FLASH_MS,
+                   help="virtual time one flash file write costs")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--before", metavar="REV",
+                   help="also run the sensor node at this git revision")
+    args = p.parse_args(argv)
+
+    revs = [("this checkout", None)]
+    if args.before:
+        revs.insert(0, (args.before, firmware_tree(args.before)))
+    print("%.0f min of contention, %s fidelity, %d ms flash writes; times "
+          "in ms, worst case unless noted" % (args.minutes, args.fidelity,
+                                               args.flash_ms))
+    print("%-14s | %7s %8s %6s | %8s %8s | %7s | %6s"
+          % ("sensor", "us gap", "rfid gap", "tap", "http p50", "http", "pass",
+             "cleans"))
+    results = []
+    for name, repo in revs:
+        r = run(repo, args.minutes * 60, args.fidelity, args.flash_ms, args.seed)
+        results.append((name, r))
+        print("%-14s | %7.0f %8.0f %6.0f | %8.0f %8.0f | %7.0f | %6d"
+              % (name, r["us_gap"] / 1000, r["rfid_gap"] / 1000, r["tap"] / 1000,
+                 r["http_p50"] / 1000, r["http_max"] / 1000, r["pass"] / 1000,
+                 r["cleans"]))
+        if repo:
+            shutil.rmtree(repo, ignore_errors=True)
+
+    for name, r in results:
+        lost = []
+        if r["taps_seen"] < r["taps"]:
+            lost.append("%d of %d taps not seen" % (r["taps"] - r["taps_seen"], r["taps"]))
+        if r["http_done"] < r["http"]:
+            lost.append("%d of %d requests unanswered" % (r["http"] - r["http_done"], r["http"]))
+        if lost:
+            print("%s: %s" % (name, ", ".join(lost)))
+        b = r["budget"]
+        if b is None:
+            continue
+        print("\n%s: budget %d ms, %d of %d passes over (worst by %.1f ms)"
+              % (name, b["budget_us"] // 1000, b["overruns"], b["passes"],
+                 b["worst_overrun_us"] / 1000))
+        for stage, s in b["stages"].items():
+            print("  %-7s %-10s shed %5d  forced %4d  cost %6.1f ms"
+                  % (stage, s["priority"], s["shed"], s["forced"], s["cost_us"] / 1000))
+
+
+if __name__ == "__main__":
+    main()
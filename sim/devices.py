@@ -0,0 +1,330 @@
+# sim/devices.py - device models wired onto a simulated Board
+#
+# Ultrasonic, HX711 and MFRC522 are modelled at the pin / register level so
+# the repo's own drivers run against them unchanged. Scenario code feeds
+# them through plain callables of virtual time.
+
+import random
+
+
+# HC-SR04 ultrasonic ranger
+class Ultrasonic:
+    ECHO_DELAY_US = 450
+    SOUND_CM_PER_US = 0.0343
+
+    def __init__(self, board, trig, echo, distance=None):
+        # distance(t_us) -> cm, or None when nothing reflects in range
+        self.board = board
+        self.distance = distance or (lambda t: None)
+        self.rise = None
+        self.start = None
+        self.end = None
+        self.pings = 0
+        board.listen(trig, self._trig)
+        board.drive(echo, self._echo)
+
+    def _trig(self, v, t):
+        if v:
+            self.rise = t
+            return
+        if self.rise is not None and t - self.rise >= 10:
+            self.pings += 1
+            d = self.distance(t)
+            if d is None:
+                self.start = self.end = None
+            else:
+                self.start = t + self.ECHO_DELAY_US
+                self.end = self.start + int(2.0 * d / self.SOUND_CM_PER_US)
+        self.rise = None
+
+    def _echo(self, t):
+        if self.start is None:
+            return 0, None
+        if t < self.start:
+            return 0, self.start
+        if t < self.end:
+            return 1, self.end
+        return 0, None
+
+
+# HX711 24-bit load cell ADC
+class HX711Model:
+    def __init__(self, board, dout, sck, grams=None, cal=1143.3771,
+                 zero=8400, noise=40, sps=10, seed=1, settle_us=400000):
+        # grams(t_us) -> load on the cell
+        self.board = board
+        self.grams = grams or (lambda t: 0.0)
+        self.cal = cal
+        self.zero = zero
+        self.noise = noise
+        self.period = 1000000 // sps
+        self.rng = random.Random(seed)
+        # the first conversion after power-up takes settle_us (datasheet:
+        # 400 ms output settling at 10 SPS)
+        self.ready_at = settle_us
+        self.bits = None
+        self.clocks = 0
+        self.conversions = 0
+        board.listen(sck, self._sck)
+        board.drive(dout, self._dout)
+
+    def _sample(self, t):
+        raw = int(self.zero + self.grams(t) * self.cal
+                  + self.rng.gauss(0, self.noise))
+        return raw & 0xFFFFFF
+
+    def _dout(self, t):
+        if self.bits is not None:
+            if self.clocks == 0:
+                return 0, None
+            if self.clocks <= 24:
+                return (self.bits >> (24 - self.clocks)) & 1, None
+            return 1, None
+        if t >= self.ready_at:
+            return 0, None
+        return 1, self.ready_at
+
+    def _sck(self, v, t):
+        if not v:
+            return
+        if self.bits is None:
+            if t < self.ready_at:
+                return
+            self.bits = self._sample(t)
+            self.clocks = 0
+        self.clocks += 1
+        if self.clocks > 24:
+            # gain pulse ends the read, next conversion starts now
+            self.bits = None
+            self.conversions += 1
+            self.ready_at = t + self.period
+
+
+# MFRC522 RFID front end (register level) with one ISO14443A card
+def crc_a(data):
+    crc = 0x6363
+    for b in data:
+        b ^= crc & 0xFF
+        b = (b ^ (b << 4)) & 0xFF
+        crc = (crc >> 8) ^ (b << 8) ^ (b << 3) ^ (b >> 4)
+    return crc & 0xFFFF
+
+
+class Card:
+    IDLE, READY, ACTIVE = 0, 1, 2
+
+    def __init__(self, uid):
+        self.uid = bytes(uid)
+        self.state = Card.IDLE
+        self.blocks = {}
+        self.pending_write = None
+
+    def bcc(self):
+        x = 0
+        for b in self.uid:
+            x ^= b
+        return x
+
+    def handle(self, frame, bits_last):
+        """Return (response bytes, valid bits in last byte) or None"""
+        if bits_last == 7 and len(frame) == 1:
+            # REQA/WUPA short frame
+            if frame[0] == 0x26 and self.state != Card.IDLE:
+                # not valid in this state: the card drops back to IDLE
+                self.state = Card.IDLE
+                return None
+            self.state = Card.READY
+            return bytes((0x04, 0x00)), 0
+        if len(frame) >= 2 and frame[0] == 0x93 and frame[1] == 0x20:
+            if self.state != Card.READY:
+                return None
+            return self.uid + bytes((self.bcc(),)), 0
+        if len(frame) == 9 and frame[0] == 0x93 and frame[1] == 0x70:
+            if self.state != Card.READY or frame[2:6] != self.uid:
+                return None
+            self.state = Card.ACTIVE
+            sak = bytes((0x08,))
+            c = crc_a(sak)
+            return sak + bytes((c & 0xFF, c >> 8)), 0
+        if self.state != Card.ACTIVE:
+            self.state = Card.IDLE
+            return None
+        if self.pending_write is not None and len(frame) == 18:
+            self.blocks[self.pending_write] = bytes(frame[:16])
+            self.pending_write = None
+            return bytes((0x0A,)), 4
+        if len(frame) == 4 and frame[0] == 0x30:
+            data = self.blocks.get(frame[1], bytes(16))
+            c = crc_a(data)
+            return data + bytes((c & 0xFF, c >> 8)), 0
+        if len(frame) == 4 and frame[0] == 0xA0:
+            self.pending_write = frame[1]
+            return bytes((0x0A,)), 4
+        self.state = Card.IDLE
+        return None
+
+
+class MFRC522Model:
+    # time for a frame exchange with a card in the field, and the receive
+    # timeout the driver programs (TPrescaler 0xD3E, TReload 30 -> ~15 ms)
+    EXCHANGE_US = 1000
+    TIMEOUT_US = 15000
+    CRC_US = 60
+
+    def __init__(self, board, cs, card=None):
+        # card(t_us) -> Card in the field or None
+        self.board = board
+        self.cs_pin = cs
+        self.card = card or (lambda t: None)
+        self.regs = bytearray(64)
+        self.fifo = bytearray()
+        self.cs_low = False
+        self.addr = None
+        self.read_mode = False
+        self.irq_at = None
+        self.irq_bits = 0
+        self.crc_at = None
+        self.transceives = 0
+        board.listen(cs, self._cs)
+        board.spi_devices.append(self)
+
+    def _cs(self, v, t):
+        self.cs_low = not v
+        self.addr = None
+
+    def selected(self):
+        return self.cs_low
+
+    def transfer(self, out):
+        if self.addr is None:
+            a = out[0]
+            self.read_mode = bool(a & 0x80)
+            self.addr = (a >> 1) & 0x3F
+            out = out[1:]
+            if not out:
+                return bytes(1)
+        if self.read_mode:
+            return bytes(self._read(self.addr) for _ in out)
+        for b in out:
+            self._write(self.addr, b)
+        return None
+
+    def _read(self, reg):
+        now = self.board.sched.now()
+        if reg == 0x09:
+            if self.fifo:
+                v = self.fifo[0]
+                # not `del`: MicroPython's bytearray has no item deletion and
+                # sim/driverbench.py runs these models there too
+                self.fifo = self.fifo[1:]
+                return v
+            return 0
+        if reg == 0x0A:
+            return len(self.fifo)
+        if reg == 0x04:
+            v = self.regs[0x04]
+            if self.irq_at is not None and now >= self.irq_at:
+                v |= self.irq_bits
+            return v
+        if reg == 0x05:
+            v = self.regs[0x05]
+            if self.crc_at is not None and now >= self.crc_at:
+                v |= 0x04
+            return v
+        return self.regs[reg]
+
+    def _write(self, reg, v):
+        if reg == 0x09:
+            self.fifo.append(v)
+            return
+        if reg == 0x0A:
+            if v & 0x80:
+                self.fifo = bytearray()
+            return
+        if reg == 0x04:
+            # Set1 bit selects set/clear of the masked irq bits
+            if v & 0x80:
+                self.regs[0x04] |= v & 0x7F
+            else:
+                self.regs[0x04] &= ~v & 0x7F
+                self.irq_bits &= ~v & 0x7F
+            return
+        if reg == 0x05:
+            if v & 0x80:
+                self.regs[0x05] |= v & 0x7F
+            else:
+                self.regs[0x05] &= ~v & 0x7F
+                if v & 0x04:
+                    self.crc_at = None
+            return
+        self.regs[reg] = v
+        if reg == 0x01:
+            self._command(v & 0x0F)
+        elif reg == 0x0D and v & 0x80 and self.regs[0x01] & 0x0F == 0x0C:
+            self._transceive()
+
+    def _command(self, cmd):
+        now = self.board.sched.now()
+        if cmd == 0x0F:
+            self.regs = bytearray(64)
+            self.fifo = bytearray()
+            self.irq_at = self.crc_at = None
+        elif cmd == 0x03:
+            c = crc_a(self.fifo)
+            self.fifo = bytearray()
+            self.regs[0x22] = c & 0xFF
+            self.regs[0x21] = c >> 8
+            self.crc_at = now + self.CRC_US
+        elif cmd == 0x0E:
+            # MFAuthent: accept any key for a card in the field
+            card = self.card(now)
+            self.fifo = bytearray()
+            if card is not None and card.state == Card.ACTIVE:
+                self.regs[0x08] |= 0x08
+                self.irq_bits = 0x10
+                self.irq_at = now + self.EXCHANGE_US
+            else:
+                self.irq_bits = 0x01
+                self.irq_at = now + self.TIMEOUT_US
+
+    def _transceive(self):
+        now = self.board.sched.now()
+        self.transceives += 1
+        frame = bytes(self.fifo)
+        self.fifo = bytearray()
+        bits_last = self.regs[0x0D] & 0x07
+        card = self.card(now)
+        resp = card.handle(frame, bits_last) if card is not None else None
+        self.regs[0x06] = 0
+        if resp is None:
+            self.irq_bits = 0x01      # TimerIRq
+            self.irq_at = now + self.TIMEOUT_US
+            self.regs[0x0C] = 0
+            return
+        data, last = resp
+        self.fifo = bytearray(data)
+        self.regs[0x0C] = last
+        self.irq_bits = 0x30          # RxIRq | IdleIRq
+        self.irq_at = now + self.EXCHANGE_US + len(data) * 90
+
+
+# SSD1306 OLED on I2C, keeps the last frame pushed to the panel
+class SSD1306Model:
+    def __init__(self, board, addr=0x3C, width=128, height=64):
+        self.frame = bytearray(width * height // 8)
+        self.frames = 0
+        self.commands = 0
+        board.i2c_devices[addr] = self
+
+    def write(self, data):
+        if not data:
+            return
+        if data[0] == 0x40:
+            n = min(len(data) - 1, len(self.frame))
+            self.frame[:n] = data[1:1 + n]
+            self.frames += 1
+        else:
+            self.commands += 1
+
+    def read(self, n):
+        return bytes(n)
@@ -0,0 +1,384 @@
+# sim/dishduty.py - the two-node DishDuty setup and end-to-end benchmarks
+#
+#   python -m sim.dishduty latency            # blocked sink -> notifier RED
+#   python -m sim.dishduty days --days 3      # simulated usage, fast drivers
+#
+# "bus" fidelity runs the repo's HX711 and MFRC522 drivers against the
+# pin/register-level models; "fast" swaps in driver-level stand-ins that
+# charge the same virtual time without bit-banging, for long runs.
+
+import argparse, bisect, random, time, types
+
+from . import Simulation
+from .devices import Ultrasonic, HX711Model, MFRC522Model, SSD1306Model, Card
+
+SENSOR_MAC = b"\xF4\x65\x0B\x30\x1a\x84"
+NOTIFIER_MAC = b"\xF4\x65\x0B\x34\x1A\x84"
+
+# Cards known to mainsensor.UID_TO_NAME
+CARDS = {
+    "Svanik": bytes.fromhex("21D5B17B"),
+    "Paul": bytes.fromhex("A169BBA3"),
+    "Pranav": bytes.fromhex("F1589C7B"),
+}
+
+NEAR_CM = 4.0
+BOTTLE_G = 420.0
+BOTTLE_ON_US = 12 * 1000000
+CAL = 1143.3771
+
+# notifier pins
+LED_GREEN, LED_RED, LED_YELLOW, BUZZER = 14, 26, 27, 33
+
+
+class Timeline:
+    """Piecewise-constant value of virtual time (microseconds)"""
+
+    def __init__(self, initial):
+        self.t = [0]
+        self.v = [initial]
+
+    def set(self, t_us, value):
+        i = bisect.bisect_right(self.t, t_us)
+        self.t.insert(i, t_us)
+        self.v.insert(i, value)
+
+    def __call__(self, t_us):
+        return self.v[bisect.bisect_right(self.t, t_us) - 1]
+
+
+class Sink:
+    """What is physically going on at the sink, as timelines"""
+
+    def __init__(self, bottle_on_us=BOTTLE_ON_US):
+        self.dist1 = Timeline(None)
+        self.dist2 = Timeline(None)
+        # by default the bottle goes on the scale once the node is up
+        self.grams = Timeline(0.0)
+        self.grams.set(bottle_on_us, BOTTLE_G)
+        self.card = Timeline(None)
+        self.cards = {}
+
+    def dishes(self, t_us, blocked1, blocked2=None):
+        if blocked2 is None:
+            blocked2 = blocked1
+        self.dist1.set(t_us, NEAR_CM if blocked1 else None)
+        self.dist2.set(t_us, NEAR_CM if blocked2 else None)
+
+    def tap(self, t_us, name, hold_us=1500000):
+        card = self.cards.get(name)
+        if card is None:
+            card = self.cards[name] = Card(CARDS[name])
+        self.card.set(t_us, card)
+        self.card.set(t_us + hold_us, None)
+
+    def soap(self, t_us, grams_used, lift_us=4000000):
+        before = self.grams(t_us)
+        self.grams.set(t_us, 0.0)
+        self.grams.set(t_us + lift_us, before - grams_used)
+
+    def card_at(self, t_us):
+        card = self.card(t_us)
+        if card is None:
+            # card left the field, it powers down
+            for c in self.cards.values():
+                c.state = Card.IDLE
+        return card
+
+
+# Driver-level stand-ins for "fast" fidelity
+# Virtual time one rfid.request() costs with the repo driver and no card:
+# 2000 ComIrq polls of ~34 us each (measured in bus fidelity)
+REQUEST_MISS_US = 68000
+EXCHANGE_US = 1400
+# rfidpool's split request: setting up the REQA, then the reply (or the
+# ~15 ms receive timer running out) as seen by the ComIrqReg poll
+REQUEST_START_US = 370
+REQUEST_REPLY_US = 1200
+REQUEST_TIMEOUT_US = 15000
+REQUEST_DONE_US = 100
+
+
+def fast_hx711(sink, sps=10):
+    def factory(node):
+        m = types.ModuleType("hx711")
+        sched = node.sched
+        period = 1000000 // sps
+        rng = random.Random(7)
+        state = {"ready": 0}
+
+        class HX711:
+            def __init__(self, dout, sck, gain=128):
+                self.offset = 0
+                # always "ready": read() itself waits for the conversion
+                self.dout = types.SimpleNamespace(value=lambda: 0)
+                self.read()
+
+            def read(self):
+                now = sched.now()
+                if now < state["ready"]:
+                    node.sleep_until(state["ready"])
+                sched.spend(160)
+                t = sched.now()
+                state["ready"] = t + period
+                return int(8400 + sink.grams(t) * CAL + rng.gauss(0, 40))
+
+            def tare(self, times=15):
+                total = 0
+                for _ in range(times):
+                    total += self.read()
+                    node.time.sleep_ms(10)
+                self.offset = total // times
+                return self.offset
+
+            def read_net(self, times=5):
+                total = 0
+                for _ in range(times):
+                    total += self.read()
+                    node.time.sleep_ms(10)
+                return (total - self.offset * times) // times
+
+            def get_units(self, scale=1, times=5):
+                total = 0
+                for _ in range(times):
+                    total += self.read()
+                    node.time.sleep_ms(10)
+                value = (total / times) - self.offset
+                return value / scale
+
+        m.HX711 = HX711
+        return m
+    return factory
+
+
+def fast_mfrc522(sink):
+    def factory(node):
+        m = types.ModuleType("mfrc22")
+        sched = node.sched
+
+        class MFRC522:
+            OK = 0
+            NOTAGERR = 1
+            ERR = 2
+            REQIDL = 0x26
+            REQALL = 0x52
+            AUTHENT1A = 0x60
+            AUTHENT1B = 0x61
+
+            def __init__(self, spi, cs):
+                sched.spend(3000)
+
+            def _x(self, frame, bits=0):
+                card = sink.card_at(sched.now())
+                resp = card.handle(bytes(frame), bits) if card else None
+                sched.spend(EXCHANGE_US if resp else REQUEST_MISS_US)
+                return resp
+
+            def request(self, mode):
+                r = self._x([mode], 7)
+                return (self.OK, 0x10) if r else (self.ERR, 0)
+
+            def request_start(self, mode):
+                card = sink.card_at(sched.now())
+                r = card.handle(bytes([mode]), 7) if card else None
+                sched.spend(REQUEST_START_US)
+                self.reply = self.OK if r else self.NOTAGERR
+                self.reply_at = sched.now() + (REQUEST_REPLY_US if r
+                                               else REQUEST_TIMEOUT_US)
+
+            def request_poll(self):
+                # polling until the reply costs the same as waiting for it
+                t = sched.now()
+                if t < self.reply_at:
+                    sched.spend(self.reply_at - t)
+                sched.spend(REQUEST_DONE_US)
+                return self.reply
+
+            def anticoll(self):
+                r = self._x([0x93, 0x20])
+                return (self.OK, list(r[0])) if r else (self.ERR, [])
+
+            def select_tag(self, ser):
+                from .devices import crc_a
+                buf = bytes([0x93, 0x70] + list(ser[:5]))
+                c = crc_a(buf)
+                r = self._x(list(buf) + [c & 0xFF, c >> 8])
+                return self.OK if r else self.ERR
+
+            def stop_crypto1(self):
+                sched.spend(70)
+
+            def auth(self, mode, addr, sect, ser):
+                return self.OK
+
+            def read(self, addr):
+                return None
+
+            def write(self, addr, data):
+                return self.ERR
+
+        m.MFRC522 = MFRC522
+        return m
+    return factory
+
+
+class DishDuty:
+    """Sensor node + notifier node wired to one Sink"""
+
+    def __init__(self, fidelity="bus", with_boot=True, echo=None,
+                 sim=None, sensor_fs=None, trace_alloc=False, repo=None,
+                 sink=None, oled=True):
+        self.sim = sim or Simulation(trace_alloc=trace_alloc, repo=repo)
+        self.sink = sink or Sink()
+        sink = self.sink
+        boot = ["boot.py"] if with_boot else []
+
+        mods = {}
+        if fidelity == "fast":
+            mods = {"hx711": fast_hx711(sink), "mfrc22": fast_mfrc522(sink)}
+        self.sensor = self.sim.add_node("sensor", boot + ["mainsensor.py"],
+                                        SENSOR_MAC, modules=mods, echo=echo,
+                                        fs=sensor_fs)
+        b = self.sensor.board
+        Ultrasonic(b, 32, 33, sink.dist1)
+        Ultrasonic(b, 27, 14, sink.dist2)
+        if fidelity == "bus":
+            self.hx = HX711Model(b, dout=12, sck=13, grams=sink.grams, cal=CAL)
+            self.rfid = MFRC522Model(b, cs=26, card=sink.card_at)
+
+        # the notifier only listens, so the sensor never waits for it
+        self.notifier = self.sim.add_node("notifier",
+                                          boot + ["main_actuator.py"],
+                                          NOTIFIER_MAC, echo=echo, passive=True)
+        # oled=False leaves the display off the I2C bus (a missing device)
+        self.oled = SSD1306Model(self.notifier.board, addr=0x3D) if oled else None
+
+        self.led_log = []
+        self.notifier.board.listen(LED_RED, self._led(LED_RED))
+        self.notifier.board.listen(LED_YELLOW, self._led(LED_YELLOW))
+        self.notifier.board.listen(LED_GREEN, self._led(LED_GREEN))
+        self.sim.start()
+
+    def _led(self, pin):
+        def fn(v, t):
+            if v:
+                self.led_log.append((t, pin))
+        return fn
+
+    def led_on_after(self, pin, t_us):
+        for t, p in self.led_log:
+            if t >= t_us and p == pin:
+                return t
+        return None
+
+    def counts(self):
+        return dict(self.sensor.g("name_counts") or {})
+
+    def display(self):
+        oled = self.notifier.g("oled")
+        return dict(oled.framebuf.lines) if oled else {}
+
+    def close(self):
+        self.sim.close()
+
+
+# Benchmarks
+def bench_latency(args):
+    dd = DishDuty(fidelity=args.fidelity)
+    sim = dd.sim
+    wall0 = time.perf_counter()
+    sim.run_for(args.warmup)
+    lat = []
+    rng = random.Random(3)
+    for _ in range(args.trials):
+        t = sim.now_us + rng.randrange(0, 1000000)
+        dd.sink.dishes(t, True)
+        sim.run_until(t + 5000000)
+        red = dd.led_on_after(LED_RED, t)
+        if red is not None:
+            lat.append((red - t) / 1000.0)
+        # clear the sink and let the alert time out of GRACE quietly
+        dd.sink.dishes(sim.now_us, False)
+        sim.run_for(2.0)
+        # nobody cleans up in this benchmark, reset the sensor's alert
+        dd.sensor.g("alert").reset()
+        sim.run_for(2.0)
+    wall = time.perf_counter() - wall0
+    simulated = sim.now_us / 1e6
+    dd.close()
+    lat.sort()
+    print("fidelity:            %s" % args.fidelity)
+    print("trials:              %d (%d reached RED)" % (args.trials, len(lat)))
+    if lat:
+        print("blocked -> RED LED:  min %.1f ms  median %.1f ms  max %.1f ms"
+              % (lat[0], lat[len(lat) // 2], lat[-1]))
+    print("simulated %.1f s in %.2f s wall (%.0fx real time)"
+          % (simulated, wall, simulated / wall))
+
+
+def plan_day(sink, t0_us, rng, episodes):
+    """Scripted usage for one day: dishes, a scan, soap, clean-up"""
+    names = list(CARDS)
+    day = 86400 * 1000000
+    starts = sorted(rng.randrange(0, day - 600 * 1000000) for _ in range(episodes))
+    plan = []
+    for s in starts:
+        t = t0_us + s
+        who = rng.choice(names)
+        sink.dishes(t, True)
+        scan = t + rng.randrange(5, 25) * 1000000
+        sink.tap(scan, who)
+        sink.soap(scan + 6 * 1000000, rng.uniform(4.0, 9.0))
+        # mainsensor wants the sink clear within scan_grace_ms of the scan,
+        # after that CONSTANT buzzing keeps the status RED
+        clear = scan + rng.randrange(14, 26) * 1000000
+        sink.dishes(clear, False)
+        plan.append((t, who))
+    return plan
+
+
+def bench_days(args):
+    dd = DishDuty(fidelity=args.fidelity)
+    sim = dd.sim
+    rng = random.Random(11)
+    sim.run_for(10)
+    wall0 = time.perf_counter()
+    t0 = sim.now_us
+    plans = []
+    for d in range(args.days):
+        plans += plan_day(dd.sink, t0 + d * 86400 * 1000000, rng, args.episodes)
+    expected = {}
+    for _, who in plans:
+        expected[who] = expected.get(who, 0) + 1
+    sim.run_until(t0 + args.days * 86400 * 1000000)
+    wall = time.perf_counter() - wall0
+    counts = dd.counts()
+    switches = sim.sched.switches
+    dd.close()
+    print("fidelity:          %s" % args.fidelity)
+    print("simulated:         %d day(s), %d dish episodes" % (args.days, len(plans)))
+    print("cleans registered: %s" % counts)
+    print("expected:          %s" % expected)
+    print("wall time:         %.1f s (%.0fx real time, %d task switches)"
+          % (wall, args.days * 86400 / wall, switches))
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m sim.dishduty")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    a = sub.add_parser("latency")
+    a.add_argument("--trials", type=int, default=20)
+    a.add_argument("--warmup", type=float, default=10.0)
+    a.add_argument("--fidelity", choices=("bus", "fast"), default="bus")
+    a.set_defaults(fn=bench_latency)
+    a = sub.add_parser("days")
+    a.add_argument("--days", type=int, default=1)
+    a.add_argument("--episodes", type=int, default=6)
+    a.add_argument("--fidelity", choices=("bus", "fast"), default="fast")
+    a.set_defaults(fn=bench_days)
+    args = p.parse_args(argv)
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,495 @@
+# sim/driverbench.py - bus traffic and Python time per driver call
+#
+#   python -m sim.driverbench                          # table on stdout
+#   python -m sim.driverbench --json now.json --baseline before.json
+#   micropython sim/driverbench.py --json now.json     # MicroPython unix port
+#
+# Runs the repo's MFRC522, SSD1306 and HX711 drivers unchanged against
+# instrumented Pin/SPI/I2C stand-ins and counts, per call: pin reads,
+# writes and toggles, SPI and I2C transactions and bytes, the bus time they
+# would take on the ESP32 (same per-call costs as sim/board.py plus the
+# wire time at the configured clock) and time spent in sleep_ms(). The
+# MFRC522 and SSD1306 on the other end are sim/devices.py's register
+# models; the HX711 always has a conversion ready, so its numbers are the
+# driver's own work and not the 10 SPS conversion wait.
+#
+# py_us is the fastest of the calls in wall time on the machine running
+# the bench, stand-ins included (the fastest is the least disturbed by the
+# host); compare it only between runs on the same interpreter. With --baseline the run fails (exit status 1) if any bus
+# counter went up or py_us grew by more than --py-tolerance percent (and
+# more than PY_SLACK_US). A fixed reference loop is timed right after every
+# call (ref_us) and the baseline's py_us is scaled by it first, so a busier
+# or throttled host does not read as a slower driver.
+#
+# Only what both CPython and the MicroPython unix port have is used here:
+# no argparse, and the simulator package is not imported as a package (on
+# CPython its framebuf/micropython stand-ins are borrowed).
+
+import gc, sys, time
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+try:
+    from .devices import Card, MFRC522Model, SSD1306Model
+except ImportError:
+    # run as a script: sim/ itself is on sys.path
+    from devices import Card, MFRC522Model, SSD1306Model
+
+try:
+    import framebuf
+    import micropython
+except ImportError:
+    # CPython: framebuf drawing is the simulator's pure-Python one, so
+    # ssd1306.text's py_us says little about the board there
+    try:
+        from .modules import framebuf_module, micropython_module
+    except ImportError:
+        from modules import framebuf_module, micropython_module
+    sys.modules["framebuf"] = framebuf_module(None)
+    sys.modules["micropython"] = micropython_module(None)
+
+try:
+    ticks_us = time.ticks_us
+    ticks_diff = time.ticks_diff
+except AttributeError:
+    def ticks_us():
+        return time.perf_counter_ns() // 1000
+
+    def ticks_diff(a, b):
+        return a - b
+
+
+def _dirname(path):
+    i = path.rfind("/")
+    return path[:i] if i > 0 else ("/" if i == 0 else ".")
+
+
+REPO = _dirname(_dirname(__file__))
+if REPO not in sys.path:
+    sys.path.insert(0, REPO)
+
+# Costs of one Python-level bus operation on the ESP32, as in sim/board.py
+PIN_OP_US = 2
+SPI_CALL_US = 12
+I2C_CALL_US = 40
+
+COUNTERS = ("pin_reads", "pin_writes", "pin_toggles",
+            "spi_transactions", "spi_bytes", "i2c_transactions", "i2c_bytes",
+            "bus_us", "wait_us")
+
+# mainsensor.py / main_actuator.py wiring
+HX_DOUT, HX_SCK = 12, 13
+CS_RFID = 26
+SPI_BAUD = 2500000
+I2C_FREQ = 400000
+
+CALLS = 200
+PY_TOLERANCE = 50       # percent
+PY_SLACK_US = 50        # and at least this much, host timer noise
+
+
+class Bus:
+    """One board's pins and buses on a simulated clock, with counters
+
+    Device models talk to it like to sim/board.py's Board: drive/listen
+    for pins, spi_devices/i2c_devices for the buses and sched.now().
+    """
+
+    def __init__(self):
+        self.t_us = 0
+        self.sched = self
+        self.values = {}
+        self.inputs = {}
+        self.listeners = {}
+        self.spi_devices = []
+        self.i2c_devices = {}
+        self.reset()
+
+    def reset(self):
+        for k in COUNTERS:
+            setattr(self, k, 0)
+
+    def counts(self):
+        return [getattr(self, k) for k in COUNTERS]
+
+    def now(self):
+        return self.t_us
+
+    def spend(self, us):
+        self.t_us += us
+        self.bus_us += us
+
+    def wait(self, us):
+        self.t_us += us
+        self.wait_us += us
+
+    def drive(self, pin_id, source):
+        """source(t_us) -> (level, next_change_us or None)"""
+        self.inputs[pin_id] = source
+
+    def listen(self, pin_id, fn):
+        if pin_id not in self.listeners:
+            self.listeners[pin_id] = []
+        self.listeners[pin_id].append(fn)
+
+    def read_pin(self, pin_id):
+        self.pin_reads += 1
+        self.spend(PIN_OP_US)
+        src = self.inputs.get(pin_id)
+        if src is None:
+            return self.values.get(pin_id, 0)
+        return src(self.t_us)[0]
+
+    def write_pin(self, pin_id, v):
+        self.pin_writes += 1
+        v = 1 if v else 0
+        if self.values.get(pin_id, 0) != v:
+            self.pin_toggles += 1
+        self.values[pin_id] = v
+        self.spend(PIN_OP_US)
+        for fn in self.listeners.get(pin_id, ()):
+            fn(v, self.t_us)
+
+    def spi(self, out, baudrate):
+        n = len(out)
+        self.spi_transactions += 1
+        self.spi_bytes += n
+        self.spend(SPI_CALL_US + (n * 8 * 1000000) // baudrate)
+        res = bytearray(n)
+        for dev in self.spi_devices:
+            if dev.selected():
+                r = dev.transfer(out)
+                if r is not None:
+                    res[:] = r[:n]
+        return res
+
+    def i2c(self, n, freq):
+        self.i2c_transactions += 1
+        self.i2c_bytes += n
+        # address byte + data, 9 clocks per byte with the ACK bit
+        self.spend(I2C_CALL_US + ((n + 1) * 9 * 1000000) // freq)
+
+
+class Module:
+    pass
+
+
+def machine_module(bus):
+    m = Module()
+
+    class Pin:
+        IN = 1
+        OUT = 3
+        PULL_UP = 1
+        PULL_DOWN = 2
+
+        def __init__(self, id, mode=-1, pull=-1, value=None):
+            self.id = id
+            if value is not None:
+                bus.write_pin(id, value)
+
+        def init(self, mode=-1, pull=-1, value=None):
+            if value is not None:
+                bus.write_pin(self.id, value)
+
+        def value(self, v=None):
+            if v is None:
+                return bus.read_pin(self.id)
+            bus.write_pin(self.id, v)
+
+        def __call__(self, v=None):
+            return self.value(v)
+
+        def on(self):
+            bus.write_pin(self.id, 1)
+
+        def off(self):
+            bus.write_pin(self.id, 0)
+
+    class SPI:
+        MSB = 0
+        LSB = 1
+
+        def __init__(self, id, baudrate=1000000, polarity=0, phase=0,
+                     bits=8, firstbit=0, sck=None, mosi=None, miso=None):
+            self.baudrate = baudrate
+
+        def init(self, baudrate=None, **kw):
+            if baudrate:
+                self.baudrate = baudrate
+
+        def write(self, buf):
+            bus.spi(bytes(buf), self.baudrate)
+
+        def read(self, n, write=0x00):
+            return bytes(bus.spi(bytes([write]) * n, self.baudrate))
+
+        def readinto(self, buf, write=0x00):
+            buf[:] = bus.spi(bytes([write]) * len(buf), self.baudrate)
+
+        def write_readinto(self, wbuf, rbuf):
+            rbuf[:] = bus.spi(bytes(wbuf), self.baudrate)
+
+    class I2C:
+        def __init__(self, id=0, scl=None, sda=None, freq=I2C_FREQ):
+            self.freq = freq
+
+        def scan(self):
+            bus.i2c(0, self.freq)
+            return sorted(bus.i2c_devices)
+
+        def writeto(self, addr, buf, stop=True):
+            bus.i2c(len(buf), self.freq)
+            dev = bus.i2c_devices.get(addr)
+            if dev is None:
+                raise OSError(19)
+            dev.write(bytes(buf))
+            return 1
+
+        def writevto(self, addr, bufs, stop=True):
+            return self.writeto(addr, b"".join(bytes(b) for b in bufs), stop)
+
+        def readfrom(self, addr, n, stop=True):
+            bus.i2c(n, self.freq)
+            dev = bus.i2c_devices.get(addr)
+            if dev is None:
+                raise OSError(19)
+            return dev.read(n)
+
+    m.Pin = Pin
+    m.SPI = SPI
+    m.SoftSPI = SPI
+    m.I2C = I2C
+    m.SoftI2C = I2C
+    return m
+
+
+def time_module(bus):
+    """What the drivers use of time; sleeps only move the simulated clock"""
+    m = Module()
+    m.sleep_ms = lambda ms: bus.wait(ms * 1000)
+    m.sleep_us = lambda us: bus.wait(us)
+    m.sleep = lambda s: bus.wait(int(s * 1000000))
+    m.ticks_us = lambda: bus.t_us
+    m.ticks_ms = lambda: bus.t_us // 1000
+    m.ticks_diff = lambda a, b: a - b
+    m.ticks_add = lambda a, b: a + b
+    return m
+
+
+class HX711Cell:
+    """DOUT/SCK of an HX711 at gain 128 that always has a conversion ready"""
+
+    def __init__(self, bus, dout, sck, raw=0x012345):
+        self.raw = raw & 0xFFFFFF
+        self.clocks = 0
+        bus.listen(sck, self._sck)
+        bus.drive(dout, self._dout)
+
+    def _dout(self, t):
+        c = self.clocks
+        if 1 <= c <= 24:
+            return (self.raw >> (24 - c)) & 1, None
+        return 0, None
+
+    def _sck(self, v, t):
+        if v:
+            # 24 data bits and one gain pulse, then the next conversion
+            self.clocks = (self.clocks + 1) % 25
+
+
+def setup():
+    """Drivers wired to the device models; returns (ops, bus)"""
+    bus = Bus()
+    machine = machine_module(bus)
+    sys.modules["machine"] = machine
+    for name in ("hx711", "mfrcc", "oled"):
+        sys.modules.pop(name, None)
+    import hx711, mfrcc, oled
+    hx711.time = time_module(bus)
+
+    field = [None]
+    card = Card(bytes((0x21, 0xD5, 0xB1, 0x7B)))
+    MFRC522Model(bus, CS_RFID, card=lambda t: field[0])
+    SSD1306Model(bus)
+    HX711Cell(bus, HX_DOUT, HX_SCK)
+
+    spi = machine.SPI(2, baudrate=SPI_BAUD, polarity=0, phase=0)
+    rfid = mfrcc.MFRC522(spi=spi, cs=machine.Pin(CS_RFID, machine.Pin.OUT))
+    disp = oled.SSD1306_I2C(128, 64, machine.I2C(0), addr=0x3C)
+    hx = hx711.HX711(dout=HX_DOUT, sck=HX_SCK)
+    hx.offset = 0x012000
+
+    ser = list(card.uid) + [card.bcc()]
+    block = bytes(range(16))
+    card.blocks[8] = block
+
+    def card_in(state):
+        def set_state():
+            field[0] = card
+            card.state = state
+        return set_state
+
+    def no_card():
+        field[0] = None
+
+    OK = rfid.OK
+    # name, setup (no bus traffic), call, check of the call's result
+    ops = (
+        ("mfrc522.request", card_in(Card.IDLE),
+         lambda: rfid.request(rfid.REQIDL), lambda r: r[0] == OK),
+        ("mfrc522.request_empty", no_card,
+         lambda: rfid.request(rfid.REQIDL), lambda r: r[0] != OK),
+        ("mfrc522.anticoll", card_in(Card.READY),
+         rfid.anticoll, lambda r: r[0] == OK and r[1] == ser),
+        ("mfrc522.select_tag", card_in(Card.READY),
+         lambda: rfid.select_tag(ser), lambda r: r == OK),
+        ("mfrc522.read", card_in(Card.ACTIVE),
+         lambda: rfid.read(8), lambda r: r == list(block)),
+        ("mfrc522.write", card_in(Card.ACTIVE),
+         lambda: rfid.write(8, block), lambda r: r == OK),
+        ("ssd1306.show", None, disp.show, None),
+        ("ssd1306.text", None,
+         lambda: disp.text("Next: Pranav", 0, 16), None),
+        ("hx711.read", None, hx.read, lambda r: r == 0x012345),
+        ("hx711.get_units", None,
+         lambda: hx.get_units(scale=1143.3771, times=5), None),
+        ("hx711.read_net", None,
+         lambda: hx.read_net(6), lambda r: r == 0x345),
+    )
+    return ops, bus
+
+
+def _reference_work(bus):
+    # a fixed piece of Python timed next to every call, to tell a slower
+    # driver from a busier host
+    for i in range(100):
+        bus.write_pin(0, i & 1)
+
+
+def run(calls=CALLS):
+    ops, bus = setup()
+    ref_bus = Bus()
+    out = {}
+    for name, prep, call, check in ops:
+        # one call outside the count: first-call costs, and the check
+        if prep:
+            prep()
+        r = call()
+        if check and not check(r):
+            raise RuntimeError("%s returned %r" % (name, r))
+        bus.reset()
+        py = ref = None
+        # no collections inside the timed calls
+        gc.collect()
+        gc.disable()
+        for _ in range(calls):
+            if prep:
+                prep()
+            t0 = ticks_us()
+            call()
+            t1 = ticks_us()
+            _reference_work(ref_bus)
+            t2 = ticks_us()
+            dt = ticks_diff(t1, t0)
+            if py is None or dt < py:
+                py = dt
+            dt = ticks_diff(t2, t1)
+            if ref is None or dt < ref:
+                ref = dt
+        gc.enable()
+        row = {}
+        for k, v in zip(COUNTERS, bus.counts()):
+            row[k] = v / calls
+        row["py_us"] = py
+        row["ref_us"] = ref
+        out[name] = row
+    return out
+
+
+def report(ops, calls):
+    impl = sys.implementation
+    return {
+        "implementation": impl.name,
+        "version": ".".join(str(v) for v in impl.version[:3]),
+        "calls": calls,
+        "ops": ops,
+    }
+
+
+def compare(cur, base, tolerance):
+    """Regressions of cur against base, as lines of text"""
+    out = []
+    same_host = cur["implementation"] == base["implementation"]
+    for name, row in cur["ops"].items():
+        old = base["ops"].get(name)
+        if old is None:
+            continue
+        # the baseline's py_us as if it had run at this run's host speed
+        speed = row["ref_us"] / old["ref_us"]
+        for k in COUNTERS:
+            if k in old and row[k] > old[k]:
+                out.append("%s: %s %g -> %g" % (name, k, old[k], row[k]))
+        was = old["py_us"] * speed
+        if (same_host and row["py_us"] > was * (100 + tolerance) / 100
+                and row["py_us"] - was > PY_SLACK_US):
+            out.append("%s: py_us %.1f -> %.1f (over %d%%, host speed x%.2f)"
+                       % (name, old["py_us"], row["py_us"], tolerance, speed))
+    return out
+
+
+def print_table(rep):
+    print("%s %s, %d calls per op" % (rep["implementation"], rep["version"],
+                                      rep["calls"]))
+    print("%-22s %6s %6s %6s | %5s %6s | %5s %6s | %8s %8s | %9s"
+          % ("op", "pin rd", "pin wr", "toggle", "spi", "bytes", "i2c", "bytes",
+             "bus ms", "wait ms", "py us"))
+    for name, r in rep["ops"].items():
+        print("%-22s %6d %6d %6d | %5d %6d | %5d %6d | %8.2f %8.2f | %9.1f"
+              % (name, r["pin_reads"], r["pin_writes"], r["pin_toggles"],
+                 r["spi_transactions"], r["spi_bytes"], r["i2c_transactions"],
+                 r["i2c_bytes"], r["bus_us"] / 1000, r["wait_us"] / 1000,
+                 r["py_us"]))
+
+
+USAGE = ("usage: driverbench [--calls N] [--json PATH] [--baseline PATH]"
+         " [--py-tolerance PCT]")
+
+
+def main(argv=None):
+    args = sys.argv[1:] if argv is None else argv
+    opts = {"--calls": CALLS, "--json": None, "--baseline": None,
+            "--py-tolerance": PY_TOLERANCE}
+    i = 0
+    while i < len(args):
+        k = args[i]
+        if k not in opts or i + 1 >= len(args):
+            print(USAGE)
+            return 2
+        v = args[i + 1]
+        opts[k] = int(v) if k in ("--calls", "--py-tolerance") else v
+        i += 2
+
+    calls = opts["--calls"]
+    rep = report(run(calls), calls)
+    print_table(rep)
+    if opts["--json"]:
+        with open(opts["--json"], "w") as f:
+            json.dump(rep, f)
+    if opts["--baseline"]:
+        with open(opts["--baseline"]) as f:
+            base = json.load(f)
+        bad = compare(rep, base, opts["--py-tolerance"])
+        for line in bad:
+            print("REGRESSION " + line)
+        if bad:
+            return 1
+        print("no regressions against %s" % opts["--baseline"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
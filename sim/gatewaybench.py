@@ -0,0 +1,189 @@
+# sim/gatewaybench.py - one notifier under traffic from many sensor nodes
+#
+#   python -m sim.gatewaybench                            # this checkout
+#   python -m sim.gatewaybench --before HEAD~1 --sensors 50 --rates 1,5,20
+#
+# Runs main_actuator.py (bus fidelity, OLED attached) and points SENSORS
+# sensor nodes at it, each sending RATE frames a second with random
+# phase: status and beep changes, next-up and last-cleaner names, in the
+# mix the sensor node sends them. The sensors are modelled at the radio
+# only, one traffic task sending from all their MACs.
+#
+# Per rate: frames offered and handled per second (both over the traffic
+# window; frames still queued when it ends are handled in DRAIN_S and
+# counted), frames lost because the ESP-NOW receive ring was full, how
+# long handled frames queued (p50/p99), the CPU cost of one frame, the
+# notifier's busy share of the run (everything but sleeping and waiting
+# for a frame) and whether the LEDs end up on the worst status the sensors
+# last sent.
+#
+# The simulator charges radio reads, I2C and pin writes but not Python
+# bytecode, so handle_msg() is wrapped: the bytecode instructions it
+# executes in firmware modules (not in the simulator's stand-ins) are
+# counted and charged at --op-us each, a rough figure for MicroPython on
+# an ESP32 at 160 MHz. cpu/frame is that charge plus the simulated I/O the
+# call did; busy and the queueing delays include it.
+
+import argparse, heapq, os, random, shutil, sys
+
+from . import Simulation, firmware_tree
+from .devices import SSD1306Model
+from .dishduty import NOTIFIER_MAC, LED_GREEN, LED_RED, LED_YELLOW
+
+BOOT_S = 2.0        # notifier boot before traffic starts
+OP_US = 0.5         # MicroPython bytecode instruction on the ESP32, us
+DRAIN_S = 1.0       # quiet time before the LEDs are read
+NAMES = ("Svanik", "Paul", "Pranav")
+STATUS = (b"S|GREEN", b"S|YELLOW", b"S|RED")
+BEEP = (b"B|OFF", b"B|GRACE", b"B|CONSTANT")
+LED_OF = {0: LED_GREEN, 1: LED_YELLOW, 2: LED_RED}
+
+
+def sensor_mac(i):
+    return b"\xF4\x65\x0B\x40" + bytes((i >> 8, i & 0xFF))
+
+
+def traffic(sim, sensors, rate, t0, t1, seed):
+    """Task sending from every sensor; returns the status each sent last"""
+    sched = sim.sched
+    rng = random.Random(seed)
+    period = 1000000 / rate
+    last = [0] * sensors
+    q = [(t0 + int(rng.random() * period), i) for i in range(sensors)]
+    heapq.heapify(q)
+
+    def run():
+        while q:
+            t, i = heapq.heappop(q)
+            if t >= t1:
+                continue
+            sched.sleep_until(t)
+            r = rng.random()
+            if r < 0.45:
+                # mostly clear sinks, a few alerts
+                s = rng.choices((0, 1, 2), (70, 20, 10))[0]
+                last[i] = s
+                msg = STATUS[s]
+            elif r < 0.9:
+                msg = BEEP[rng.choices((0, 1, 2), (70, 20, 10))[0]]
+            elif r < 0.95:
+                msg = b"N|" + rng.choice(NAMES).encode()
+            else:
+                msg = b"R|" + rng.choice(NAMES).encode()
+            sim.air.send(sensor_mac(i), NOTIFIER_MAC, msg)
+            heapq.heappush(q, (t + int(period * rng.uniform(0.8, 1.2)), i))
+
+    sched.spawn("sensors", run, t0)
+    return last
+
+
+def charge_bytecode(sim, node, op_us):
+    """Wrap the notifier's handle_msg(); returns [frames, us charged in all]"""
+    root = os.path.join(sim.repo, "")
+    sched = node.sched
+    handle = node.g("handle_msg")
+    ops = [0]
+    cost = [0, 0]
+
+    def count(frame, event, arg):
+        if event == "opcode":
+            ops[0] += 1
+        return count
+
+    def trace(frame, event, arg):
+        # firmware code only, the stand-ins it calls into are not counted
+        if frame.f_code.co_filename.startswith(root):
+            frame.f_trace_opcodes = True
+            return count
+        return None
+
+    def handle_msg(host, msg):
+        t0 = sched.now()
+        ops[0] = 0
+        sys.settrace(trace)
+        try:
+            handle(host, msg)
+        finally:
+            sys.settrace(None)
+        sched.spend(int(ops[0] * op_us))
+        cost[0] += 1
+        cost[1] += sched.now() - t0
+
+    node.globals["handle_msg"] = handle_msg
+    return cost
+
+
+def run_rate(repo, sensors, rate, seconds, seed=1, op_us=OP_US):
+    sim = Simulation(repo=repo)
+    node = sim.add_node("notifier", ["main_actuator.py"], NOTIFIER_MAC,
+                        passive=True)
+    SSD1306Model(node.board, addr=0x3D)
+    sim.start()
+    sim.run_for(BOOT_S)
+    cost = charge_bytecode(sim, node, op_us)
+
+    t0 = sim.now_us
+    t1 = t0 + int(seconds * 1000000)
+    last = traffic(sim, sensors, rate, t0, t1, seed)
+    esp = node.espnow
+    esp.delays = []
+    sent0, drop0, idle0 = sim.air.sent, esp.rx_dropped, node.idle_time()
+    sim.run_until(t1)
+    sent = sim.air.sent - sent0
+    dropped = esp.rx_dropped - drop0
+    busy = 1 - (node.idle_time() - idle0) / (t1 - t0)
+    sim.run_for(DRAIN_S)
+    delays = sorted(esp.delays)
+
+    worst = max(last) if sensors else 0
+    b = node.board
+    lit = [p for p in (LED_GREEN, LED_YELLOW, LED_RED) if b.level(p)]
+    sim.close()
+    return {
+        "offered": sent / seconds,
+        "handled": len(delays) / seconds,
+        "dropped": dropped,
+        "sent": sent,
+        "p50_ms": delays[len(delays) // 2] / 1000 if delays else 0.0,
+        "p99_ms": delays[int(len(delays) * 0.99)] / 1000 if delays else 0.0,
+        "busy": busy,
+        "frame_us": cost[1] / cost[0] if cost[0] else 0.0,
+        "leds_ok": lit == [LED_OF[worst]],
+    }
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m sim.gatewaybench")
+    p.add_argument("--sensors", type=int, default=50)
+    p.add_argument("--rates", default="0.2,1,5,20",
+                   help="frames per second per sensor, comma separated")
+    p.add_argument("--seconds", type=float, default=20.0)
+    p.add_argument("--op-us", type=float, default=OP_US,
+                   help="CPU time charged per bytecode instruction")
+    p.add_argument("--before", metavar="REV",
+                   help="also run the notifier at this git revision")
+    args = p.parse_args(argv)
+    rates = [float(r) for r in args.rates.split(",")]
+
+    revs = [("this checkout", None)]
+    if args.before:
+        revs.insert(0, (args.before, firmware_tree(args.before)))
+    print("%d sensors, %.0f s per rate, %.2f us per bytecode instruction"
+          % (args.sensors, args.seconds, args.op_us))
+    print("%-14s %6s | %8s %8s %7s | %7s %8s | %9s %5s %8s | %5s"
+          % ("notifier", "rate/s", "offered", "handled", "lost", "p50 ms",
+             "p99 ms", "cpu/frame", "busy", "headroom", "LEDs"))
+    for name, repo in revs:
+        for rate in rates:
+            r = run_rate(repo, args.sensors, rate, args.seconds, op_us=args.op_us)
+            print("%-14s %6g | %8.0f %8.0f %6.1f%% | %7.1f %8.1f | %6.0f us %4.0f%% %7.0f%% | %5s"
+                  % (name, rate, r["offered"], r["handled"],
+                     100.0 * r["dropped"] / max(1, r["sent"]), r["p50_ms"],
+                     r["p99_ms"], r["frame_us"], 100 * r["busy"],
+                     100 * (1 - r["busy"]), "ok" if r["leds_ok"] else "WRONG"))
+        if repo:
+            shutil.rmtree(repo, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+# sim/httpload.py - sensor loop cadence under dashboard and API load
+#
+#   python -m sim.httpload                            # this checkout
+#   python -m sim.httpload --before HEAD~1 --rate 50 --sse 10 --slow 0.1
+#
+# Runs the two-node setup and points a crowd of clients at the sensor
+# node's web server while dish episodes keep its event stream busy:
+#
+#   --sse N    clients holding /events open the whole run; the host reads
+#              their streams every SSE_READ_MS
+#   --rate R   GET requests a second to the JSON API and /metrics (Poisson
+#              arrivals, a random path each)
+#   --slow F   share of those requests made by a slow client: a receive
+#              window of SLOW_WINDOW bytes that the host only reads from
+#              again SLOW_READ_MS later (a phone on bad Wi-Fi)
+#
+# Reported per firmware revision, from the node's pins and sockets:
+#   pass      loop pass time, p50 / p99 / worst (every pass, from the
+#             node's /metrics loop histogram sum)
+#   us gap    time between two pings of ultrasonic 1 (due every
+#             INTERVAL_MS), p50 / p99 / worst
+#   api       request -> response complete, p50 / p99, and how many of the
+#             requests got a whole 200 response
+#   /metrics  requests to /metrics from clients that keep up, answered
+#             whole / cut off / offered: the one response bigger than lwIP's
+#             send buffer (sim/netsock.py SNDBUF), it needs ACKs from the
+#             client before it can all be handed over
+#   sse       streams still open at the end and events they received
+# Exit status is 1 when the worst ultrasonic gap goes over --max-gap-ms.
+
+import argparse, random, shutil, sys
+
+from . import firmware_tree
+from .dishduty import DishDuty
+from .node import decode_chunked
+
+BOOT_S = 15.0
+EPISODE_S = 30.0
+PATHS = ("/api/state", "/api/counts", "/api/history", "/metrics")
+SSE_READ_MS = 250
+SLOW_WINDOW = 128
+SLOW_READ_MS = 1000
+NAMES = ("Svanik", "Paul", "Pranav")
+
+
+def pct(xs, q):
+    return xs[min(len(xs) - 1, int(len(xs) * q))] if xs else 0
+
+
+def episodes(dd, t0, t1, rng):
+    t = t0 + 3000000
+    while t < t1 - 25000000:
+        dd.sink.dishes(t, True)
+        scan = t + rng.randrange(3, 6) * 1000000
+        dd.sink.tap(scan, rng.choice(NAMES))
+        dd.sink.soap(scan + 5000000, rng.uniform(4.0, 9.0))
+        dd.sink.dishes(scan + rng.randrange(12, 18) * 1000000, False)
+        t += int(EPISODE_S * 1000000)
+
+
+def load(sim, dd, t0, t1, args, rng):
+    """Start the clients; returns (api conns, sse conns, sse events read)"""
+    sched = sim.sched
+    node = dd.sensor
+    api = []
+    sse = [node.http_get("/events") for _ in range(args.sse)]
+    events = [0] * len(sse)
+
+    def readers():
+        t = t0
+        while True:
+            t += SSE_READ_MS * 1000
+            sched.sleep_until(t)
+            for i, c in enumerate(sse):
+                events[i] += c.take().count(b"event: ")
+            for c in api:
+                if c.slow and sched.now() - c.t_read >= SLOW_READ_MS * 1000:
+                    c.data += c.take()
+                    c.t_read = sched.now()
+
+    def clients():
+        t = t0
+        while True:
+            t += int(rng.expovariate(args.rate) * 1000000)
+            if t >= t1:
+                return
+            sched.sleep_until(t)
+            slow = rng.random() < args.slow
+            path = rng.choice(PATHS)
+            c = node.http_get(path, window=SLOW_WINDOW if slow else 1 << 20)
+            c.path = path
+            c.slow = slow
+            c.t_read = c.t_open
+            c.data = b""
+            api.append(c)
+
+    sched.spawn("sse-readers", readers, t0)
+    sched.spawn("api-clients", clients, t0)
+    return api, sse, events
+
+
+def run(repo, args):
+    dd = DishDuty(fidelity=args.fidelity, repo=repo)
+    sim = dd.sim
+    rng = random.Random(args.seed)
+    pings = []
+    passes = []
+    dd.sensor.board.listen(32, lambda v, t: pings.append(t) if v else None)
+
+    if not sim.wait(lambda: dd.sensor.g("http") is not None
+                    and dd.sensor.g("stats") is not None, BOOT_S + 30):
+        raise RuntimeError("sensor node did not start its HTTP server")
+    sim.run_for(BOOT_S)
+    stats = dd.sensor.g("stats")
+    loop_done = stats.loop_done
+
+    def timed(t0):
+        h = stats.loop
+        before = h.sum_s * 1000000 + h.sum_us
+        loop_done(t0)
+        passes.append(h.sum_s * 1000000 + h.sum_us - before)
+    stats.loop_done = timed
+
+    t0 = sim.now_us
+    t1 = t0 + int(args.seconds * 1000000)
+    episodes(dd, t0, t1, rng)
+    api, sse, events = load(sim, dd, t0, t1, args, rng)
+    sim.run_until(t1)
+    # every pass and ping so far was under load; the requests still queued
+    # get a few seconds to finish before the responses are counted
+    loaded = sorted(passes)
+    pings = [t for t in pings if t0 <= t < t1]
+    sse_open = sum(1 for c in sse if not c.closed)
+    sim.run_for(5.0)
+
+    ok = []
+    metrics = [0, 0, 0]
+    for c in api:
+        c.data += c.take()
+        big = c.path == "/metrics" and not c.slow
+        metrics[2] += big
+        if c.t_closed is None:
+            continue
+        status, _, _ = decode_chunked(c.data)
+        if status == 200 and c.data.endswith(b"0\r\n\r\n"):
+            ok.append(c.t_closed - c.t_open)
+            metrics[0] += big
+        else:
+            metrics[1] += big
+    r = {
+        "passes": loaded,
+        "gaps": sorted(b - a for a, b in zip(pings, pings[1:])),
+        "api": sorted(ok),
+        "offered": len(api),
+        "metrics": metrics,
+        "sse_open": sse_open,
+        "sse": len(sse),
+        "sse_events": sum(events),
+    }
+    dd.close()
+    return r
+
+
+def ms3(xs):
+    return "%6.0f %6.0f %6.0f" % (pct(xs, 0.5) / 1000, pct(xs, 0.99) / 1000,
+                                  (xs[-1] if xs else 0) / 1000)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m sim.httpload")
+    p.add_argument("--seconds", type=float, default=120.0)
+    p.add_argument("--rate", type=float, default=50.0, help="API requests a second")
+    p.add_argument("--sse", type=int, default=10, help="/events clients")
+    p.add_argument("--slow", type=float, default=0.1,
+                   help="share of API requests from slow clients")
+    p.add_argument("--fidelity", choices=("bus", "fast"), default="bus")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--max-gap-ms", type=float, default=1000.0,
+                   help="worst ultrasonic gap allowed (INTERVAL_MS is 500)")
+    p.add_argument("--before", metavar="REV",
+                   help="also run the sensor node at this git revision")
+    args = p.parse_args(argv)
+
+    revs = [("this checkout", None)]
+    if args.before:
+        revs.insert(0, (args.before, firmware_tree(args.before)))
+    print("%.0f s, %d SSE clients, %.0f API requests/s (%.0f%% slow), %s "
+          "fidelity; times in ms" % (args.seconds, args.sse, args.rate,
+                                     100 * args.slow, args.fidelity))
+    print("%-14s | %-20s | %-20s | %-13s %-9s | %s"
+          % ("sensor", "pass p50/p99/max", "us gap p50/p99/max", "api p50/p99",
+             "answered", "sse open/events"))
+    bad = 0
+    for name, repo in revs:
+        r = run(repo, args)
+        print("%-14s | %s | %s | %6.0f %6.0f %4d/%-4d | %d/%d %d"
+              % (name, ms3(r["passes"]), ms3(r["gaps"]),
+                 pct(r["api"], 0.5) / 1000, pct(r["api"], 0.99) / 1000,
+                 len(r["api"]), r["offered"], r["sse_open"], r["sse"],
+                 r["sse_events"]))
+        print("%-14s | /metrics, clients that keep up: %d whole, %d cut off, "
+              "of %d" % (("",) + tuple(r["metrics"])))
+        if r["gaps"] and r["gaps"][-1] > args.max_gap_ms * 1000 and repo is None:
+            bad = 1
+        if repo:
+            shutil.rmtree(repo, ignore_errors=True)
+    if bad:
+        print("worst ultrasonic gap over %.0f ms" % args.max_gap_ms)
+    return bad
+
+
+if __name__ == "__main__":
+    sys.exit(main())
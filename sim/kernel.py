@@ -0,0 +1,156 @@
+# sim/kernel.py - virtual clock and deterministic task scheduler
+#
+# Each simulated node runs its unmodified program in its own Python thread,
+# but only one thread ever runs at a time. Every task has a local time in
+# microseconds; the scheduler always resumes the task that is furthest
+# behind, and a running task hands control back as soon as its local time
+# would pass another task's wake-up time. That keeps cause and effect in
+# order between nodes (an ESP-NOW frame is never seen before it was sent)
+# while letting a node that has nothing to wait for run ahead freely.
+#
+# A passive task (one that never transmits, like the notifier) cannot change
+# what any other task sees, so the others do not wait for it. The sensor
+# node then runs a whole run_until() slice in one go and the notifier
+# catches up behind it, instead of the two swapping every few milliseconds.
+
+import threading
+
+
+class SimExit(BaseException):
+    """Raised inside node threads to unwind them when the simulation stops"""
+
+
+class Task:
+    def __init__(self, sched, name, fn, passive=False):
+        self.sched = sched
+        self.name = name
+        self.fn = fn
+        self.passive = passive
+        self.t_us = 0
+        self.wake_us = 0
+        self.done = False
+        self.error = None
+        self.killed = False
+        self.go = threading.Lock()
+        self.go.acquire()
+        self.thread = threading.Thread(target=self._main, name=name, daemon=True)
+
+    def _main(self):
+        self.go.acquire()
+        try:
+            if not self.killed:
+                self.fn()
+        except SimExit:
+            pass
+        except BaseException as ex:
+            self.error = ex
+        self.done = True
+        self.sched._back.release()
+
+
+class Scheduler:
+    def __init__(self):
+        self.tasks = []
+        self.current = None
+        self.horizon = 0
+        self.switches = 0
+        self._back = threading.Lock()
+        self._back.acquire()
+        self._idle_t = 0
+
+    # Task side
+    def spawn(self, name, fn, start_us=0, passive=False):
+        t = Task(self, name, fn, passive)
+        t.t_us = t.wake_us = start_us
+        self.tasks.append(t)
+        t.thread.start()
+        return t
+
+    def now(self):
+        cur = self.current
+        return cur.t_us if cur is not None else self._idle_t
+
+    def spend(self, us):
+        """Advance the running task's clock by CPU/bus time"""
+        cur = self.current
+        if cur is None:
+            self._idle_t += us
+            return
+        cur.t_us += us
+        if cur.t_us > self.horizon:
+            self._yield(cur.t_us)
+
+    def sleep_until(self, t_us):
+        cur = self.current
+        if cur is None:
+            if t_us > self._idle_t:
+                self._idle_t = t_us
+            return
+        if t_us <= cur.t_us:
+            return
+        if t_us <= self.horizon:
+            cur.t_us = t_us
+            return
+        self._yield(t_us)
+
+    def wake(self, task, t_us):
+        """Bring a blocked task's wake-up forward (e.g. a frame arrived)"""
+        if t_us < task.t_us:
+            t_us = task.t_us
+        if t_us < task.wake_us:
+            task.wake_us = t_us
+            if (task is not self.current and not task.passive
+                    and t_us < self.horizon):
+                self.horizon = t_us
+
+    def _yield(self, wake_us):
+        cur = self.current
+        cur.wake_us = wake_us
+        self._back.release()
+        cur.go.acquire()
+        if cur.killed:
+            raise SimExit()
+        cur.t_us = cur.wake_us
+
+    # Driver side
+    def _next(self):
+        best = None
+        for t in self.tasks:
+            if not t.done and (best is None or t.wake_us < best.wake_us):
+                best = t
+        return best
+
+    def run_until(self, t_us, stop=None):
+        """Run tasks until every one is past t_us or stop() returns True"""
+        while True:
+            task = self._next()
+            if task is None or task.wake_us > t_us:
+                break
+            if stop is not None and stop():
+                break
+            self.horizon = t_us
+            for o in self.tasks:
+                if (o is not task and not o.done and not o.passive
+                        and o.wake_us < self.horizon):
+                    self.horizon = o.wake_us
+            self.current = task
+            self.switches += 1
+            task.go.release()
+            self._back.acquire()
+            self.current = None
+            if task.error is not None:
+                err = task.error
+                task.error = None
+                raise RuntimeError("task %r crashed" % task.name) from err
+        if t_us > self._idle_t:
+            self._idle_t = t_us
+        return self._idle_t
+
+    def kill_all(self):
+        for t in self.tasks:
+            if not t.done:
+                t.killed = True
+                self.current = t
+                t.go.release()
+                self._back.acquire()
+        self.current = None
@@ -0,0 +1,104 @@
+# sim/logbench.py - loop time spent logging an RFID scan
+#
+#   python -m sim.logbench
+#   python -m sim.logbench --per-pass 8
+#
+# Logs the nine records of one RFID scan two ways, against a UART model
+# that blocks the writer for the time the bytes take on the wire at
+# 115200 baud:
+#
+#   print   synchronous print() of every record in the scan pass
+#   ring    ringlog: the scan pass stores the records, then every pass
+#           (the scan pass included) drains --per-pass of them at its
+#           idle point until the ring is empty
+#
+# For the ring the same bytes still reach the UART, just spread over
+# several passes, so both the scan pass alone and the total over every
+# pass until the ring is empty are reported. Host Python time is
+# included on both sides.
+
+import argparse, time, types
+
+import ringlog
+
+BAUD = 115200
+
+
+class UART:
+    # 10 bits per byte on the wire, write() blocks until sent
+    def __init__(self):
+        self.busy_s = 0.0
+
+    def write(self, s):
+        self.busy_s += len(s) * 10.0 / BAUD
+
+
+def scan_event(emit):
+    emit("\n" + "=" * 40)
+    emit("RFID DETECTED!")
+    emit("   UID: %s", "F1589C7B")
+    emit("   Name: %s", "Pranav")
+    emit("   Alert active: %s", True)
+    emit("   Scan recorded during alert.")
+    emit("   Soap used: %s", False)
+    emit("   Buzzer stopped by scan")
+    emit("=" * 40 + "\n")
+
+
+def timed(uart, fn):
+    """Seconds of loop time fn() takes: host time plus UART blocking"""
+    busy = uart.busy_s
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0 + uart.busy_s - busy
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m sim.logbench")
+    p.add_argument("--rounds", type=int, default=2000)
+    p.add_argument("--per-pass", type=int, default=4,
+                   help="records drained per pass (mainsensor's LOG_DRAIN_PER_PASS)")
+    args = p.parse_args(argv)
+
+    ringlog.time = types.SimpleNamespace(
+        ticks_ms=lambda: time.perf_counter_ns() // 1000000)
+    uart = UART()
+
+    def sync_print(fmt, *a):
+        uart.write((fmt % a if a else fmt) + "\n")
+
+    sync_s = 0.0
+    for _ in range(args.rounds):
+        sync_s += timed(uart, lambda: scan_event(sync_print))
+    sync_s /= args.rounds
+
+    first_s = total_s = worst_s = 0.0
+    passes = 0
+    for _ in range(args.rounds):
+        def scan_pass():
+            scan_event(ringlog.info)
+            ringlog.drain(args.per_pass, uart)
+        s = timed(uart, scan_pass)
+        first_s += s
+        total_s += s
+        worst_s = max(worst_s, s)
+        passes += 1
+        while ringlog.pending():
+            s = timed(uart, lambda: ringlog.drain(args.per_pass, uart))
+            total_s += s
+            worst_s = max(worst_s, s)
+            passes += 1
+    first_s /= args.rounds
+    total_s /= args.rounds
+
+    print("scan event, synchronous print:  %.2f ms in the scan pass" % (sync_s * 1e3))
+    print("scan event, ring, scan pass:    %.2f ms (%d records drained)"
+          % (first_s * 1e3, args.per_pass))
+    print("scan event, ring, all passes:   %.2f ms over %.1f passes, worst pass %.2f ms"
+          % (total_s * 1e3, passes / args.rounds, worst_s * 1e3))
+    print("scan pass: %.1fx less loop time; total: %.2fx"
+          % (sync_s / first_s, sync_s / total_s))
+
+
+if __name__ == "__main__":
+    main()
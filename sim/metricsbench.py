@@ -0,0 +1,41 @@
+# sim/metricsbench.py - cost of metrics.py's loop instrumentation
+#
+#   python -m sim.metricsbench
+#   python -m sim.metricsbench --passes 50000
+#
+# Times one loop pass worth of LoopMetrics calls (a span per stage and
+# loop_done) on the host, against the nominal pass time (50 ms sleep +
+# work). The ticks_us() stand-in is perf_counter based, so this is the
+# Python cost of the histograms, not the board's.
+
+import argparse, time, types
+
+import metrics
+
+STAGES = ("http", "rfid", "weight", "us1", "us2", "save")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m sim.metricsbench")
+    p.add_argument("--passes", type=int, default=20000)
+    args = p.parse_args(argv)
+
+    metrics.time = types.SimpleNamespace(
+        ticks_us=lambda: time.perf_counter_ns() // 1000,
+        ticks_diff=lambda a, b: a - b)
+    m = metrics.LoopMetrics(STAGES, 100000)
+    ticks_us = metrics.time.ticks_us
+    t_start = time.perf_counter()
+    for _ in range(args.passes):
+        lt = ticks_us()
+        for i in range(len(STAGES)):
+            t0 = ticks_us()
+            m.span(i, t0)
+        m.loop_done(lt)
+    per_pass = (time.perf_counter() - t_start) / args.passes
+    print("instrumentation per pass: %.1f us" % (per_pass * 1e6))
+    print("overhead at 50 ms/pass:  %.3f %%" % (per_pass / 0.050 * 100))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+# sim/modules.py - time, sys, gc, os and friends for one simulated node
+
+import binascii, gc as host_gc, json, os as host_os, sys as host_sys
+import tracemalloc, types
+
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD >> 1
+
+# The clock-read cost keeps `while ticks_diff(ticks_us(), t0) < x: pass`
+# style loops finite
+TICKS_CALL_US = 1
+
+
+def time_module(node):
+    sched = node.sched
+    m = types.ModuleType("time")
+
+    def ticks_us():
+        sched.spend(TICKS_CALL_US)
+        return (node.boot_offset_us + sched.now()) & TICKS_MAX
+
+    def ticks_ms():
+        sched.spend(TICKS_CALL_US)
+        return ((node.boot_offset_us + sched.now()) // 1000) & TICKS_MAX
+
+    def ticks_cpu():
+        return ticks_us()
+
+    def ticks_diff(a, b):
+        return ((a - b + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
+
+    def ticks_add(t, delta):
+        return (t + delta) & TICKS_MAX
+
+    def sleep_us(us):
+        if us > 0:
+            node.sleep_until(sched.now() + int(us))
+
+    def sleep_ms(ms):
+        if ms > 0:
+            node.sleep_until(sched.now() + int(ms) * 1000)
+
+    def sleep(s):
+        if s > 0:
+            node.sleep_until(sched.now() + int(s * 1000000))
+
+    def time_():
+        return node.epoch + (node.boot_offset_us + sched.now()) // 1000000
+
+    def time_ns():
+        return (node.epoch * 1000000 + node.boot_offset_us + sched.now()) * 1000
+
+    def localtime(secs=None):
+        import time as host_time
+        return host_time.gmtime(time_() if secs is None else secs)[:8]
+
+    m.ticks_us = ticks_us
+    m.ticks_ms = ticks_ms
+    m.ticks_cpu = ticks_cpu
+    m.ticks_diff = ticks_diff
+    m.ticks_add = ticks_add
+    m.sleep_us = sleep_us
+    m.sleep_ms = sleep_ms
+    m.sleep = sleep
+    m.time = time_
+    m.time_ns = time_ns
+    m.localtime = localtime
+    m.gmtime = localtime
+    return m
+
+
+def sys_module(node):
+    m = types.ModuleType("sys")
+    for k in ("path", "version", "version_info", "byteorder", "maxsize",
+              "exc_info", "modules", "argv", "getrecursionlimit"):
+        if hasattr(host_sys, k):
+            setattr(m, k, getattr(host_sys, k))
+    m.platform = "esp32"
+    m.implementation = types.SimpleNamespace(name="micropython",
+                                             version=(1, 22, 0), _mpy=0)
+    m.stdin = node.stdin
+    m.stdout = node.stdout
+    m.stderr = node.stdout
+
+    def print_exception(exc, file=None):
+        import traceback
+        (file or node.stdout).write(
+            "".join(traceback.format_exception(type(exc), exc, exc.__traceback__)))
+
+    def exit(code=0):
+        raise SystemExit(code)
+
+    m.print_exception = print_exception
+    m.exit = exit
+    return m
+
+
+def gc_module(node, heap_size=8 * 1024 * 1024):
+    # With tracemalloc running (Simulation(trace_alloc=True)) mem_alloc()
+    # models a MicroPython heap with automatic collection off: it only
+    # grows until collect(). CPython frees temporaries by reference
+    # counting, so between two mem_alloc() calls the heap is charged the
+    # traced peak over the level at the previous call, which counts the
+    # temporaries of a loop pass as well as what it keeps. Temporaries that
+    # never live at the same time count once, so this is a lower bound on
+    # what MicroPython would allocate. collect() brings the heap back to
+    # what is live. CPython objects are several times the size of
+    # MicroPython ones, hence the roomy heap. Without tracemalloc the heap
+    # looks empty.
+    m = types.ModuleType("gc")
+    state = {"enabled": True, "collections": 0, "threshold": -1}
+    heap = {"base": 0, "used": 0, "last": 0}
+    if tracemalloc.is_tracing():
+        heap["base"] = heap["last"] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+    def mem_alloc():
+        if not tracemalloc.is_tracing():
+            return 0
+        cur, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        heap["used"] += max(0, peak - heap["last"])
+        heap["last"] = cur
+        return heap["used"]
+
+    def mem_free():
+        return max(0, heap_size - mem_alloc())
+
+    def collect():
+        state["collections"] += 1
+        # a sweep of a ~100 KB MicroPython heap takes a few ms on an ESP32
+        node.sched.spend(2500)
+        host_gc.collect()
+        if tracemalloc.is_tracing():
+            cur = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            heap["used"] = max(0, cur - heap["base"])
+            heap["last"] = cur
+        return 0
+
+    def enable():
+        state["enabled"] = True
+
+    def disable():
+        state["enabled"] = False
+
+    def isenabled():
+        return state["enabled"]
+
+    def threshold(n=None):
+        if n is None:
+            return state["threshold"]
+        state["threshold"] = n
+
+    m.mem_alloc = mem_alloc
+    m.mem_free = mem_free
+    m.collect = collect
+    m.enable = enable
+    m.disable = disable
+    m.isenabled = isenabled
+    m.threshold = threshold
+    m.state = state
+    return m
+
+
+def micropython_module(node):
+    m = types.ModuleType("micropython")
+    m.const = lambda x: x
+    m.native = lambda f: f
+    m.viper = lambda f: f
+    m.mem_info = lambda *a: None
+    m.alloc_emergency_exception_buf = lambda n: None
+    m.schedule = lambda fn, arg: fn(arg)
+    m.opt_level = lambda *a: 0
+    return m
+
+
+def os_module(node):
+    m = types.ModuleType("os")
+    root = node.fs
+
+    def p(path):
+        return host_os.path.join(root, path.lstrip("/"))
+
+    m.listdir = lambda path="": host_os.listdir(p(path))
+    m.remove = lambda path: host_os.remove(p(path))
+    m.rename = lambda a, b: host_os.replace(p(a), p(b))
+    m.mkdir = lambda path: host_os.mkdir(p(path))
+    m.rmdir = lambda path: host_os.rmdir(p(path))
+    m.stat = lambda path: tuple(host_os.stat(p(path)))
+    m.sync = lambda: None
+    m.uname = lambda: types.SimpleNamespace(
+        sysname="esp32", nodename="esp32", release="1.22.0",
+        version="v1.22.0 (sim)", machine="Simulated ESP32")
+    m.urandom = host_os.urandom
+    m.sep = "/"
+    return m
+
+
+def node_open(node):
+    def open_(path, mode="r", *args, **kw):
+        if isinstance(path, str) and not host_os.path.isabs(path):
+            path = host_os.path.join(node.fs, path)
+        elif isinstance(path, str):
+            path = host_os.path.join(node.fs, path.lstrip("/"))
+        f = open(path, mode, *args, **kw)
+        # flash writes are slow: charge erase/program time per write
+        if any(c in mode for c in "wa+"):
+            node.sched.spend(node.flash_write_us)
+        return f
+    return open_
+
+
+def framebuf_module(node):
+    m = types.ModuleType("framebuf")
+    m.MONO_VLSB = 0
+    m.MONO_HLSB = 3
+    m.MONO_HMSB = 4
+
+    class FrameBuffer:
+        # pixel-exact drawing is not needed; text() keeps the strings so
+        # scenarios can read the display, and marks a block per glyph
+        def __init__(self, buf, width, height, fmt, stride=None):
+            self.buf = buf
+            self.width = width
+            self.height = height
+            self.lines = {}
+
+        def fill(self, col):
+            v = 0xFF if col else 0
+            for i in range(len(self.buf)):
+                self.buf[i] = v
+            self.lines = {}
+
+        def pixel(self, x, y, col=None):
+            if not (0 <= x < self.width and 0 <= y < self.height):
+                return 0
+            i = (y // 8) * self.width + x
+            bit = 1 << (y & 7)
+            if col is None:
+                return 1 if self.buf[i] & bit else 0
+            if col:
+                self.buf[i] |= bit
+            else:
+                self.buf[i] &= ~bit
+
+        def text(self, s, x, y, col=1):
+            self.lines[y] = self.lines.get(y, "")[:max(0, x // 8)].ljust(x // 8) + s
+            page = y // 8
+            if 0 <= page < self.height // 8:
+                for k, ch in enumerate(s):
+                    base = page * self.width + x + k * 8
+                    for j in range(7):
+                        if 0 <= x + k * 8 + j < self.width:
+                            self.buf[base + j] = ord(ch) if col else 0
+
+        def hline(self, x, y, w, col):
+            for i in range(w):
+                self.pixel(x + i, y, col)
+
+        def rect(self, x, y, w, h, col, fill=False):
+            for i in range(w):
+                self.pixel(x + i, y, col)
+                self.pixel(x + i, y + h - 1, col)
+
+        def fill_rect(self, x, y, w, h, col):
+            for j in range(h):
+                for i in range(w):
+                    self.pixel(x + i, y + j, col)
+
+        def scroll(self, dx, dy):
+            pass
+
+        def blit(self, fb, x, y, key=-1, palette=None):
+            pass
+
+    m.FrameBuffer = FrameBuffer
+    return m
+
+
+def misc_modules(node):
+    ubinascii = types.ModuleType("ubinascii")
+    ubinascii.hexlify = binascii.hexlify
+    ubinascii.unhexlify = binascii.unhexlify
+    ubinascii.crc32 = binascii.crc32
+    ubinascii.b2a_base64 = binascii.b2a_base64
+    ubinascii.a2b_base64 = binascii.a2b_base64
+
+    ujson = types.ModuleType("ujson")
+    ujson.dumps = lambda o: json.dumps(o, separators=(",", ":"))
+    ujson.loads = json.loads
+    ujson.load = json.load
+    ujson.dump = lambda o, f: f.write(ujson.dumps(o))
+
+    esp = types.ModuleType("esp")
+    esp.osdebug = lambda *a: None
+    esp.flash_size = lambda: 4 * 1024 * 1024
+
+    ntptime = types.ModuleType("ntptime")
+    ntptime.settime = lambda: None
+    ntptime.host = "pool.ntp.org"
+
+    return {
+        "ubinascii": ubinascii, "binascii": ubinascii,
+        "ujson": ujson, "json": ujson,
+        "esp": esp, "ntptime": ntptime,
+    }
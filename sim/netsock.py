@@ -0,0 +1,353 @@
+# sim/netsock.py - socket and uselect stand-ins backed by in-memory pipes
+#
+# Only what the node programs use: a listening TCP socket on the node, and
+# client connections opened from the host side with Node.http_get() or
+# Node.open_stream().
+#
+# What the node sends goes through lwIP's send buffer, SNDBUF bytes on the
+# ESP32 port: send() takes what fits, the bytes go out as far as the
+# client's receive window allows, and their room is only given back when
+# they are acknowledged, rtt_us after they went out. A healthy client thus
+# takes SNDBUF bytes per round trip, and a response bigger than that has
+# to wait for the first ACKs however fast the client reads.
+
+import collections, errno, types
+
+SNDBUF = 5744       # TCP_SND_BUF, 4 x MSS (ESP-IDF default)
+RTT_US = 30000      # a phone or laptop on the same Wi-Fi
+
+
+class Conn:
+    """One TCP connection seen from the node (server) side"""
+
+    def __init__(self, node, request=b"", window=1 << 20, sndbuf=SNDBUF,
+                 rtt_us=RTT_US):
+        self.node = node
+        self.rx = bytearray(request)
+        self.tx = bytearray()    # arrived at the client, not taken yet
+        self.window = window     # bytes the client will still accept
+        self.sndbuf = sndbuf
+        self.rtt_us = rtt_us
+        self.queued = bytearray()            # in the send buffer, not sent
+        self.unacked = collections.deque()   # (ack time, bytes) on the wire
+        self.in_flight = 0
+        self.peer_closed = False
+        self.closed = False
+        self.timeout = None
+        self.t_open = node.sched.now()
+        self.t_first_byte = None
+        self.t_closed = None
+
+    # host (client) side
+    def send(self, data):
+        self.rx += data
+        self.node.kick()
+
+    def hang_up(self):
+        self.peer_closed = True
+        self.node.kick()
+
+    def take(self):
+        self._pump()
+        data = bytes(self.tx)
+        self.window += len(data)
+        self.tx = bytearray()
+        # what was waiting on the window goes out now
+        self._pump()
+        return data
+
+    # lwIP send buffer
+    def _pump(self):
+        now = self.node.sched.now()
+        q = self.unacked
+        while q and q[0][0] <= now:
+            self.in_flight -= q.popleft()[1]
+        n = min(len(self.queued), self.window)
+        if n:
+            self.tx += self.queued[:n]
+            del self.queued[:n]
+            self.window -= n
+            q.append((now + self.rtt_us, n))
+            self.in_flight += n
+
+    def room(self):
+        """Bytes the send buffer takes right now"""
+        self._pump()
+        return self.sndbuf - len(self.queued) - self.in_flight
+
+    # uselect hook
+    def _readable(self):
+        return bool(self.rx) or self.peer_closed
+
+
+class StdIn:
+    """UART0/USB serial as seen by sys.stdin on the node
+
+    Bytes fed from the host arrive at the line rate and land in the port's
+    stdin ring buffer (260 bytes on the ESP32 port); what arrives while it
+    is full is lost and counted in `dropped`.
+    """
+
+    def __init__(self, node, ring=260, baud=115200):
+        self.node = node
+        self.rx = bytearray()
+        self.ring = ring
+        self.byte_us = 10 * 1000000 / baud
+        self.pending = bytearray()      # on the wire
+        self.t_next = 0                 # arrival time of pending[0]
+        self.dropped = 0
+        self.buffer = BinaryStdIn(self)
+
+    def feed(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        now = self.node.sched.now()
+        self._admit(now)
+        if not self.pending:
+            self.t_next = max(self.t_next, now + self.byte_us)
+        self.pending += data
+        self.node.kick()
+
+    def _admit(self, now):
+        if not self.pending or now < self.t_next:
+            return
+        n = min(len(self.pending), int((now - self.t_next) / self.byte_us) + 1)
+        room = max(0, self.ring - len(self.rx))
+        self.rx += self.pending[:min(n, room)]
+        self.dropped += max(0, n - room)
+        del self.pending[:n]
+        self.t_next += n * self.byte_us
+
+    def _readable(self):
+        self._admit(self.node.sched.now())
+        return bool(self.rx)
+
+    def _wait(self, n):
+        while True:
+            self._admit(self.node.sched.now())
+            if len(self.rx) >= n:
+                return
+            self.node.sleep_until(self.node.sched.now() + 1000)
+
+    def read(self, n=1):
+        self._wait(n)
+        data = bytes(self.rx[:n])
+        del self.rx[:n]
+        return data.decode("latin-1")
+
+
+class BinaryStdIn:
+    def __init__(self, text):
+        self.text = text
+
+    def _readable(self):
+        return self.text._readable()
+
+    def read(self, n=1):
+        self.text._wait(n)
+        rx = self.text.rx
+        data = bytes(rx[:n])
+        del rx[:n]
+        return data
+
+    def readinto(self, buf, n=None):
+        n = len(buf) if n is None else n
+        self.text._wait(n)
+        rx = self.text.rx
+        buf[:n] = rx[:n]
+        del rx[:n]
+        return n
+
+
+class StdOut:
+    """Serial TX: text written by the node, optionally echoed to the host"""
+
+    def __init__(self, node, echo=None):
+        self.node = node
+        self.echo = echo
+        self.data = bytearray()
+        self.buffer = self
+        self.baud = 115200
+
+    def write(self, s):
+        b = s.encode() if isinstance(s, str) else bytes(s)
+        self.data += b
+        # the REPL UART blocks the writer for the time on the wire
+        self.node.sched.spend(len(b) * 10 * 1000000 // self.baud)
+        if self.echo is not None:
+            self.echo(self.node, b)
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = bytes(self.data)
+        self.data = bytearray()
+        return data
+
+
+def socket_module(node):
+    m = types.ModuleType("socket")
+    m.AF_INET = 2
+    m.SOCK_STREAM = 1
+    m.SOCK_DGRAM = 2
+    m.SOL_SOCKET = 1
+    m.SO_REUSEADDR = 4
+    m.IPPROTO_TCP = 6
+
+    def getaddrinfo(host, port, *args):
+        return [(m.AF_INET, m.SOCK_STREAM, 0, "", (host, port))]
+
+    class socket:
+        def __init__(self, af=2, type=1, proto=0, conn=None):
+            self.conn = conn
+            self.port = None
+            self.backlog = None
+            self.blocking = True
+            self.timeout = None
+
+        def setsockopt(self, *args):
+            pass
+
+        def bind(self, addr):
+            self.port = addr[1]
+
+        def listen(self, n=1):
+            self.backlog = []
+            node.listeners[self.port] = self
+
+        def setblocking(self, flag):
+            self.blocking = flag
+            self.timeout = None if flag else 0
+
+        def settimeout(self, t):
+            self.timeout = t
+            self.blocking = t is None or t > 0
+
+        def _readable(self):
+            if self.backlog is not None:
+                return bool(self.backlog)
+            return self.conn._readable()
+
+        def _block(self, cond):
+            # wait for cond(), honouring blocking mode and timeout
+            if cond():
+                return True
+            if not self.blocking:
+                raise OSError(errno.EAGAIN)
+            deadline = None
+            if self.timeout:
+                deadline = node.sched.now() + int(self.timeout * 1000000)
+            while not cond():
+                now = node.sched.now()
+                if deadline is not None and now >= deadline:
+                    raise OSError(errno.ETIMEDOUT)
+                node.sleep_until(now + 1000)
+            return True
+
+        def accept(self):
+            self._block(lambda: bool(self.backlog))
+            conn = self.backlog.pop(0)
+            node.sched.spend(300)
+            return socket(conn=conn), ("10.0.0.99", 50000)
+
+        def recv(self, n):
+            c = self.conn
+            self._block(lambda: bool(c.rx) or c.peer_closed)
+            data = bytes(c.rx[:n])
+            del c.rx[:n]
+            node.sched.spend(80 + len(data) // 8)
+            return data
+
+        def send(self, data):
+            c = self.conn
+            if c.peer_closed:
+                raise OSError(errno.ECONNRESET)
+            n = min(len(data), c.room())
+            if n == 0:
+                if not self.blocking:
+                    raise OSError(errno.EAGAIN)
+                self._block(lambda: c.room() > 0 or c.peer_closed)
+                if c.peer_closed:
+                    raise OSError(errno.ECONNRESET)
+                n = min(len(data), c.room())
+            if c.t_first_byte is None:
+                c.t_first_byte = node.sched.now()
+            c.queued += bytes(data[:n])
+            c._pump()
+            node.sched.spend(100 + n // 4)
+            return n
+
+        def sendall(self, data):
+            data = bytes(data)
+            while data:
+                n = self.send(data)
+                data = data[n:]
+
+        write = sendall
+
+        def close(self):
+            if self.conn is not None and not self.conn.closed:
+                self.conn.closed = True
+                self.conn.t_closed = node.sched.now()
+            if self.backlog is not None:
+                node.listeners.pop(self.port, None)
+
+        def __hash__(self):
+            return id(self)
+
+    m.getaddrinfo = getaddrinfo
+    m.socket = socket
+    return m
+
+
+def uselect_module(node):
+    m = types.ModuleType("uselect")
+    m.POLLIN = 1
+    m.POLLOUT = 4
+    m.POLLERR = 8
+    m.POLLHUP = 16
+
+    class poll:
+        def __init__(self):
+            self.objs = {}
+
+        def register(self, obj, mask=1):
+            self.objs[id(obj)] = (obj, mask)
+
+        def unregister(self, obj):
+            if id(obj) not in self.objs:
+                raise KeyError(obj)
+            del self.objs[id(obj)]
+
+        def modify(self, obj, mask):
+            self.objs[id(obj)] = (obj, mask)
+
+        def _ready(self):
+            out = []
+            for obj, mask in list(self.objs.values()):
+                if mask & m.POLLIN and obj._readable():
+                    out.append((obj, m.POLLIN))
+            return out
+
+        def poll(self, timeout=-1):
+            node.sched.spend(20 + 5 * len(self.objs))
+            ready = self._ready()
+            if ready or timeout == 0:
+                return ready
+            deadline = None if timeout < 0 else node.sched.now() + timeout * 1000
+            while not ready:
+                now = node.sched.now()
+                if deadline is not None and now >= deadline:
+                    break
+                node.sleep_until(now + 1000 if deadline is None
+                                 else min(deadline, now + 1000))
+                ready = self._ready()
+            return ready
+
+        def ipoll(self, timeout=-1, flags=0):
+            return iter(self.poll(timeout))
+
+    m.poll = poll
+    return m
@@ -0,0 +1,192 @@
+# sim/node.py - one simulated ESP32 running repo programs unmodified
+#
+# The node gets its own copies of machine/time/sys/network/... and its own
+# instances of the repo modules (hx711, httpserver, ringlog, ...), loaded
+# through a private __import__ so two nodes never share module state.
+
+import builtins, os, tempfile, types
+
+from .aio import asyncio_module
+from .board import Board
+from .modules import (time_module, sys_module, gc_module, micropython_module,
+                      os_module, node_open, framebuf_module, misc_modules)
+from .netsock import Conn, StdIn, StdOut, socket_module, uselect_module
+from .radio import espnow_module, network_module
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The sensor program imports the RFID driver under the name it has on the
+# board's filesystem; the repo keeps it as mfrcc.py
+ALIASES = {"mfrc22": "mfrcc"}
+
+
+class Node:
+    def __init__(self, sim, name, programs, mac, fs=None, modules=None,
+                 echo=None, boot_at_us=0, passive=False):
+        self.sim = sim
+        self.sched = sim.sched
+        self.name = name
+        self.programs = programs
+        self.mac = bytes(mac)
+        self.fs = fs or tempfile.mkdtemp(prefix="dishduty-%s-" % name)
+        self.boot_at_us = boot_at_us
+        self.passive = passive
+        # ticks start at 0 when the node boots, like a real reset
+        self.boot_offset_us = -boot_at_us
+        self.epoch = 1760000000
+        self.flash_write_us = 20000
+        self.listeners = {}
+        self.wlan = {}
+        self.espnow = None
+        self.task = None
+        self.globals = None
+        self.freq_changes = []
+        self.sleeps = []
+        self.idle_us = 0        # virtual time spent sleeping or waiting
+        self.asleep_at = None   # start of the sleep in progress
+        self.on_wake = None
+        self.board = Board(self)
+        self.stdin = StdIn(self)
+        self.stdout = StdOut(self, echo)
+        self.machine = self.board.machine_module()
+        self.time = time_module(self)
+
+        self.modules = {
+            "machine": self.machine,
+            "time": self.time,
+            "utime": self.time,
+            "sys": sys_module(self),
+            "usys": None,
+            "gc": gc_module(self),
+            "micropython": micropython_module(self),
+            "os": os_module(self),
+            "uos": None,
+            "framebuf": framebuf_module(self),
+            "network": network_module(self, sim.ap),
+            "espnow": espnow_module(self, sim.air),
+            "socket": socket_module(self),
+            "usocket": None,
+            "uselect": uselect_module(self),
+            "select": None,
+            "asyncio": asyncio_module(self),
+            "uasyncio": None,
+        }
+        self.modules["usys"] = self.modules["sys"]
+        self.modules["uos"] = self.modules["os"]
+        self.modules["usocket"] = self.modules["socket"]
+        self.modules["select"] = self.modules["uselect"]
+        self.modules["uasyncio"] = self.modules["asyncio"]
+        self.modules.update(misc_modules(self))
+        if modules:
+            for k, factory in modules.items():
+                self.modules[k] = factory(self) if callable(factory) else factory
+
+        self.builtins = dict(builtins.__dict__)
+        self.builtins["__import__"] = self._import
+        self.builtins["open"] = node_open(self)
+        self.builtins["print"] = self._print
+        sim.air.attach(self)
+
+    # Module loading
+    def _print(self, *args, sep=" ", end="\n", file=None):
+        (file or self.stdout).write(sep.join(str(a) for a in args) + end)
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        mod = self.modules.get(name)
+        if mod is not None:
+            return mod
+        real = ALIASES.get(name, name)
+        path = os.path.join(self.sim.repo, real.replace(".", "/") + ".py")
+        if level == 0 and "." not in name and os.path.exists(path):
+            return self.load(name, path)
+        return builtins.__import__(name, globals, locals, fromlist, level)
+
+    def load(self, name, path):
+        mod = types.ModuleType(name)
+        mod.__file__ = path
+        mod.__dict__["__builtins__"] = self.builtins
+        self.modules[name] = mod
+        with open(path) as f:
+            code = compile(f.read(), path, "exec")
+        exec(code, mod.__dict__)
+        return mod
+
+    def _main(self):
+        g = {"__name__": "__main__", "__builtins__": self.builtins}
+        self.globals = g
+        for prog in self.programs:
+            path = os.path.join(self.sim.repo, prog)
+            with open(path) as f:
+                code = compile(f.read(), path, "exec")
+            exec(code, g)
+
+    def start(self):
+        self.task = self.sched.spawn(self.name, self._main, self.boot_at_us,
+                                     self.passive)
+        return self
+
+    # Scheduler hooks used by the stand-in modules
+    def sleep_until(self, t_us):
+        t0 = self.asleep_at = self.sched.now()
+        self.sched.sleep_until(t_us)
+        self.asleep_at = None
+        self.idle_us += self.sched.now() - t0
+        self.board.run_timers()
+
+    def idle_time(self):
+        """idle_us including a sleep still in progress, for host-side reads"""
+        if self.asleep_at is None:
+            return self.idle_us
+        return self.idle_us + self.sched.now() - self.asleep_at
+
+    def kick(self):
+        if self.task is not None and not self.task.done:
+            self.sched.wake(self.task, self.sched.now())
+
+    def on_freq(self, hz):
+        self.freq_changes.append((self.sched.now(), hz))
+
+    def on_lightsleep(self, ms):
+        t0 = self.sched.now()
+        self.sleep_until(t0 + (ms if ms is not None else 10 ** 9) * 1000)
+        self.sleeps.append((t0, self.sched.now()))
+
+    # Host-side access
+    def g(self, name, default=None):
+        return self.globals.get(name, default) if self.globals else default
+
+    def connect(self, request, port=80, window=1 << 20):
+        """Open a TCP connection to the node and send request bytes"""
+        lst = self.listeners.get(port)
+        if lst is None:
+            raise ConnectionRefusedError("%s: nothing listening on %d" % (self.name, port))
+        conn = Conn(self, request, window)
+        lst.backlog.append(conn)
+        self.kick()
+        return conn
+
+    def http_get(self, path, port=80, window=1 << 20):
+        req = ("GET %s HTTP/1.1\r\nHost: %s\r\n\r\n" % (path, self.name)).encode()
+        return self.connect(req, port, window)
+
+
+def decode_chunked(data):
+    """Split a raw HTTP response into (status, headers, body)"""
+    head, _, body = data.partition(b"\r\n\r\n")
+    lines = head.split(b"\r\n")
+    status = int(lines[0].split()[1]) if lines and len(lines[0].split()) > 1 else 0
+    headers = {}
+    for line in lines[1:]:
+        k, _, v = line.partition(b":")
+        headers[k.strip().lower().decode()] = v.strip().decode()
+    if headers.get("transfer-encoding") == "chunked":
+        out = bytearray()
+        while body:
+            size, _, rest = body.partition(b"\r\n")
+            n = int(size, 16)
+            if n == 0:
+                break
+            out += rest[:n]
+            body = rest[n + 2:]
+        body = bytes(out)
+    return status, headers, body
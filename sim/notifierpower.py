@@ -0,0 +1,255 @@
+# sim/notifierpower.py - notifier CPU duty cycle and wake-ups over a day
+#
+#   python -m sim.notifierpower                          # record, then replay
+#   python -m sim.notifierpower --save day.jsonl         # keep the trace
+#   python -m sim.notifierpower --trace day.jsonl --before HEAD~1
+#
+# A message trace is a day of what a sensor node sends the notifier: the
+# two-node setup (fast fidelity) runs --hours of scripted dish episodes
+# and every ESP-NOW frame to the notifier is kept, one JSON line each
+# ({"t": us from the start to delivery, "src": MAC hex, "msg": text}). The
+# trace is then replayed into main_actuator.py on its own (OLED attached),
+# once per firmware revision.
+#
+# The clock/power model: the simulator charges virtual time for the
+# notifier's work as if it ran at REF_HZ. Work done at a lower clock takes
+# REF_HZ / clock times as long, so the clock-scaled figures stretch every
+# busy stretch by the clock machine.freq() had set. CPU current is
+# estimated from the ESP32 datasheet's modem-sleep figures (CPU only,
+# without the radio, which stays in receive the whole time and dominates
+# the board's total):
+#
+#   duty         share of the day the CPU was not waiting (raw, clock-scaled)
+#   wake-ups     waits that ended, per hour
+#   clock        share of the day at each clock
+#   cpu mA       average CPU current under the model
+#   frame->LED   a status frame arriving -> its LED lit (p50, p99, worst;
+#                clock-scaled stretches the whole interval by the clock at
+#                arrival, an upper bound)
+
+import argparse, json, random, shutil
+
+from . import Simulation, firmware_tree
+from .devices import SSD1306Model
+from .dishduty import (DishDuty, plan_day, NOTIFIER_MAC, LED_GREEN, LED_RED,
+                       LED_YELLOW)
+
+REF_HZ = 160000000
+BOOT_S = 2.0
+# CPU current (mA) by clock: running, and idle in a wait (modem-sleep
+# ranges of the ESP32 datasheet, top and bottom end)
+CPU_MA = {
+    240000000: (68, 30),
+    160000000: (44, 27),
+    80000000: (31, 20),
+}
+LED_OF = {b"S|GREEN": LED_GREEN, b"S|YELLOW": LED_YELLOW, b"S|RED": LED_RED}
+
+
+def record(hours, episodes, seed=11):
+    """A sensor node's frames to the notifier over `hours`: [(t_us, src, msg)]"""
+    dd = DishDuty(fidelity="fast")
+    sim = dd.sim
+    sim.run_for(10)
+    t0 = sim.now_us
+    frames = []
+
+    def tap(t, src, dst, msg):
+        if bytes(dst) == NOTIFIER_MAC:
+            frames.append((t - t0, bytes(src), bytes(msg)))
+    sim.air.taps.append(tap)
+
+    rng = random.Random(seed)
+    days = max(1, int(hours / 24 + 0.999))
+    for d in range(days):
+        plan_day(dd.sink, t0 + d * 86400 * 1000000, rng, episodes)
+    sim.run_until(t0 + int(hours * 3600 * 1000000))
+    dd.close()
+    return frames
+
+
+def save(path, frames):
+    with open(path, "w") as f:
+        for t, src, msg in frames:
+            f.write(json.dumps({"t": t, "src": src.hex(), "msg": msg.decode()}) + "\n")
+
+
+def load(path):
+    frames = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                d = json.loads(line)
+                frames.append((d["t"], bytes.fromhex(d["src"]), d["msg"].encode()))
+    return frames
+
+
+class Meter:
+    """Wraps a node's sleep_until: busy and idle time per clock, wake-ups"""
+
+    def __init__(self, node):
+        self.node = node
+        self.sched = node.sched
+        self.busy = {}      # hz -> us of simulated (REF_HZ) work
+        self.idle = {}      # hz -> us waiting
+        self.wakes = 0
+        self.woke = None
+        self.inner = node.sleep_until
+        node.sleep_until = self.sleep_until
+
+    def start(self):
+        self.busy.clear()
+        self.idle.clear()
+        self.wakes = 0
+        self.woke = self.sched.now() if self.node.asleep_at is None else None
+
+    def sleep_until(self, t_us):
+        now = self.sched.now()
+        hz = self.node.board.freq_hz
+        if self.woke is not None:
+            self.busy[hz] = self.busy.get(hz, 0) + now - self.woke
+        self.inner(t_us)
+        t = self.sched.now()
+        if t > now:
+            self.idle[hz] = self.idle.get(hz, 0) + t - now
+            self.wakes += 1
+        self.woke = t
+
+
+def replay(repo, frames, hours):
+    sim = Simulation(repo=repo)
+    node = sim.add_node("notifier", ["main_actuator.py"], NOTIFIER_MAC,
+                        passive=True)
+    SSD1306Model(node.board, addr=0x3D)
+    meter = Meter(node)
+    lit = []
+    for pin in (LED_GREEN, LED_YELLOW, LED_RED):
+        node.board.listen(pin, lambda v, t, pin=pin: lit.append((t, pin)) if v else None)
+    sim.start()
+    sim.run_for(BOOT_S)
+
+    t0 = sim.now_us
+    t1 = t0 + int(hours * 3600 * 1000000)
+    sched = sim.sched
+
+    def sender():
+        for t, src, msg in frames:
+            if t0 + t >= t1:
+                return
+            sched.sleep_until(t0 + t - sim.air.latency_us)
+            sim.air.send(src, NOTIFIER_MAC, msg)
+    sched.spawn("sensor", sender, t0)
+    meter.start()
+    lit_from = len(lit)
+    sim.run_until(t1)
+    # close the last stretch
+    meter.sleep_until(sched.now())
+    freqs = list(node.freq_changes)
+    sim.close()
+
+    # status frames that change the LED, and when that LED came on
+    lat = []
+    lat_scaled = []
+    lit = lit[lit_from:]
+    j = 0
+    shown = None
+    for t, src, msg in frames:
+        pin = LED_OF.get(msg)
+        if pin is None or t0 + t >= t1:
+            continue
+        if pin == shown:
+            continue
+        shown = pin
+        arrive = t0 + t
+        while j < len(lit) and lit[j][0] < arrive:
+            j += 1
+        k = j
+        while k < len(lit) and lit[k][1] != pin:
+            k += 1
+        if k == len(lit):
+            continue
+        us = lit[k][0] - arrive
+        lat.append(us)
+        hz = REF_HZ
+        for ft, fhz in freqs:
+            if ft > arrive:
+                break
+            hz = fhz
+        lat_scaled.append(us * REF_HZ / hz)
+
+    total = t1 - t0
+    busy = sum(meter.busy.values())
+    busy_scaled = sum(us * REF_HZ / hz for hz, us in meter.busy.items())
+    at = {}
+    for hz, us in meter.busy.items():
+        at[hz] = at.get(hz, 0) + us * REF_HZ / hz
+    idle_left = total - busy_scaled
+    idle_sum = sum(meter.idle.values()) or 1
+    for hz, us in meter.idle.items():
+        at[hz] = at.get(hz, 0) + idle_left * us / idle_sum
+    ma = 0.0
+    for hz, us in meter.busy.items():
+        ma += CPU_MA.get(hz, CPU_MA[REF_HZ])[0] * us * REF_HZ / hz
+    for hz, us in meter.idle.items():
+        ma += CPU_MA.get(hz, CPU_MA[REF_HZ])[1] * idle_left * us / idle_sum
+    lat.sort()
+    lat_scaled.sort()
+    return {
+        "duty": busy / total,
+        "duty_scaled": busy_scaled / total,
+        "wakes_h": meter.wakes / (total / 3600e6),
+        "clock": {hz: us / total for hz, us in sorted(at.items(), reverse=True)},
+        "cpu_ma": ma / total,
+        "lat": lat,
+        "lat_scaled": lat_scaled,
+        "switches": len(freqs),
+    }
+
+
+def pct(xs, q):
+    return xs[min(len(xs) - 1, int(len(xs) * q))] / 1000 if xs else 0.0
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m sim.notifierpower")
+    p.add_argument("--hours", type=float, default=24.0)
+    p.add_argument("--episodes", type=int, default=6, help="dish episodes a day")
+    p.add_argument("--trace", help="replay this message trace instead of recording one")
+    p.add_argument("--save", metavar="FILE", help="write the recorded trace here")
+    p.add_argument("--before", metavar="REV",
+                   help="also run the notifier at this git revision")
+    args = p.parse_args(argv)
+
+    if args.trace:
+        frames = load(args.trace)
+    else:
+        frames = record(args.hours, args.episodes)
+        if args.save:
+            save(args.save, frames)
+    print("%d frames over %.1f h" % (len(frames), args.hours))
+
+    revs = [("this checkout", None)]
+    if args.before:
+        revs.insert(0, (args.before, firmware_tree(args.before)))
+    print("%-14s | %6s %7s | %9s | %-22s | %6s | %21s"
+          % ("notifier", "duty", "scaled", "wakes/h", "clock", "cpu mA",
+             "frame->LED ms p50/p99/max"))
+    for name, repo in revs:
+        r = replay(repo, frames, args.hours)
+        clock = " ".join("%d:%.1f%%" % (hz // 1000000, 100 * share)
+                         for hz, share in r["clock"].items())
+        print("%-14s | %5.2f%% %6.2f%% | %9.0f | %-22s | %6.1f | %6.2f %6.2f %6.2f"
+              % (name, 100 * r["duty"], 100 * r["duty_scaled"], r["wakes_h"],
+                 clock, r["cpu_ma"], pct(r["lat"], 0.5), pct(r["lat"], 0.99),
+                 r["lat"][-1] / 1000 if r["lat"] else 0.0))
+        print("%-14s | %d LED changes measured, %d clock switches; clock-scaled "
+              "frame->LED %.2f / %.2f / %.2f ms"
+              % ("", len(r["lat"]), r["switches"], pct(r["lat_scaled"], 0.5),
+                 pct(r["lat_scaled"], 0.99),
+                 r["lat_scaled"][-1] / 1000 if r["lat_scaled"] else 0.0))
+        if repo:
+            shutil.rmtree(repo, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# sim/pagealloc.py - peak allocation of the stats page against roster size
+#
+#   python -m sim.pagealloc
+#   python -m sim.pagealloc --names 3 50 500 2000
+#
+# Boots mainsensor.py in the simulator, then swaps in a roster of N made-up
+# names (ALL_NAMES, duty_order, name_counts), re-sorts the roster the way
+# a count change does (recompute_next_up()) and calls its render_html()
+# directly, through httpwriter.ResponseWriter on a fake socket that only
+# counts bytes. The writer's buffer is allocated up front, as HTTPServer
+# does. tracemalloc's peak is reset before every call:
+#
+#   sort     peak of recompute_next_up(), paid once per change to the
+#            counts or the order, not per page view
+#   render   peak of the full render_html() call, a page view
+#
+# CPython objects are several times the size of MicroPython ones, so the
+# absolute numbers are high; what matters is that render stays a small
+# multiple of HTTP_BUF_SIZE and does not grow with the roster. Exit status
+# is 1 when render goes over --limit buffers' worth at any roster size.
+
+import argparse, sys, tracemalloc
+
+from .dishduty import DishDuty
+
+
+class CountingSocket:
+    def __init__(self):
+        self.sent = 0
+        self.sends = 0
+
+    def sendall(self, data):
+        self.sent += len(data)
+        self.sends += 1
+
+
+def peak(fn):
+    """Peak bytes allocated while fn() runs, over what was live before"""
+    tracemalloc.reset_peak()
+    start = tracemalloc.get_traced_memory()[0]
+    fn()
+    return tracemalloc.get_traced_memory()[1] - start
+
+
+def measure(node, n):
+    names = ["Person%04d" % i for i in range(n)]
+    g = node.globals
+    g["ALL_NAMES"] = names
+    g["duty_order"] = list(names)
+    g["name_counts"] = {name: i % 17 for i, name in enumerate(names)}
+    sort = peak(g["recompute_next_up"])
+
+    size = g["HTTP_BUF_SIZE"]
+    writer = node.modules["httpwriter"].ResponseWriter
+    buf = bytearray(size)
+    sock = CountingSocket()
+    w = writer(sock, buf)
+    render = g["render_html"]
+    counts = g["name_counts"]
+
+    def page():
+        render(w, counts, names[0], names[-1])
+
+    # the first call warms up interned strings and code caches
+    page()
+    sock.sent = sock.sends = 0
+    full = peak(page)
+    return {"names": n, "sort": sort, "render": full, "sent": sock.sent,
+            "sends": sock.sends, "buf": size}
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m sim.pagealloc")
+    p.add_argument("--names", type=int, nargs="+", default=[3, 50, 500])
+    p.add_argument("--limit", type=float, default=4.0,
+                   help="allowed render peak, in HTTP_BUF_SIZE buffers")
+    args = p.parse_args(argv)
+
+    dd = DishDuty(fidelity="fast")
+    if not dd.sim.wait(lambda: dd.sensor.g("render_html") is not None
+                       and dd.sensor.g("http") is not None, 60):
+        print("sensor node did not start its HTTP server")
+        return 2
+    tracemalloc.start()
+    try:
+        rows = [measure(dd.sensor, n) for n in args.names]
+    finally:
+        tracemalloc.stop()
+        dd.close()
+
+    print("%6s | %9s %9s | %9s %6s" % ("names", "sort B", "render B",
+                                     "page B", "sends"))
+    bad = 0
+    for r in rows:
+        limit = args.limit * r["buf"]
+        flag = ""
+        if r["render"] > limit:
+            flag = "  over %d" % limit
+            bad += 1
+        print("%6d | %9d %9d | %9d %6d%s"
+              % (r["names"], r["sort"], r["render"], r["sent"], r["sends"],
+                 flag))
+    print("HTTP_BUF_SIZE %d, limit %.0f buffers (%d B) per page view"
+          % (rows[0]["buf"], args.limit, args.limit * rows[0]["buf"]))
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+# sim/radio.py - in-process ESP-NOW bus and a Wi-Fi access point model
+
+import collections, types
+
+
+class Air:
+    """Shared medium: delivers ESP-NOW frames between nodes by MAC"""
+
+    def __init__(self, sched, latency_us=1200):
+        self.sched = sched
+        self.latency_us = latency_us
+        self.nodes = {}
+        self.sent = 0
+        self.dropped = 0
+        self.taps = []
+
+    def attach(self, node):
+        self.nodes[bytes(node.mac)] = node
+
+    def send(self, src, dst, msg):
+        sender = self.nodes.get(bytes(src))
+        if sender is not None and sender.passive:
+            # the scheduler let other nodes run ahead of this one
+            raise RuntimeError("passive node %s transmitted" % sender.name)
+        self.sent += 1
+        t = self.sched.now() + self.latency_us
+        for fn in self.taps:
+            fn(t, src, dst, msg)
+        node = self.nodes.get(bytes(dst))
+        if node is None or node.espnow is None or not node.espnow.active_:
+            self.dropped += 1
+            # a unicast frame nobody ACKs fails on the sender side
+            return False
+        node.espnow._deliver(t, bytes(src), bytes(msg))
+        return True
+
+
+class AccessPoint:
+    def __init__(self, ssid="Berkeley-IoT", password=None, channel=6,
+                 bssid=b"\x02\xaa\xbb\xcc\xdd\x01", assoc_us=1200000,
+                 dhcp_us=500000, up=True):
+        self.ssid = ssid
+        self.password = password
+        self.channel = channel
+        self.bssid = bssid
+        self.assoc_us = assoc_us
+        self.dhcp_us = dhcp_us
+        self.up = up
+        self.leases = 0
+
+    def lease(self):
+        self.leases += 1
+        return "10.0.0.%d" % (10 + self.leases)
+
+
+# The receive ring holds each frame with a header and the sender's MAC;
+# frames that do not fit are dropped, like on the board. Frames are only
+# let into the ring once the receiver's clock reaches their arrival time
+# (a passive receiver runs behind its senders), so the ring holds what it
+# would have held on the board at that moment.
+RXBUF_DEFAULT = 526
+RX_HEADER = 12
+
+
+def espnow_module(node, air):
+    sched = node.sched
+    m = types.ModuleType("espnow")
+
+    class ESPNow:
+        def __init__(self):
+            self.active_ = False
+            self.peers = []
+            self.queue = collections.deque()    # in flight, by arrival time
+            self.ring = collections.deque()     # arrived, not read yet
+            self.waiter = False
+            self.rxbuf = RXBUF_DEFAULT
+            self.queued = 0         # bytes of the ring in use
+            self.rx_dropped = 0
+            self.delays = None      # set to a list to collect queueing delays
+            node.espnow = self
+
+        def active(self, flag=None):
+            if flag is None:
+                return self.active_
+            self.active_ = bool(flag)
+            return self.active_
+
+        def add_peer(self, mac, *args, **kw):
+            if bytes(mac) in self.peers:
+                raise OSError("ESP_ERR_ESPNOW_EXIST")
+            self.peers.append(bytes(mac))
+
+        def del_peer(self, mac):
+            self.peers.remove(bytes(mac))
+
+        def get_peers(self):
+            return tuple((p,) for p in self.peers)
+
+        def config(self, **kw):
+            if "rxbuf" in kw:
+                self.rxbuf = kw["rxbuf"]
+            return None
+
+        def send(self, mac, msg=None, sync=True):
+            if msg is None:
+                mac, msg = None, mac
+            if not self.active_:
+                raise OSError("ESP_ERR_ESPNOW_NOT_INIT")
+            if isinstance(msg, str):
+                msg = msg.encode()
+            sched.spend(150 + len(msg))
+            if mac is None:
+                ok = True
+                for p in self.peers:
+                    ok = air.send(node.mac, p, msg) and ok
+                return ok
+            if bytes(mac) not in self.peers:
+                raise OSError("ESP_ERR_ESPNOW_NOT_FOUND")
+            return air.send(node.mac, mac, msg)
+
+        def _deliver(self, t, src, msg):
+            self.queue.append((t, src, msg))
+            if node.task is not None:
+                sched.wake(node.task, t)
+
+        def _admit(self, now):
+            q = self.queue
+            while q and q[0][0] <= now:
+                item = q.popleft()
+                size = len(item[2]) + RX_HEADER
+                if self.queued + size > self.rxbuf:
+                    self.rx_dropped += 1
+                else:
+                    self.queued += size
+                    self.ring.append(item)
+
+        def any(self):
+            self._admit(sched.now())
+            return bool(self.ring)
+
+        def recv(self, timeout_ms=None):
+            if timeout_ms is None:
+                timeout_ms = -1
+            deadline = None if timeout_ms < 0 else sched.now() + timeout_ms * 1000
+            while True:
+                now = sched.now()
+                self._admit(now)
+                if self.ring:
+                    t, src, msg = self.ring.popleft()
+                    self.queued -= len(msg) + RX_HEADER
+                    if self.delays is not None:
+                        self.delays.append(now - t)
+                    sched.spend(60)
+                    return [src, msg]
+                if deadline is not None and now >= deadline:
+                    return [None, None]
+                nxt = deadline
+                if self.queue and (nxt is None or self.queue[0][0] < nxt):
+                    nxt = self.queue[0][0]
+                if nxt is None:
+                    nxt = now + 1000000
+                node.sleep_until(nxt)
+
+        irecv = recv
+
+        def __iter__(self):
+            return self
+
+        def __next__(self):
+            return self.recv(0)
+
+    m.ESPNow = ESPNow
+    m.MAX_DATA_LEN = 250
+    return m
+
+
+def network_module(node, ap):
+    sched = node.sched
+    m = types.ModuleType("network")
+    m.STA_IF = 0
+    m.AP_IF = 1
+    m.STAT_IDLE = 1000
+    m.STAT_CONNECTING = 1001
+    m.STAT_GOT_IP = 1010
+    m.STAT_NO_AP_FOUND = 201
+    m.STAT_WRONG_PASSWORD = 202
+
+    class WLAN:
+        # one interface object per node, like the firmware singleton
+        def __new__(cls, iface=0):
+            w = node.wlan.get(iface)
+            if w is None:
+                w = object.__new__(cls)
+                w._init(iface)
+                node.wlan[iface] = w
+            return w
+
+        def __init__(self, iface=0):
+            pass
+
+        def _init(self, iface):
+            self.iface = iface
+            self.active_ = False
+            self.target = None
+            self.connect_at = None
+            self.ip = None
+            self.bssid = None
+            self.channel_ = 1
+            self.connects = 0
+            self.fast = False
+
+        def active(self, flag=None):
+            if flag is None:
+                return self.active_
+            if flag and not self.active_:
+                sched.spend(90000)     # radio/PHY calibration on first start
+            self.active_ = bool(flag)
+            if not flag:
+                self.ip = None
+                self.connect_at = None
+            return self.active_
+
+        def _settle(self):
+            if self.connect_at is not None and sched.now() >= self.connect_at:
+                self.connect_at = None
+                if ap is not None and ap.up and self.target == ap.ssid:
+                    self.ip = ap.lease()
+                    self.bssid = ap.bssid
+                    self.channel_ = ap.channel
+
+        def connect(self, ssid=None, key=None, bssid=None, channel=None):
+            if not self.active_:
+                raise OSError("Wifi Not Started")
+            self.connects += 1
+            self.target = ssid
+            self.ip = None
+            # a known BSSID on the channel the radio is already tuned to
+            # (config(channel=...)) skips the all-channel scan
+            if channel is None:
+                channel = self.channel_
+            self.fast = (ap is not None and bssid is not None
+                         and bytes(bssid) == ap.bssid and channel == ap.channel)
+            if ap is None:
+                self.connect_at = None
+                return
+            assoc = ap.assoc_us // 4 if self.fast else ap.assoc_us
+            self.connect_at = sched.now() + assoc + ap.dhcp_us
+            sched.spend(2000)
+
+        def disconnect(self):
+            self.ip = None
+            self.connect_at = None
+
+        def isconnected(self):
+            self._settle()
+            return self.ip is not None
+
+        def status(self, *args):
+            self._settle()
+            if args and args[0] == "rssi":
+                return -58
+            if self.ip is not None:
+                return m.STAT_GOT_IP
+            if self.connect_at is not None:
+                return m.STAT_CONNECTING
+            if self.target is not None and (ap is None or not ap.up
+                                            or self.target != ap.ssid):
+                return m.STAT_NO_AP_FOUND
+            return m.STAT_IDLE
+
+        def ifconfig(self, cfg=None):
+            self._settle()
+            if cfg is not None:
+                self.ip = cfg[0]
+                return
+            ip = self.ip or "0.0.0.0"
+            return (ip, "255.255.255.0", "10.0.0.1", "10.0.0.1")
+
+        def config(self, *args, **kw):
+            if args:
+                k = args[0]
+                if k == "mac":
+                    return bytes(node.mac)
+                if k == "channel":
+                    return self.channel_
+                if k == "ssid":
+                    return self.target or ""
+                # like the ESP32 port, "bssid" is not a readable key
+                raise ValueError("unknown config param")
+            if "channel" in kw:
+                self.channel_ = kw["channel"]
+            return None
+
+        def scan(self):
+            sched.spend(2200000)
+            if ap is None or not ap.up:
+                return []
+            return [(ap.ssid.encode(), ap.bssid, ap.channel, -58, 3, False)]
+
+    m.WLAN = WLAN
+    return m
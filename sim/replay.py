@@ -0,0 +1,320 @@
+# sim/replay.py - push sensor traces through the alert and soap logic
+#
+#   python -m sim.replay synth day.bin --hours 24      # synthetic trace
+#   python -m sim.replay run day.bin --us-max 6.5      # decisions for a trace
+#   python -m sim.replay bench --hours 24              # synth + timed replay
+#
+# Traces are sensortrace.py files, recorded on the sensor node with
+# TRACE = const(1) or synthesized here. The replay runs the repo's own
+# AlertFSM and soap detector on the host as fast as the CPU allows, with
+# the thresholds overridable from the command line, so a day of kitchen
+# traffic can be re-judged in about a second instead of at the sink.
+
+import argparse, ast, os, random, sys, tempfile, time
+
+from .node import REPO
+
+if REPO not in sys.path:
+    sys.path.insert(0, REPO)
+
+# the firmware modules call MicroPython's ticks helpers; replay time is
+# plain milliseconds that never wrap
+if not hasattr(time, "ticks_diff"):
+    time.ticks_diff = lambda a, b: a - b
+if not hasattr(time, "ticks_ms"):
+    time.ticks_ms = lambda: 0
+
+import ringlog as log
+import sensortrace
+from alert import (AlertFSM, STATUS_NAMES, BEEP_NAMES, ACT_STATUS, ACT_BEEP,
+                   ACT_CLEAN, ACT_RAISED, ACT_SCANNED, ACT_SOAP)
+from soap import SoapDetector
+
+from .soaptracker import SoapTracker
+
+US_MIN = 1.0
+US_MAX = 7.0
+
+
+def uid_table():
+    """UID_TO_NAME as written in mainsensor.py"""
+    with open(os.path.join(REPO, "mainsensor.py")) as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if (isinstance(node, ast.Assign) and len(node.targets) == 1
+                and getattr(node.targets[0], "id", None) == "UID_TO_NAME"):
+            return ast.literal_eval(node.value)
+    return {}
+
+
+class Decisions:
+    """Everything the firmware would have done, in order"""
+
+    def __init__(self):
+        self.events = []
+        self.status = {}
+        self.beep = {}
+        self.cleans = {}
+        self.alerts = 0
+        self.scans = 0
+        self.scans_in_alert = 0
+        self.soap_uses = 0
+        self.now = 0
+
+    def _emit(self, mtype, payload, table):
+        self.events.append((self.now, mtype, payload))
+        table[payload] = table.get(payload, 0) + 1
+
+    def actions(self, fsm, acts):
+        """Same dispatch as mainsensor.run_alert_actions(), minus the I/O"""
+        if acts & ACT_SCANNED:
+            self.scans_in_alert += 1
+        if acts & ACT_SOAP:
+            self.soap_uses += 1
+        if acts & ACT_RAISED:
+            self.alerts += 1
+        if acts & ACT_CLEAN:
+            self._emit("R", fsm.cleaner, self.cleans)
+        elif acts & ACT_BEEP:
+            self._emit("B", BEEP_NAMES[fsm.beep], self.beep)
+        if acts & ACT_STATUS:
+            self._emit("S", STATUS_NAMES[fsm.status], self.status)
+
+
+def replay(data, args, uids=None):
+    """Run a trace through AlertFSM and a soap detector; returns (passes, Decisions)"""
+    uids = uid_table() if uids is None else uids
+    dec = Decisions()
+    soap = SoapTracker() if getattr(args, "soap", None) == "threshold" else SoapDetector()
+    alert = AlertFSM()
+    for k in ("grace_period_ms", "scan_grace_ms", "scan_timeout_ms"):
+        if getattr(args, k, None) is not None:
+            setattr(alert, k, getattr(args, k))
+    # the detector works in mg like the firmware, the old tracker in grams
+    unit = 1 if isinstance(soap, SoapTracker) else 1000
+    if args.soap_use is not None:
+        soap.use = args.soap_use * unit
+    if args.new_bottle is not None:
+        soap.new_bottle = args.new_bottle * unit
+    lo, hi = args.us_min, args.us_max
+
+    n = 0
+    near1 = near2 = False
+    for now, w, d1, d2, uid in sensortrace.passes(data):
+        n += 1
+        dec.now = now
+        if uid is not None:
+            name = uids.get(uid.hex().upper())
+            if name is not None:
+                # like the firmware: the scan goes in before the weight read
+                dec.scans += 1
+                dec.actions(alert, alert.step(now, near1, near2, name, False))
+        used = False
+        if w is not None:
+            used = soap.process(w if unit == 1 else round(w * 1000),
+                                alert.tracking(), now)
+        # like the firmware, a sensor that was not due keeps its last reading
+        if d1 is not False:
+            near1 = d1 is not None and lo < d1 < hi
+        if d2 is not False:
+            near2 = d2 is not None and lo < d2 < hi
+        dec.actions(alert, alert.step(now, near1, near2, None, used))
+    return n, dec
+
+
+# Synthetic traces
+# One firmware pass: 50 ms sleep + 15 ms RFID poll + 511 ms weight read
+# + 30 ms per ultrasonic reading (both are due on nearly every pass)
+PASS_MS = 640
+BOTTLE_G = 420.0
+
+
+def synth(path, hours, episodes_per_day=6, seed=1):
+    """Write a trace of `hours` of kitchen traffic; returns the plan"""
+    rng = random.Random(seed)
+    names = {}
+    for uid, name in uid_table().items():
+        names.setdefault(name, bytes.fromhex(uid))
+    who_list = sorted(names)
+
+    total_ms = int(hours * 3600000)
+    n_ep = max(1, int(episodes_per_day * hours / 24.0 + 0.5))
+    starts = sorted(rng.randrange(60000, max(60001, total_ms - 300000))
+                    for _ in range(n_ep))
+
+    # (start_ms, end_ms[, arg]) intervals
+    dishes = []
+    lifts = []
+    scans = []
+    plan = []
+    bottle = BOTTLE_G
+    for s in starts:
+        who = rng.choice(who_list)
+        scan = s + rng.randrange(5, 25) * 1000
+        clear = scan + rng.randrange(14, 26) * 1000
+        used = rng.uniform(4.0, 9.0)
+        dishes.append((s, clear))
+        scans.append((scan, names[who]))
+        lifts.append((scan + 6000, scan + 10000, used))
+        plan.append((s, who))
+    # people brushing past one sensor, and soap used with no dishes
+    brushes = [(t, t + rng.randrange(1, 4) * 1000)
+               for t in sorted(rng.randrange(0, total_ms) for _ in range(n_ep * 4))]
+    for t in sorted(rng.randrange(0, total_ms) for _ in range(n_ep)):
+        lifts.append((t, t + 3000, rng.uniform(2.0, 6.0)))
+    lifts.sort()
+
+    w = sensortrace.TraceWriter(path, buf_size=4096, max_bytes=1 << 30,
+                                append=False)
+    di = bi = li = si = 0
+    now = 0
+    prev_lifted = False
+    while now < total_ms:
+        while di < len(dishes) and dishes[di][1] <= now:
+            di += 1
+        while bi < len(brushes) and brushes[bi][1] <= now:
+            bi += 1
+        while li < len(lifts) and lifts[li][1] <= now:
+            bottle -= lifts[li][2]
+            li += 1
+        blocked = di < len(dishes) and dishes[di][0] <= now
+        brushed = bi < len(brushes) and brushes[bi][0] <= now
+        lifted = li < len(lifts) and lifts[li][0] <= now
+
+        if si < len(scans) and scans[si][0] <= now:
+            w.rfid(now, scans[si][1])
+            si += 1
+
+        if lifted:
+            g = 0.0
+        elif prev_lifted:
+            # read_weight averages 6 samples across the bottle going back
+            g = bottle * rng.randrange(1, 6) / 6.0
+        else:
+            g = bottle + rng.gauss(0, 0.03)
+        if abs(g) < 0.5:
+            g = 0.0
+        prev_lifted = lifted
+        w.weight(now, round(g * 1000))
+
+        far = 38.0 + rng.gauss(0, 0.5)
+        near = 4.0 + rng.gauss(0, 0.2)
+        w.distance(now, 1, near if blocked or brushed else far)
+        w.distance(now, 2, near if blocked else
+                   (None if rng.random() < 0.01 else far))
+        now += PASS_MS + rng.randrange(-20, 21)
+    w.close()
+    return plan
+
+
+def _report(n, dec, wall, size=None):
+    if size is not None:
+        print("trace:             %d bytes, %d passes" % (size, n))
+    else:
+        print("passes:            %d" % n)
+    print("replay time:       %.3f s (%.0f passes/s)" % (wall, n / wall if wall else 0))
+    print("alerts raised:     %d" % dec.alerts)
+    print("status changes:    %s" % dict(sorted(dec.status.items())))
+    print("beep changes:      %s" % dict(sorted(dec.beep.items())))
+    print("scans in alert:    %d of %d" % (dec.scans_in_alert, dec.scans))
+    print("soap uses counted: %d" % dec.soap_uses)
+    print("cleans registered: %s" % dict(sorted(dec.cleans.items())))
+
+
+def _quiet(args):
+    if not args.verbose:
+        log.set_level(log.ERROR + 10)
+
+
+def cmd_synth(args):
+    plan = synth(args.trace, args.hours, args.episodes, args.seed)
+    print("%s: %d dish episodes, %d bytes"
+          % (args.trace, len(plan), os.path.getsize(args.trace)))
+
+
+def cmd_run(args):
+    _quiet(args)
+    with open(args.trace, "rb") as f:
+        data = f.read()
+    t0 = time.perf_counter()
+    n, dec = replay(data, args)
+    wall = time.perf_counter() - t0
+    _report(n, dec, wall)
+    if args.events:
+        for t, mtype, payload in dec.events:
+            print("%10.1f s  %s|%s" % (t / 1000.0, mtype, payload))
+
+
+def cmd_bench(args):
+    _quiet(args)
+    fd, path = tempfile.mkstemp(suffix=".bin")
+    os.close(fd)
+    try:
+        t0 = time.perf_counter()
+        plan = synth(path, args.hours, args.episodes, args.seed)
+        synth_s = time.perf_counter() - t0
+        with open(path, "rb") as f:
+            data = f.read()
+    finally:
+        os.remove(path)
+    expected = {}
+    for _, who in plan:
+        expected[who] = expected.get(who, 0) + 1
+
+    t0 = time.perf_counter()
+    n, dec = replay(data, args)
+    wall = time.perf_counter() - t0
+    print("simulated:         %.1f h, %d dish episodes (synthesized in %.2f s)"
+          % (args.hours, len(plan), synth_s))
+    _report(n, dec, wall, len(data))
+    print("expected cleans:   %s" % dict(sorted(expected.items())))
+    print("speed:             %.0fx real time" % (args.hours * 3600 / wall))
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m sim.replay")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    def tuning(a):
+        a.add_argument("--us-min", type=float, default=US_MIN)
+        a.add_argument("--us-max", type=float, default=US_MAX)
+        a.add_argument("--soap-use", type=float, default=None,
+                       help="SOAP_USE_THRESHOLD in grams")
+        a.add_argument("--new-bottle", type=float, default=None,
+                       help="SOAP_NEW_BOTTLE_DELTA in grams")
+        a.add_argument("--soap", choices=("cusum", "threshold"), default="cusum",
+                       help="SoapDetector (firmware) or the old SoapTracker")
+        a.add_argument("--grace-ms", dest="grace_period_ms", type=int)
+        a.add_argument("--scan-grace-ms", dest="scan_grace_ms", type=int)
+        a.add_argument("--scan-timeout-ms", dest="scan_timeout_ms", type=int)
+        a.add_argument("--verbose", action="store_true",
+                       help="keep the firmware's log calls enabled")
+
+    def synthetic(a):
+        a.add_argument("--hours", type=float, default=24.0)
+        a.add_argument("--episodes", type=int, default=6,
+                       help="dish episodes per day")
+        a.add_argument("--seed", type=int, default=1)
+
+    a = sub.add_parser("synth")
+    a.add_argument("trace")
+    synthetic(a)
+    a.set_defaults(fn=cmd_synth)
+
+    a = sub.add_parser("run")
+    a.add_argument("trace")
+    a.add_argument("--events", action="store_true", help="list every decision")
+    tuning(a)
+    a.set_defaults(fn=cmd_run)
+
+    a = sub.add_parser("bench")
+    synthetic(a)
+    tuning(a)
+    a.set_defaults(fn=cmd_bench)
+
+    args = p.parse_args(argv)
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
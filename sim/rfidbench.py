@@ -0,0 +1,119 @@
+# sim/rfidbench.py - RFID scan rate with 1-4 MFRC522 readers on one SPI bus
+#
+#   python -m sim.rfidbench
+#   python -m sim.rfidbench --readers 6 --passes 100
+#
+# Wires N of sim/devices.py's MFRC522 register models to one SPI bus
+# (separate CS pins) on sim/driverbench.py's counting bus and clock, and
+# polls them two ways:
+#
+#   sequential  the driver's request() on each reader in turn, as
+#               mainsensor.py did with its one reader
+#   pool        rfidpool.ReaderPool.poll(): REQA on all, then round-robin
+#               ComIrqReg reads until every reader answered or timed out
+#
+# once with empty fields, once with a card arriving on every reader for
+# every pass (each card read out: anticoll, select, stop_crypto1). A pass
+# visits every reader once; scans/s is reader polls per second of bus
+# time over all readers, the total scan rate.
+
+import argparse, sys
+
+from .devices import Card, MFRC522Model
+from .driverbench import Bus, machine_module, time_module, SPI_BAUD
+
+CS_PINS = (26, 4, 16, 17, 22, 15)
+UIDS = ("21D5B17B", "A169BBA3", "F1589C7B", "0A0B0C0D", "11223344", "55667788")
+
+
+def setup(n):
+    """n readers on a fresh bus; returns (bus, drivers, pool, cards, field)"""
+    bus = Bus()
+    machine = machine_module(bus)
+    sys.modules["machine"] = machine
+    for name in ("mfrcc", "mfrc22", "rfidpool"):
+        sys.modules.pop(name, None)
+    import mfrcc
+    sys.modules["mfrc22"] = mfrcc
+    import rfidpool
+    rfidpool.time = time_module(bus)
+
+    field = [None] * n
+    cards = [Card(bytes.fromhex(UIDS[i])) for i in range(n)]
+    spi = machine.SPI(2, baudrate=SPI_BAUD, polarity=0, phase=0)
+    drivers = []
+    for i in range(n):
+        MFRC522Model(bus, CS_PINS[i], card=lambda t, i=i: field[i])
+        drivers.append(mfrcc.MFRC522(spi=spi, cs=machine.Pin(CS_PINS[i], machine.Pin.OUT)))
+    return bus, drivers, rfidpool.ReaderPool(drivers), cards, field
+
+
+def sequential(drivers):
+    seen = 0
+    for r in drivers:
+        stat, _ = r.request(r.REQIDL)
+        if stat == r.OK:
+            stat, uid = r.anticoll()
+            if stat == r.OK:
+                seen += 1
+                r.select_tag(uid)
+                r.stop_crypto1()
+    return seen
+
+
+def pooled(pool):
+    seen = 0
+    found = pool.poll()
+    for i in range(len(pool)):
+        if (found >> i) & 1:
+            uid = pool.read(i)
+            if uid is not None:
+                seen += 1
+                pool.release(i, uid, 0)
+    return seen
+
+
+def measure(n, passes, cards_in):
+    """(bus us per pass, cards read per pass) for both ways of polling"""
+    out = {}
+    for way in ("sequential", "pool"):
+        bus, drivers, pool, cards, field = setup(n)
+        fn = (lambda: sequential(drivers)) if way == "sequential" else (lambda: pooled(pool))
+        t0 = bus.t_us
+        seen = 0
+        for _ in range(passes):
+            if cards_in:
+                # a fresh tap on every reader
+                for i in range(n):
+                    cards[i].state = Card.IDLE
+                    field[i] = cards[i]
+            seen += fn()
+        out[way] = ((bus.t_us - t0) / passes, seen / passes)
+    return out
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m sim.rfidbench")
+    p.add_argument("--readers", type=int, default=4,
+                   help="largest pool to try (up to %d)" % len(CS_PINS))
+    p.add_argument("--passes", type=int, default=50)
+    args = p.parse_args(argv)
+
+    print("%-6s %-7s | %10s %9s | %10s %9s | %7s"
+          % ("field", "readers", "seq ms", "scans/s", "pool ms", "scans/s",
+             "speedup"))
+    for cards_in in (False, True):
+        for n in range(1, min(args.readers, len(CS_PINS)) + 1):
+            r = measure(n, args.passes, cards_in)
+            (seq_us, seq_seen), (pool_us, pool_seen) = r["sequential"], r["pool"]
+            if cards_in and (seq_seen != n or pool_seen != n):
+                print("  %d readers: read %.1f / %.1f cards a pass, expected %d"
+                      % (n, seq_seen, pool_seen, n))
+            print("%-6s %7d | %10.1f %9.1f | %10.1f %9.1f | %6.1fx"
+                  % ("cards" if cards_in else "empty", n, seq_us / 1000,
+                     n * 1e6 / seq_us, pool_us / 1000, n * 1e6 / pool_us,
+                     seq_us / pool_us))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+# sim/serialclient.py - host side of the framed serial protocol
+#
+#   python -m sim.serialclient hello /dev/ttyUSB0
+#   python -m sim.serialclient get /dev/ttyUSB0 trace trace.bin
+#   python -m sim.serialclient put /dev/ttyUSB0 users users.json
+#   python -m sim.serialclient loopback --mb 4 --corrupt 0.01
+#   python -m sim.serialclient sim --trace-kb 64
+#
+# SerialClient speaks seriallink.py over anything with write(bytes),
+# read(timeout_s) -> bytes and clock(). TtyPort is a serial device (or a
+# pty) opened raw with termios, no pyserial needed. Log text the node
+# prints between frames is kept in client.text.
+#
+# loopback runs the node's SerialLink in a thread on one end of a pty and
+# the client on the other: a round trip of the protocol code with no baud
+# limit, optionally with corrupted frames in both directions, so it
+# reports the ceiling the protocol itself puts on throughput.
+#
+# sim runs mainsensor.py in the simulator (bus fidelity) with the serial
+# line at 115200 baud and the port's 260-byte stdin ring, exports a trace
+# file and imports counts, users and the duty order while the sensor loop
+# keeps running, and reports throughput next to the loop's pass times.
+
+import argparse, collections, io, json, os, random, select, sys, tempfile
+import termios, threading, time, tty
+
+from .node import REPO
+
+if REPO not in sys.path:
+    sys.path.insert(0, REPO)
+
+# loopback runs the node's SerialLink on the host, give it MicroPython's
+# ticks helpers (plain milliseconds that never wrap)
+if not hasattr(time, "ticks_ms"):
+    time.ticks_ms = lambda: int(time.monotonic() * 1000)
+    time.ticks_diff = lambda a, b: a - b
+    time.ticks_add = lambda a, b: a + b
+    time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+
+from seriallink import (FrameReader, SerialLink, pack, MAX_PAYLOAD, IMPORT_MAX,
+                        T_HELLO, T_ERR, T_GET, T_PUT, T_DATA, T_END)
+
+LINE_BPS = 115200 // 10     # bytes per second at 115200 8N1
+
+
+class LinkError(Exception):
+    pass
+
+
+class TtyPort:
+    def __init__(self, path_or_fd, baud=115200):
+        if isinstance(path_or_fd, int):
+            self.fd = path_or_fd
+        else:
+            self.fd = os.open(path_or_fd, os.O_RDWR | os.O_NOCTTY)
+        try:
+            tty.setraw(self.fd)
+            attrs = termios.tcgetattr(self.fd)
+            attrs[4] = attrs[5] = getattr(termios, "B%d" % baud)
+            termios.tcsetattr(self.fd, termios.TCSANOW, attrs)
+        except termios.error:
+            pass        # a pty master has no line settings
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+
+    def read(self, timeout):
+        r, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        return os.read(self.fd, 65536) if r else b""
+
+    def clock(self):
+        return time.monotonic()
+
+    def close(self):
+        os.close(self.fd)
+
+
+class SerialClient:
+    def __init__(self, port, timeout=2.0, retries=8):
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.reader = FrameReader(self._frame, self.text_byte)
+        self.frames = collections.deque()
+        self.text = bytearray()
+        self.seq = 0
+        self.max_payload = MAX_PAYLOAD
+        self.resumes = 0
+        self.resends = 0
+
+    def _frame(self, ftype, seq, payload):
+        self.frames.append((ftype, seq, bytes(payload)))
+
+    def text_byte(self, b):
+        self.text.append(b)
+
+    def _next(self, timeout):
+        deadline = self.port.clock() + timeout
+        while not self.frames:
+            left = deadline - self.port.clock()
+            if left <= 0:
+                self.reader.reset()
+                return None
+            self.reader.feed_bytes(self.port.read(left))
+        return self.frames.popleft()
+
+    def _request(self, ftype, payload=b""):
+        """Send one frame until its reply comes back; returns the payload
+
+        Frames that do not answer it (DATA of an export being abandoned)
+        are dropped. A retry keeps the seq, so the node can tell it from
+        new data.
+        """
+        self.seq = (self.seq + 1) & 0xFF
+        frame = pack(ftype, self.seq, payload)
+        for attempt in range(self.retries):
+            if attempt:
+                self.resends += 1
+            self.port.write(frame)
+            deadline = self.port.clock() + self.timeout
+            while True:
+                f = self._next(deadline - self.port.clock())
+                if f is None:
+                    break
+                t, s, p = f
+                if s != self.seq or t == T_DATA:
+                    continue
+                if t == T_ERR:
+                    raise LinkError(p.decode("utf-8", "replace"))
+                return p
+        raise LinkError("no reply to frame type %d" % ftype)
+
+    def hello(self):
+        version, max_payload, *names = self._request(T_HELLO).decode().split()
+        self.max_payload = int(max_payload)
+        return {"version": int(version), "max_payload": self.max_payload,
+                "resources": names}
+
+    def get(self, name):
+        """Export a resource; a lost chunk resumes from the bytes we have"""
+        data = bytearray()
+        stalled = 0
+        while stalled < self.retries:
+            have = len(data)
+            self._request(T_GET, have.to_bytes(4, "little") + name.encode())
+            expect = 0
+            while True:
+                f = self._next(self.timeout)
+                if f is None:
+                    break
+                t, s, p = f
+                if t == T_DATA:
+                    if s != expect:
+                        break
+                    data += p
+                    expect = (expect + 1) & 0xFF
+                elif t == T_END:
+                    if int.from_bytes(p[:4], "little") == len(data):
+                        return bytes(data)
+                    break
+                elif t == T_ERR:
+                    raise LinkError(p.decode("utf-8", "replace"))
+            self.resumes += 1
+            stalled = stalled + 1 if len(data) == have else 0
+        raise LinkError("%s: export kept failing at byte %d" % (name, len(data)))
+
+    def put(self, name, data):
+        self._request(T_PUT, len(data).to_bytes(4, "little") + name.encode())
+        for off in range(0, len(data), self.max_payload):
+            self._request(T_DATA, data[off:off + self.max_payload])
+        self._request(T_END)
+
+
+# pty loopback
+class _Poll:
+    """uselect.poll's ipoll() on top of select.poll"""
+
+    def __init__(self, fd):
+        self.p = select.poll()
+        self.p.register(fd, select.POLLIN)
+
+    def ipoll(self, timeout=-1):
+        return iter(self.p.poll(timeout))
+
+
+class _FdIn:
+    def __init__(self, fd):
+        self.fd = fd
+
+    def readinto(self, buf):
+        return os.readv(self.fd, [buf])
+
+
+class _Noisy:
+    """Writer that corrupts a byte in a share of the writes"""
+
+    def __init__(self, write, rate, seed):
+        self._write = write
+        self.rate = rate
+        self.rng = random.Random(seed)
+        self.corrupted = 0
+
+    def write(self, data):
+        if self.rate and self.rng.random() < self.rate:
+            data = bytearray(data)
+            data[self.rng.randrange(1, len(data))] ^= 0x40
+            self.corrupted += 1
+        self._write(bytes(data))
+
+
+def loopback(args):
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    host_port = TtyPort(master)
+    dev_out = TtyPort(slave)
+    blob = random.Random(1).randbytes(int(args.mb * 1024 * 1024))
+    imported = []
+    link = SerialLink(_FdIn(slave), _Noisy(dev_out.write, args.corrupt, 2),
+                      _Poll(slave))
+    link.resource("trace", lambda: io.BytesIO(blob))
+    link.resource("blob", None, lambda data: imported.append(bytes(data)))
+    stop = threading.Event()
+
+    def device():
+        try:
+            while not stop.is_set():
+                if not link.service():
+                    select.select([slave], [], [], 0.01)
+        except OSError:
+            pass        # the host end closed
+
+    th = threading.Thread(target=device, daemon=True)
+    th.start()
+    noisy = _Noisy(host_port.write, args.corrupt, 3)
+    host_port.write = noisy.write
+    client = SerialClient(host_port, timeout=0.5)
+    try:
+        info = client.hello()
+        t0 = time.perf_counter()
+        got = client.get("trace")
+        t_get = time.perf_counter() - t0
+        chunk = random.Random(4).randbytes(IMPORT_MAX)
+        t0 = time.perf_counter()
+        for _ in range(args.puts):
+            client.put("blob", chunk)
+        t_put = time.perf_counter() - t0
+    finally:
+        stop.set()
+        host_port.close()
+        th.join()
+        os.close(slave)
+    ok = got == blob and len(imported) == args.puts and all(x == chunk for x in imported)
+    print("resources:  %s (protocol v%d, %d-byte chunks)"
+          % (" ".join(info["resources"]), info["version"], info["max_payload"]))
+    print("export:     %d bytes in %.2f s, %.0f kB/s (%.0fx 115200 baud)"
+          % (len(got), t_get, len(got) / t_get / 1000, len(got) / t_get / LINE_BPS))
+    print("import:     %d x %d bytes in %.2f s, %.0f kB/s, one ACK per chunk"
+          % (args.puts, IMPORT_MAX, t_put, args.puts * IMPORT_MAX / t_put / 1000))
+    if args.corrupt:
+        print("corrupted:  %d frames to the host, %d to the node; %d resumes, %d resends"
+              % (link.stdout.corrupted, noisy.corrupted, client.resumes, client.resends))
+    print("intact:     %s" % ("yes" if ok else "NO"))
+    return 0 if ok else 1
+
+
+# simulator
+class SimPort:
+    """The sensor node's USB serial, seen from a host task in the simulator"""
+
+    def __init__(self, node):
+        self.node = node
+        self.sched = node.sched
+
+    def write(self, data):
+        self.node.stdin.feed(bytes(data))
+
+    def read(self, timeout):
+        deadline = self.sched.now() + int(timeout * 1000000)
+        while True:
+            data = self.node.stdout.take()
+            if data or self.sched.now() >= deadline:
+                return data
+            self.sched.sleep_until(min(deadline, self.sched.now() + 1000))
+
+    def clock(self):
+        return self.sched.now() / 1e6
+
+
+def _loop_window(stats):
+    h = stats.loop
+    return h.count, h.sum_s * 1000000 + h.sum_us, h.max_us
+
+
+def sim_bench(args):
+    from .dishduty import DishDuty
+
+    fs = tempfile.mkdtemp(prefix="dishduty-serial-")
+    trace = random.Random(1).randbytes(args.trace_kb * 1024)
+    with open(os.path.join(fs, "trace.bin"), "wb") as f:
+        f.write(trace)
+    dd = DishDuty(fidelity="bus", sensor_fs=fs)
+    sim = dd.sim
+    node = dd.sensor
+    sim.run_for(args.warmup)
+    node.stdout.take()
+    stats = node.g("stats")
+
+    def window(fn):
+        stats.loop.reset()
+        t0 = sim.now_us
+        fn()
+        n, sum_us, max_us = _loop_window(stats)
+        return (sim.now_us - t0) / 1e6, n, sum_us / max(1, n) / 1000, max_us / 1000
+
+    idle = window(lambda: sim.run_for(args.idle))
+    results = {}
+    counts = {"Svanik": 4, "Paul": 7, "Pranav": 5}
+    users = dict(node.g("UID_TO_NAME"))
+    users["0BADCAFE"] = "Guest"
+    order = ["Paul", "Guest", "Svanik", "Pranav"]
+
+    def host():
+        client = SerialClient(SimPort(node), timeout=3.0)
+        results["hello"] = client.hello()
+        t0 = sim.sched.now()
+        results["trace"] = client.get("trace")
+        results["t_get"] = (sim.sched.now() - t0) / 1e6
+        t0 = sim.sched.now()
+        sent = 0
+        for name, obj in (("users", users), ("counts", counts), ("order", order)):
+            data = json.dumps(obj).encode()
+            client.put(name, data)
+            sent += len(data)
+        results["put_bytes"] = sent
+        results["t_put"] = (sim.sched.now() - t0) / 1e6
+        results["counts"] = json.loads(client.get("counts"))
+        results["client"] = client
+
+    task = sim.sched.spawn("host", host, sim.now_us)
+
+    def run():
+        while not task.done and sim.now_us < args.limit * 1000000:
+            sim.run_for(0.5)
+
+    busy = window(run)
+    dropped = node.stdin.dropped
+    dd.close()
+    if "t_put" not in results:
+        print("transfer did not finish within %d s" % args.limit)
+        return 1
+    got = results["trace"]
+    ok = (got == trace and results["counts"].get("Guest") == 0
+          and all(results["counts"][k] == v for k, v in counts.items()))
+    print("resources:    %s" % " ".join(results["hello"]["resources"]))
+    print("trace export: %d bytes in %.2f s, %.0f B/s (%.0f%% of 115200 baud)"
+          % (len(got), results["t_get"], len(got) / results["t_get"],
+             100.0 * len(got) / results["t_get"] / LINE_BPS))
+    print("imports:      users, counts, order, %d bytes in %.2f s"
+          % (results["put_bytes"], results["t_put"]))
+    print("%-13s %6s %7s %10s %10s" % ("sensor loop", "secs", "passes", "mean ms", "max ms"))
+    for label, (secs, n, mean, worst) in (("idle", idle), ("transferring", busy)):
+        print("%-13s %6.1f %7d %10.1f %10.1f" % (label, secs, n, mean, worst))
+    c = results["client"]
+    print("stdin ring overruns: %d bytes; resumes %d, resends %d"
+          % (dropped, c.resumes, c.resends))
+    print("round trip intact: %s" % ("yes" if ok else "NO"))
+    return 0 if ok else 1
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m sim.serialclient")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    for cmd in ("hello", "get", "put"):
+        a = sub.add_parser(cmd)
+        a.add_argument("device")
+        if cmd != "hello":
+            a.add_argument("resource")
+            a.add_argument("file")
+        a.add_argument("--baud", type=int, default=115200)
+    a = sub.add_parser("loopback", help="protocol round trip over a pty")
+    a.add_argument("--mb", type=float, default=4.0, help="export size")
+    a.add_argument("--puts", type=int, default=64, help="4 kB imports")
+    a.add_argument("--corrupt", type=float, default=0.0,
+                   help="share of frames with a flipped byte, both ways")
+    a = sub.add_parser("sim", help="transfers with the sensor node in the simulator")
+    a.add_argument("--trace-kb", type=int, default=64)
+    a.add_argument("--warmup", type=float, default=15.0)
+    a.add_argument("--idle", type=float, default=10.0)
+    a.add_argument("--limit", type=float, default=120.0)
+    args = p.parse_args(argv)
+
+    if args.cmd == "loopback":
+        return loopback(args)
+    if args.cmd == "sim":
+        return sim_bench(args)
+    port = TtyPort(args.device, args.baud)
+    client = SerialClient(port)
+    try:
+        if args.cmd == "hello":
+            print(client.hello())
+        elif args.cmd == "get":
+            data = client.get(args.resource)
+            with open(args.file, "wb") as f:
+                f.write(data)
+            print("%s: %d bytes" % (args.file, len(data)))
+        else:
+            with open(args.file, "rb") as f:
+                client.put(args.resource, f.read())
+            print("%s: imported" % args.resource)
+    except LinkError as ex:
+        sys.exit("%s: %s" % (args.cmd, ex))
+    finally:
+        port.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+# sim/soapbench.py - accuracy and speed of the soap-use detectors
+#
+#   python -m sim.soapbench                       # synthetic scenarios
+#   python -m sim.soapbench --trace day.bin ...   # also recorded traces
+#
+# Compares SoapTracker (sim/soaptracker.py, the original lift/put-back
+# threshold logic) with soap.SoapDetector (CUSUM change points) on
+# per-pass weight readings.
+# Synthetic readings are made the way read_weight() makes them: the mean of
+# 6 HX711 samples spread over the pass, so a bottle set down mid-pass gives
+# a partial reading. Every scenario knows the true soap uses; a detection
+# matches a use if it comes within 30 s of the bottle settling again.
+
+import argparse, random, sys, time, tracemalloc
+
+from .node import REPO
+
+if REPO not in sys.path:
+    sys.path.insert(0, REPO)
+
+import ringlog as log
+import sensortrace
+from soap import SoapDetector
+
+from .soaptracker import SoapTracker
+
+PASS_MS = 690
+SAMPLES = 6
+SAMPLE_SPAN_MS = 600
+MATCH_MS = 30000
+BOTTLE_G = 420.0
+
+
+def scenario(kind, hours=2.0, seed=1):
+    """Per-pass readings [(now_ms, g)] and true uses [(t_ms, g)]"""
+    rng = random.Random(seed * 100 + SCENARIOS.index(kind))
+    total = int(hours * 3600000)
+    noise = 1.5 if kind == "noisy" else 0.08
+    drift = -4.0 / 3600000 if kind == "drift" else 0.0
+    events = []     # (t0, t1, on-scale fraction or press g, used g)
+    truth = []
+    t = 60000
+    left = BOTTLE_G
+    while t < total - 120000:
+        used = 0.0 if kind == "no-use" else rng.uniform(4.0, 9.0)
+        if kind == "drift" and rng.random() < 0.5:
+            used = 0.0
+        dur = rng.randrange(2000, 6000)
+        if left < 150:
+            # swap in a full bottle; not a soap use
+            events.append((t, t + dur, 0.0, 0.0, left - BOTTLE_G))
+            left = BOTTLE_G
+            t += rng.randrange(120000, 360000)
+            continue
+        left -= used
+        if kind == "tipped":
+            ev = (t, t + dur, rng.uniform(0.3, 0.7), 0.0, used)
+        elif kind == "pump":
+            ev = (t, t + rng.randrange(700, 2000), 1.0, rng.uniform(300, 900), used)
+        else:
+            ev = (t, t + dur, 0.0, 0.0, used)
+        events.append(ev)
+        if used:
+            truth.append((ev[1], used))
+        t += rng.randrange(120000, 360000)
+
+    bottle = [BOTTLE_G]
+    idx = [0]
+
+    def true_weight(ts):
+        while idx[0] < len(events) and events[idx[0]][1] <= ts:
+            bottle[0] -= events[idx[0]][4]
+            idx[0] += 1
+        g = bottle[0]
+        if ts < 5000:
+            g = 0.0     # bottle goes on after boot, like in the simulator
+        elif idx[0] < len(events) and events[idx[0]][0] <= ts:
+            _, _, frac, press, _ = events[idx[0]]
+            g = g * frac + press
+        return g + drift * ts
+
+    # "clean" is the case the threshold logic was written for: every
+    # reading sees the bottle either fully on or fully off
+    span = 0 if kind == "clean" else SAMPLE_SPAN_MS
+    out = []
+    now = 0
+    while now < total:
+        acc = 0.0
+        for i in range(SAMPLES):
+            acc += true_weight(now + i * span // SAMPLES) + rng.gauss(0, noise)
+        w = acc / SAMPLES
+        if abs(w) < 0.5:
+            w = 0.0
+        out.append((now, w))
+        now += PASS_MS + rng.randrange(-20, 21)
+    return out, truth
+
+
+def detect(cls, readings):
+    """Run a detector; returns ([(t_ms, g)] uses, us per reading, bytes held)
+
+    bytes held is what the detector object still references at the end of
+    the run (its state), measured in a second, traced run.
+    """
+    uses = []
+    if cls is SoapDetector:
+        # the firmware detector takes int mg, as read_weight() returns them
+        readings = [(now, round(w * 1000)) for now, w in readings]
+    det = cls()
+    t0 = time.perf_counter()
+    for now, w in readings:
+        base = det.baseline
+        if det.process(w, True, now):
+            if cls is SoapDetector:
+                g = det.consumed / 1000
+            else:
+                g = (base or 0.0) - det.baseline
+            uses.append((now, g))
+    us = (time.perf_counter() - t0) * 1e6 / max(1, len(readings))
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    det = cls()
+    for now, w in readings:
+        det.process(w, True, now)
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return uses, us, held
+
+
+def score(uses, truth):
+    matched = set()
+    err = 0.0
+    tp = fp = 0
+    for t, g in uses:
+        best = None
+        for i, (tt, tg) in enumerate(truth):
+            if i not in matched and tt - 2000 <= t <= tt + MATCH_MS:
+                best = i
+                break
+        if best is None:
+            fp += 1
+        else:
+            matched.add(best)
+            tp += 1
+            err += abs(g - truth[best][1])
+    fn = len(truth) - tp
+    return tp, fp, fn, (err / tp if tp else 0.0)
+
+
+SCENARIOS = ("clean", "averaged", "tipped", "pump", "drift", "noisy", "no-use")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m sim.soapbench")
+    p.add_argument("--hours", type=float, default=2.0,
+                   help="length of each synthetic scenario")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--trace", action="append", default=[],
+                   help="recorded sensortrace file (repeatable)")
+    args = p.parse_args(argv)
+    log.set_level(log.ERROR + 10)
+
+    print("%-9s %5s | %-27s | %-27s" % ("scenario", "uses", "SoapTracker (threshold)",
+                                         "SoapDetector (CUSUM)"))
+    print("%-9s %5s | %-27s | %-27s" % ("", "", "tp  fp  fn  err g   us/rd", "tp  fp  fn  err g   us/rd"))
+    tot = {SoapTracker: [0, 0, 0], SoapDetector: [0, 0, 0]}
+    kept = {SoapTracker: 0, SoapDetector: 0}
+    for kind in SCENARIOS:
+        readings, truth = scenario(kind, args.hours, args.seed)
+        cols = []
+        for cls in (SoapTracker, SoapDetector):
+            uses, us, k = detect(cls, readings)
+            tp, fp, fn, err = score(uses, truth)
+            for i, v in enumerate((tp, fp, fn)):
+                tot[cls][i] += v
+            kept[cls] = max(kept[cls], k)
+            cols.append("%3d %3d %3d  %5.2f  %6.2f" % (tp, fp, fn, err, us))
+        print("%-9s %5d | %-27s | %-27s" % (kind, len(truth), cols[0], cols[1]))
+
+    for cls in (SoapTracker, SoapDetector):
+        tp, fp, fn = tot[cls]
+        prec = tp / (tp + fp) if tp + fp else 0.0
+        rec = tp / (tp + fn) if tp + fn else 0.0
+        print("%-13s precision %.2f  recall %.2f  state held %d B"
+              % (cls.__name__, prec, rec, kept[cls]))
+
+    for path in args.trace:
+        with open(path, "rb") as f:
+            data = f.read()
+        readings = [(now, w) for now, w, _, _, _ in sensortrace.passes(data)
+                    if w is not None]
+        print("\n%s: %d readings" % (path, len(readings)))
+        found = {}
+        for cls in (SoapTracker, SoapDetector):
+            uses, us, _ = detect(cls, readings)
+            found[cls] = uses
+            print("  %-13s %d uses  %s" % (cls.__name__, len(uses), ", ".join(
+                "%.0fs:%.1fg" % (t / 1000.0, g) for t, g in uses[:12])))
+        a = found[SoapTracker]
+        b = found[SoapDetector]
+        agree = sum(1 for t, _ in a if any(abs(t - u) <= MATCH_MS for u, _ in b))
+        print("  agreement: %d of %d threshold detections also found by CUSUM"
+              % (agree, len(a)))
+
+
+if __name__ == "__main__":
+    main()
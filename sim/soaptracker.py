@@ -0,0 +1,84 @@
+# sim/soaptracker.py - the original threshold soap detector, for comparison
+#
+# SoapTracker was the sensor node's soap detector before soap.SoapDetector
+# replaced it. It stays here, off the board, so sim.soapbench and
+# sim.replay --soap threshold can still measure the new detector against
+# it. It takes readings in grams (floats) and shares soap.py's thresholds.
+
+import sys
+
+from .node import REPO
+
+if REPO not in sys.path:
+    sys.path.insert(0, REPO)
+
+import ringlog as log
+from soap import (SOAP_PRESENT_THRESHOLD, SOAP_USE_THRESHOLD,
+                  SOAP_EMPTY_THRESHOLD, SOAP_NEW_BOTTLE_DELTA,
+                  EMPTY_REMINDER_MS)
+
+
+class SoapTracker:
+    def __init__(self):
+        self.baseline = None
+        self.state = "no_bottle"
+        self.last_weight = 0.0
+
+        # thresholds in grams, per instance so a replay can try other values
+        self.present = SOAP_PRESENT_THRESHOLD
+        self.use = SOAP_USE_THRESHOLD
+        self.empty = SOAP_EMPTY_THRESHOLD
+        self.new_bottle = SOAP_NEW_BOTTLE_DELTA
+
+    def process(self, w, should_track, now):
+        """Feed one weight reading (g); True if soap use was detected"""
+        if w < self.present:
+            if self.state != "removed":
+                if should_track:
+                    log.info("Soap bottle lifted/removed.")
+                self.state = "removed"
+            self.last_weight = w
+            return False
+
+        if self.state == "removed":
+            if should_track:
+                log.info("Soap bottle placed back. Weight: %.1f g", w)
+
+            if self.baseline is None:
+                self.baseline = w
+                if should_track:
+                    log.info("   Baseline set: %.1f g", w)
+            else:
+                delta = w - self.baseline
+                if delta < -self.use:
+                    if should_track:
+                        log.info("   Soap used: %.1f grams", -delta)
+                        self.baseline = w
+                        if w < self.empty:
+                            log.info("   Bottle nearly empty: %.1f g", w)
+                    else:
+                        log.info("   Soap movement before scan - not counted")
+                        self.baseline = w
+                    self.state = "present"
+                    self.last_weight = w
+                    return should_track
+                elif abs(delta) > self.new_bottle:
+                    if should_track:
+                        log.info("   New bottle detected! Weight: %.1f g", w)
+                    self.baseline = w
+                    self.state = "present"
+                    self.last_weight = w
+                    return False
+                else:
+                    if should_track:
+                        log.info("   No soap use detected (delta: %.1f g)", delta)
+            self.state = "present"
+            self.last_weight = w
+            return False
+
+        if self.state == "present":
+            if self.baseline and self.baseline < self.empty:
+                if should_track and now % EMPTY_REMINDER_MS < 500:
+                    log.info("   Bottle nearly empty: %.1f g", self.baseline)
+            self.last_weight = w
+        return False
@@ -0,0 +1,241 @@
+# sim/weightbench.py - float vs fixed-point weight path, per loop pass
+#
+#   python -m sim.weightbench --before REV              # REV vs this checkout
+#   python -m sim.weightbench --before REV --hours 1
+#
+# REV is a revision that still has the float weight path, e.g. the parent
+# of the commit that switched to integer milligrams ("[user-038] Carry the
+# weight path in integer milligrams" in git log).
+#
+# Runs what a sensor loop pass does with the load cell - read_weight() on 6
+# raw HX711 samples, SoapDetector.process(), ZeroTracker.update() and a
+# re-tare when it asks for one - from hx711.py, calib.py and soap.py of two
+# revisions, on the soapbench scenarios turned back into raw counts.
+#
+# boxed/pass counts the arithmetic results MicroPython would have to put on
+# the heap: on the ESP32 port every float is a heap object and an int only
+# stays a small int below 2**30. There is no MicroPython here to ask, so
+# each expression of those modules is rewritten to pass its value through
+# a counter (the counting run); passes/s comes from a second, uninstrumented
+# run. "same" is the number of passes where both revisions made the same
+# decisions (soap use, detector state and events, re-tare or not).
+
+import argparse, ast, os, random, sys, time, types
+
+from . import firmware_tree
+from .node import REPO
+from .soapbench import SCENARIOS, SAMPLES, scenario
+
+if REPO not in sys.path:
+    sys.path.insert(0, REPO)
+
+import ringlog as log
+
+COUNT_NOISE = 3         # raw counts of HX711 noise per sample
+OFFSET = 8400           # raw counts at an empty scale
+SMALL_INT = 1 << 30
+
+# read_weight() of mainsensor.py, before and after the fixed-point change
+READ_FLOAT = '''
+def read_weight(hx, cal):
+    w = hx.get_units(scale=cal.scale, times=6)
+    if abs(w) < 0.5:
+        w = 0.0
+    return w
+'''
+
+READ_FIXED = '''
+def read_weight(hx, cal):
+    mg = cal.to_mg(hx.read_net(6))
+    if -500 < mg < 500:
+        mg = 0
+    return mg
+'''
+
+
+class Boxes:
+    n = 0
+
+
+def _box(v):
+    t = type(v)
+    if t is float or (t is int and not -SMALL_INT <= v < SMALL_INT):
+        Boxes.n += 1
+    return v
+
+
+class _Count(ast.NodeTransformer):
+    """Pass every arithmetic result and call result through _box()"""
+
+    def _wrap(self, node):
+        self.generic_visit(node)
+        return ast.Call(func=ast.Name(id="_box", ctx=ast.Load()),
+                        args=[node], keywords=[])
+
+    visit_BinOp = visit_UnaryOp = visit_Call = _wrap
+
+    def visit_AugAssign(self, node):
+        # x += y  ->  x = _box(x + y)
+        self.generic_visit(node)
+        if not isinstance(node.target, (ast.Name, ast.Attribute)):
+            return node
+        load = ast.parse(ast.unparse(node.target), mode="eval").body
+        value = ast.Call(func=ast.Name(id="_box", ctx=ast.Load()),
+                         args=[ast.BinOp(left=load, op=node.op, right=node.value)],
+                         keywords=[])
+        return ast.Assign(targets=[node.target], value=value)
+
+
+def _ticks_diff(a, b):
+    return ((a - b + 0x20000000) & 0x3FFFFFFF) - 0x20000000
+
+
+# what the modules use of the MicroPython time module; nothing sleeps here
+_TIME = types.SimpleNamespace(ticks_diff=_ticks_diff, ticks_ms=lambda: 0,
+                              sleep_ms=lambda ms: None, time=lambda: 0)
+
+
+def _load(path, name, count, mods):
+    with open(path) as f:
+        src = f.read()
+    tree = ast.parse(src, path)
+    if count:
+        tree = ast.fix_missing_locations(_Count().visit(tree))
+    m = types.ModuleType(name)
+    m.__file__ = path
+    m._box = _box
+    saved = {k: sys.modules.get(k) for k in mods}
+    sys.modules.update(mods)
+    try:
+        exec(compile(tree, path, "exec"), m.__dict__)
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                sys.modules.pop(k, None)
+            else:
+                sys.modules[k] = v
+    m.time = _TIME
+    return m
+
+
+def firmware(tree, count):
+    """hx711, calib and soap of a firmware tree, plus its read_weight()"""
+    machine = types.ModuleType("machine")
+    machine.Pin = None
+    calib = _load(os.path.join(tree, "calib.py"), "calib", count, {})
+    soap = _load(os.path.join(tree, "soap.py"), "soap", count, {"calib": calib})
+    hx711 = _load(os.path.join(tree, "hx711.py"), "hx711", count,
+                  {"machine": machine})
+    fixed = hasattr(hx711.HX711, "read_net")
+    reader = types.ModuleType("reader")
+    reader._box = _box
+    tree_ = ast.parse(READ_FIXED if fixed else READ_FLOAT)
+    if count:
+        tree_ = ast.fix_missing_locations(_Count().visit(tree_))
+    exec(compile(tree_, "read_weight", "exec"), reader.__dict__)
+
+    class Cell(hx711.HX711):
+        # the driver's arithmetic on canned samples instead of bit-banging
+        def __init__(self, samples):
+            self.offset = 0
+            self.gain = 1
+            self.samples = samples
+            self.i = 0
+
+        def read(self):
+            v = self.samples[self.i]
+            self.i += 1
+            return v
+
+    return types.SimpleNamespace(calib=calib, soap=soap, Cell=Cell, fixed=fixed,
+                                 read_weight=reader.read_weight)
+
+
+def raw_samples(readings, seed):
+    """SAMPLES raw counts per pass whose mean is the reading"""
+    rng = random.Random(seed)
+    scale = 1143.3771
+    out = []
+    for _, g in readings:
+        base = OFFSET + round(g * scale)
+        s = [base + round(rng.gauss(0, COUNT_NOISE)) for _ in range(SAMPLES - 1)]
+        s.append(base * SAMPLES - sum(s))
+        out.extend(s)
+    return out
+
+
+def run(fw, readings, samples):
+    """(decisions per pass, boxed values per pass)"""
+    cal = fw.calib.Calibration(OFFSET)
+    zero = fw.calib.ZeroTracker(cal)
+    det = fw.soap.SoapDetector()
+    hx = fw.Cell(samples)
+    hx.offset = cal.offset
+    decisions = []
+    boxed = []
+    for now, _ in readings:
+        Boxes.n = 0
+        w = fw.read_weight(hx, cal)
+        used = det.process(w, True, now)
+        bottle_off = det.state in ("removed", "no_bottle")
+        shift = zero.update(w, bottle_off, now)
+        if shift:
+            hx.offset = cal.offset
+            det.rezero(shift)
+        boxed.append(Boxes.n)
+        decisions.append((used, det.state, det.events, bool(shift)))
+    return decisions, boxed
+
+
+def speed(fw, readings, samples):
+    t0 = time.perf_counter()
+    run(fw, readings, samples)
+    return len(readings) / (time.perf_counter() - t0)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m sim.weightbench")
+    p.add_argument("--before", metavar="REV", required=True,
+                   help="git revision with the float weight path")
+    p.add_argument("--hours", type=float, default=2.0)
+    p.add_argument("--seed", type=int, default=1)
+    args = p.parse_args(argv)
+    log.set_level(log.ERROR + 10)
+
+    trees = (("before", firmware_tree(args.before)), ("after", REPO))
+    fws = {name: (firmware(t, True), firmware(t, False)) for name, t in trees}
+    for name, t in trees:
+        print("%-6s %s (%s weights)" % (name, args.before if name == "before" else
+                                        "this checkout",
+                                        "int mg" if fws[name][0].fixed else "float g"))
+    print()
+    print("%-9s %6s | %-22s | %-22s | %s" % ("scenario", "passes", "boxed/pass mean max",
+                                            "passes/s before after", "same"))
+    tot_passes = tot_same = 0
+    tot_boxed = {"before": 0, "after": 0}
+    for kind in SCENARIOS:
+        readings, _ = scenario(kind, args.hours, args.seed)
+        samples = raw_samples(readings, args.seed)
+        res = {}
+        for name, _ in trees:
+            counting, plain = fws[name]
+            dec, boxed = run(counting, readings, samples)
+            res[name] = (dec, boxed, speed(plain, readings, samples))
+            tot_boxed[name] += sum(boxed)
+        n = len(readings)
+        same = sum(1 for a, b in zip(res["before"][0], res["after"][0]) if a == b)
+        tot_passes += n
+        tot_same += same
+        bb, ba = res["before"][1], res["after"][1]
+        print("%-9s %6d | %5.1f %3d -> %4.1f %3d | %9.0f %10.0f | %d"
+              % (kind, n, sum(bb) / n, max(bb), sum(ba) / n, max(ba),
+                 res["before"][2], res["after"][2], same))
+    print()
+    print("boxed values per pass: %.2f -> %.2f; same decisions in %d of %d passes"
+          % (tot_boxed["before"] / tot_passes, tot_boxed["after"] / tot_passes,
+             tot_same, tot_passes))
+    return 0 if tot_same == tot_passes else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
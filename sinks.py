@@ -0,0 +1,114 @@
+# sinks.py - the notifier's view of every sensor node it hears from
+#
+# One notifier can serve several sinks (a building with more than one
+# kitchen). Each sensor node's frames update its own row, keyed by the
+# sender's MAC; the LEDs and buzzer follow the worst status and beep mode
+# over all rows. A row is a slot in preallocated arrays, found with one
+# dict lookup per frame, and the worst values come from per-level row
+# counts, so a frame costs the same with 1 sensor or MAX_SINKS. Only the
+# display walks the table, and only when it redraws.
+
+from alert import GREEN, YELLOW, RED, OFF, GRACE, CONSTANT
+
+MAX_SINKS = 64
+
+
+class SinkTable:
+    def __init__(self, labels=None, capacity=MAX_SINKS):
+        self.labels = labels or {}      # MAC -> name shown on the display
+        self.capacity = capacity
+        self.index = {}                 # MAC -> slot
+        self.macs = []
+        self.status = bytearray(capacity)
+        self.beep = bytearray(capacity)
+        self.next_up = []
+        self.last = []
+        self.n_status = [0, 0, 0]       # rows per status
+        self.n_beep = [0, 0, 0]         # rows per beep mode
+        self.frames = 0
+        self.changes = 0                # bumped by anything the display shows
+
+    def __len__(self):
+        return len(self.macs)
+
+    def slot(self, mac):
+        """Row of mac, added on first sight; None when the table is full"""
+        self.frames += 1
+        i = self.index.get(mac)
+        if i is not None:
+            return i
+        i = len(self.macs)
+        if i >= self.capacity:
+            return None
+        mac = bytes(mac)
+        self.index[mac] = i
+        self.macs.append(mac)
+        self.next_up.append("---")
+        self.last.append("---")
+        self.status[i] = GREEN
+        self.beep[i] = OFF
+        self.n_status[GREEN] += 1
+        self.n_beep[OFF] += 1
+        self.changes += 1
+        return i
+
+    def set_status(self, i, status):
+        """True if row i's status changed"""
+        old = self.status[i]
+        if old == status:
+            return False
+        n = self.n_status
+        n[old] -= 1
+        n[status] += 1
+        self.status[i] = status
+        self.changes += 1
+        return True
+
+    def set_beep(self, i, mode):
+        old = self.beep[i]
+        if old == mode:
+            return False
+        n = self.n_beep
+        n[old] -= 1
+        n[mode] += 1
+        self.beep[i] = mode
+        return True
+
+    def set_next_up(self, i, name):
+        if self.next_up[i] == name:
+            return False
+        self.next_up[i] = name
+        self.changes += 1
+        return True
+
+    def set_last(self, i, name):
+        if self.last[i] == name:
+            return False
+        self.last[i] = name
+        self.changes += 1
+        return True
+
+    def worst_status(self):
+        n = self.n_status
+        return RED if n[RED] else (YELLOW if n[YELLOW] else GREEN)
+
+    def worst_beep(self):
+        n = self.n_beep
+        return CONSTANT if n[CONSTANT] else (GRACE if n[GRACE] else OFF)
+
+    def label(self, i):
+        mac = self.macs[i]
+        name = self.labels.get(mac)
+        return name if name else "Sink %02x%02x" % (mac[4], mac[5])
+
+    def attention(self):
+        """Rows that are not GREEN, RED ones first (walks the table)"""
+        red = []
+        yellow = []
+        st = self.status
+        for i in range(len(self.macs)):
+            if st[i] == RED:
+                red.append(i)
+            elif st[i] == YELLOW:
+                yellow.append(i)
+        return red + yellow
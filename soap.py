@@ -0,0 +1,229 @@
+# soap.py - soap bottle tracking on the load cell
+#
+# The bottle sits on the scale. Lifting it (weight under
+# SOAP_PRESENT_THRESHOLD) and putting it back lighter than the baseline
+# counts as soap being used. Only uses that happen while should_track is
+# set (an alert is active and someone has scanned) are reported; other
+# movements just move the baseline.
+#
+# The sensor node runs SoapDetector, which works in integer milligrams
+# (see calib.py) so a reading allocates nothing. The original threshold
+# detector, SoapTracker, lives on in sim/soaptracker.py for comparison.
+
+import math
+import ringlog as log
+from calib import div_round
+
+SOAP_PRESENT_THRESHOLD = 100
+SOAP_USE_THRESHOLD = 3
+SOAP_EMPTY_THRESHOLD = 75
+SOAP_NEW_BOTTLE_DELTA = 300
+EMPTY_REMINDER_MS = 30000
+
+
+# Change-point detector
+EV_LIFT = 1
+EV_RETURN = 2
+EV_CONSUMED = 4
+
+CUSUM_K_MIN = 500       # mg per sample the level may wander unnoticed
+CUSUM_H_MIN = 4000      # mg of accumulated excess that counts as a change
+SIGMA_MIN = 20          # mg, floor of the noise estimate
+SETTLE_N = 3            # readings that must agree before a level is trusted
+SOAP_MAX_USE = 50       # g, a bigger drop is a hand/tip, not a pump of soap
+HOLD_MS = 30000         # accept an odd settled level after this long
+
+
+class SoapDetector:
+    """Streaming CUSUM change-point detector on the per-pass weight
+
+    While the bottle sits still a two-sided CUSUM watches the readings
+    against a reference level that follows slow sensor drift. A change
+    point starts a "moving" phase that lasts until SETTLE_N readings agree;
+    readings taken while the bottle was half set down never become a level.
+    The settled level is compared with the baseline to decide between
+    soap use, a new bottle and nothing. A settled level far below the
+    baseline (bottle tipped or held) is only trusted once it has held for
+    HOLD_MS.
+
+    process() keeps SoapTracker's contract: it returns True only for soap
+    use seen while should_track is set, other movements just move the
+    baseline. Per reading, `events` holds EV_* flags and `confidence`
+    (0..1) the confidence of the strongest of them; `consumed` is the last
+    use. State is a fixed set of numbers, O(1) per reading.
+
+    Weights, levels and thresholds are ints in milligrams; the confidence
+    is the only float and is computed only when an event fires.
+    """
+
+    def __init__(self):
+        self.baseline = None
+        self.state = "no_bottle"
+        self.last_weight = 0
+        self.events = 0
+        self.confidence = 0.0
+        self.consumed = 0
+
+        self.present = SOAP_PRESENT_THRESHOLD * 1000
+        self.use = SOAP_USE_THRESHOLD * 1000
+        self.empty = SOAP_EMPTY_THRESHOLD * 1000
+        self.new_bottle = SOAP_NEW_BOTTLE_DELTA * 1000
+        self.max_use = SOAP_MAX_USE * 1000
+
+        self.sigma = 100        # running noise estimate, mg
+        self.ref = 0            # level the CUSUM compares against
+        self.ref_n = 0
+        self.g_pos = 0
+        self.g_neg = 0
+        self.run_mean = 0       # readings that agree since the last jump
+        self.run_n = 0
+        self.lifted = False
+        self.moved_at = 0
+
+    def _log(self, should_track, fmt, *args):
+        if should_track:
+            log.info(fmt, *args)
+
+    def _jump_confidence(self, jump, h):
+        c = abs(jump) / (2 * h)
+        return c if c < 1.0 else 1.0
+
+    def process(self, w, should_track, now):
+        """Feed one weight reading (mg); True if soap use was detected"""
+        self.last_weight = w
+        self.events = 0
+        sigma = self.sigma
+        k = sigma if sigma > CUSUM_K_MIN else CUSUM_K_MIN
+        h = 8 * sigma if 8 * sigma > CUSUM_H_MIN else CUSUM_H_MIN
+        tol = 4 * sigma if 4 * sigma > 1000 else 1000
+
+        if self.state == "present":
+            d = w - self.ref
+            gp = self.g_pos + d - k
+            gn = self.g_neg - d - k
+            self.g_pos = gp if gp > 0 else 0
+            self.g_neg = gn if gn > 0 else 0
+            if self.g_pos < h and self.g_neg < h:
+                if -tol < d < tol:
+                    # sensor drift: the reference and baseline follow it
+                    step = (d + 16) >> 5
+                    self.ref += step
+                    if self.baseline is not None:
+                        self.baseline += step
+                    if self.ref_n < 32:
+                        self.ref_n += 1
+                    # 1.25 |d| estimates sigma for Gaussian noise
+                    ad = (5 * (d if d > 0 else -d)) >> 2
+                    sigma += (ad - sigma + 16) >> 5
+                    self.sigma = sigma if sigma > SIGMA_MIN else SIGMA_MIN
+                if self.baseline and self.baseline < self.empty:
+                    if should_track and now % EMPTY_REMINDER_MS < 500:
+                        log.info("   Bottle nearly empty: %.1f g",
+                                 self.baseline / 1000)
+                return False
+            # change point
+            self.state = "moving"
+            self.lifted = False
+            self.moved_at = now
+            self.g_pos = self.g_neg = 0
+            self.run_n = 0
+
+        # moving / removed / no_bottle: wait for the readings to agree
+        if self.run_n and -tol <= w - self.run_mean <= tol:
+            self.run_n += 1
+            self.run_mean += div_round(w - self.run_mean, self.run_n)
+        else:
+            self.run_mean = w
+            self.run_n = 1
+            self.moved_at = now
+
+        ref = self.baseline if self.baseline is not None else self.ref
+        if (self.state == "moving" and not self.lifted
+                and (w < self.present or ref - w > self.max_use)):
+            self.lifted = True
+            self.events |= EV_LIFT
+            self.confidence = self._jump_confidence(ref - w, h)
+            self._log(should_track, "Soap bottle lifted/removed.")
+
+        if self.run_n < SETTLE_N:
+            return False
+        level = self.run_mean
+
+        if level < self.present:
+            if self.state == "no_bottle":
+                return False
+            if self.state != "removed":
+                self.state = "removed"
+                self.lifted = True
+            return False
+
+        if self.baseline is None:
+            self._log(should_track, "Soap bottle placed back. Weight: %.1f g",
+                      level / 1000)
+            self._log(should_track, "   Baseline set: %.1f g", level / 1000)
+            self.baseline = level
+            self._settle(level)
+            return False
+
+        delta = level - self.baseline
+        if -self.new_bottle <= delta < -self.max_use:
+            # tipped or still held: give it time before trusting it
+            if time_since(now, self.moved_at) < HOLD_MS:
+                return False
+            log.info("   Weight change not attributed: %.1f g", delta / 1000)
+            self.baseline = level
+            self._settle(level)
+            return False
+
+        was_lifted = self.state == "removed" or self.lifted
+        if was_lifted:
+            self.events |= EV_RETURN
+            self.confidence = self._jump_confidence(level - self.present, h)
+            self._log(should_track, "Soap bottle placed back. Weight: %.1f g",
+                      level / 1000)
+        used = False
+        if delta < -self.use:
+            self.events |= EV_CONSUMED
+            self.consumed = -delta
+            # how many standard errors the drop is past the use threshold
+            n = self.ref_n if self.ref_n > 0 else 1
+            se = self.sigma * math.sqrt(1.0 / n + 1.0 / self.run_n) + 50
+            c = 0.5 + (-delta - self.use) / se / 6
+            self.confidence = c if c < 1.0 else 1.0
+            if should_track:
+                log.info("   Soap used: %.1f grams (confidence %.2f)",
+                         -delta / 1000, self.confidence)
+                if level < self.empty:
+                    log.info("   Bottle nearly empty: %.1f g", level / 1000)
+                used = True
+            else:
+                log.info("   Soap movement before scan - not counted")
+            self.baseline = level
+        elif delta > self.max_use or delta < -self.new_bottle:
+            # heavier by more than a wet bottle: topped up or replaced
+            self._log(should_track, "   New bottle detected! Weight: %.1f g",
+                      level / 1000)
+            self.baseline = level
+        elif was_lifted:
+            self._log(should_track, "   No soap use detected (delta: %.1f g)",
+                      delta / 1000)
+        self._settle(level)
+        return used
+
+    def rezero(self, shift):
+        """The scale was re-tared; readings are now shift mg lower"""
+        if self.baseline is not None:
+            self.baseline -= shift
+        self.ref -= shift
+        self.run_mean -= shift
+
+    def _settle(self, level):
+        self.state = "present"
+        self.ref = level
+        self.ref_n = self.run_n
+        self.g_pos = self.g_neg = 0
+        self.lifted = False
+
+
+def time_since(now, then):
+    return ((now - then + 0x20000000) & 0x3FFFFFFF) - 0x20000000
@@ -0,0 +1,199 @@
+# wifi.py - Wi-Fi station brought up in the background
+#
+# boot.py only calls start(): the radio is switched on and one connect() is
+# issued, then boot carries on so ESP-NOW and the sensors come up straight
+# away. The main loop calls sta.poll(now) every pass; it never waits, it
+# only looks at the link state and decides what to do next. A loop that
+# sleeps between passes (the notifier) asks due_ms(now) how long it may
+# sleep before poll() has work again.
+#
+# An association that survived a soft reset is kept as it is. Otherwise
+# the channel and IP of the last good connection are read from WIFI_FILE:
+# the channel is set before anything else uses the radio, so ESP-NOW is on
+# the AP's channel from the first message. A failed attempt retries with
+# exponential backoff instead of calling connect() every 2 s; a dropped
+# link is picked up the same way.
+#
+# No BSSID is cached: the ESP32 port cannot read back the BSSID of the
+# current AP, and finding it with scan() blocks for ~2 s, longer than the
+# boot and loop budgets allow.
+
+import time
+import network
+import ringlog as log
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+SSID = "Berkeley-IoT"
+PASSWORD = '1YM-)0xR'
+WIFI_FILE = "wifi.json"
+
+POLL_MS = 250               # how often poll() looks at the link
+LINK_CHECK_MS = 60000       # longest due_ms() while the link is up
+CONNECT_TIMEOUT_MS = 15000  # give up on one attempt after this long
+BACKOFF_MIN_MS = 1000
+BACKOFF_MAX_MS = 60000
+
+# states
+S_DOWN = 0          # waiting for the next attempt
+S_CONNECTING = 1
+S_UP = 2
+
+STATE_NAMES = ("DOWN", "CONNECTING", "UP")
+
+
+def load_cache(path=WIFI_FILE):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache, path=WIFI_FILE):
+    try:
+        with open(path, "w") as f:
+            json.dump(cache, f)
+    except OSError as e:
+        log.error("Error saving Wi-Fi cache: %s", e)
+
+
+class WifiManager:
+    def __init__(self, ssid=SSID, password=PASSWORD, path=WIFI_FILE):
+        self.ssid = ssid
+        self.password = password
+        self.path = path
+        self.wlan = network.WLAN(network.STA_IF)
+        self.cache = load_cache(path)
+        if self.cache.get("ssid") != ssid:
+            self.cache = {}
+        self.state = S_DOWN
+        self.ip = None
+        self.attempts = 0       # connect() calls since the link was last up
+        self.backoff_ms = BACKOFF_MIN_MS
+        self.next_ms = 0
+        self.started_ms = 0
+        self.last_poll = 0
+        self.up_ms = None       # ticks_ms() when the link last came up
+        self.on_up = None       # called with the IP each time the link comes up
+
+    def cached_ip(self):
+        """IP of the last good connection (likely the next one), or None"""
+        return self.cache.get("ip")
+
+    def start(self):
+        """Switch the radio on and start connecting; returns immediately"""
+        wlan = self.wlan
+        wlan.active(True)
+        now = time.ticks_ms()
+        self.last_poll = now
+        if wlan.isconnected():
+            log.info("Wi-Fi still associated, reusing it")
+            self._up(now)
+            return self
+        ch = self.cache.get("channel")
+        if ch:
+            try:
+                wlan.config(channel=ch)
+            except (OSError, ValueError):
+                pass
+        self._connect(now)
+        return self
+
+    def _connect(self, now):
+        try:
+            self.wlan.connect(self.ssid, self.password)
+        except OSError as e:
+            log.warn("Wi-Fi connect error: %s", e)
+        self.attempts += 1
+        self.started_ms = now
+        self.state = S_CONNECTING
+
+    def _up(self, now):
+        wlan = self.wlan
+        self.state = S_UP
+        self.ip = wlan.ifconfig()[0]
+        self.up_ms = now
+        log.info("Wi-Fi connected at %s (%d attempt(s))", self.ip, self.attempts)
+        self.attempts = 0
+        self.backoff_ms = BACKOFF_MIN_MS
+
+        cache = {"ssid": self.ssid, "ip": self.ip}
+        try:
+            cache["channel"] = wlan.config("channel")
+        except (OSError, ValueError):
+            pass
+        if cache != self.cache:
+            self.cache = cache
+            save_cache(cache, self.path)
+        if self.on_up:
+            self.on_up(self.ip)
+
+    def _fail(self, now, why):
+        self.wlan.disconnect()
+        self.state = S_DOWN
+        self.next_ms = time.ticks_add(now, self.backoff_ms)
+        log.warn("Wi-Fi %s, retry in %d s", why, self.backoff_ms // 1000)
+        self.backoff_ms = min(self.backoff_ms * 2, BACKOFF_MAX_MS)
+
+    def poll(self, now):
+        """Advance the connection; cheap, call once per loop pass"""
+        if time.ticks_diff(now, self.last_poll) < POLL_MS:
+            return
+        self.last_poll = now
+        state = self.state
+        wlan = self.wlan
+        if state == S_UP:
+            if not wlan.isconnected():
+                self.ip = None
+                log.warn("Wi-Fi link lost")
+                self._connect(now)
+        elif state == S_CONNECTING:
+            if wlan.isconnected():
+                self._up(now)
+                return
+            st = wlan.status()
+            if st == network.STAT_NO_AP_FOUND or st == network.STAT_WRONG_PASSWORD:
+                self._fail(now, "connect failed (status %d)" % st)
+            elif time.ticks_diff(now, self.started_ms) > CONNECT_TIMEOUT_MS:
+                self._fail(now, "connect timed out")
+        elif time.ticks_diff(now, self.next_ms) >= 0:
+            self._connect(now)
+
+    def due_ms(self, now):
+        """ms until poll() has work: the next look at a connect in progress,
+        the next attempt, or (link up) a check at most LINK_CHECK_MS away"""
+        since = time.ticks_diff(now, self.last_poll)
+        if self.state == S_UP:
+            due = LINK_CHECK_MS - since
+        elif self.state == S_CONNECTING:
+            due = POLL_MS - since
+        else:
+            due = max(POLL_MS - since, time.ticks_diff(self.next_ms, now))
+        return max(0, due)
+
+    def is_up(self):
+        return self.state == S_UP
+
+    def as_dict(self):
+        return {
+            "state": STATE_NAMES[self.state],
+            "ip": self.ip,
+            "attempts": self.attempts,
+            "backoff_ms": self.backoff_ms,
+            "channel": self.cache.get("channel"),
+        }
+
+
+sta = None
+
+
+def start(ssid=SSID, password=PASSWORD):
+    """Start the station once per boot; later calls return the same one"""
+    global sta
+    if sta is None:
+        sta = WifiManager(ssid, password).start()
+    return sta